@@ -1,89 +1,3 @@
-from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_sqlalchemy import SQLAlchemy
-from functools import wraps
-from src.models import User, db
-from src.routes.decorators import token_required, admin_required
-import jwt
-import datetime
-import os
-from .extensions import db
-
-auth_bp = Blueprint('auth', __name__)
-
-# Secret key for JWT
-SECRET_KEY = os.environ.get('SECRET_KEY', 'dev_secret_key')
-
-# Token required decorator
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        
-        # Check if token is in headers
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
-        
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-        
-        try:
-            # Decode the token
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            current_user = User.query.filter_by(id=data['user_id']).first()
-            
-            if not current_user:
-                return jsonify({'message': 'User not found!'}), 401
-                
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired!'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Invalid token!'}), 401
-            
-        return f(current_user, *args, **kwargs)
-    
-    return decorated
-
-# Admin required decorator
-def admin_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        
-        # Check if token is in headers
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
-        
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-        
-        try:
-            # Decode the token
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            current_user = User.query.filter_by(id=data['user_id']).first()
-            
-            if not current_user:
-                return jsonify({'message': 'User not found!'}), 401
-            
-            # Check if user is admin
-            if current_user.role != 'admin':
-                return jsonify({'message': 'Admin privileges required!'}), 403
-                
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired!'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Invalid token!'}), 401
-            
-        return f(current_user, *args, **kwargs)
-    
-    return decorated
-
-# Rest of your existing routes...
-
 # Import models
 from .models.user import User
 from .models.product import Product
@@ -0,0 +1,257 @@
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request, make_response
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from urllib.parse import urlencode
+import hashlib
+import json
+import threading
+import time
+from .extensions import db
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# HTTP response cache for the public catalog endpoints.
+#
+# Cached entries are keyed by route + normalized query string and by the
+# current catalog version. Every admin write to products or categories (and
+# every rating change, since it moves Product.rating) bumps the version, which
+# retires all cached responses and ETags at once without having to find them.
+#
+# The version must be the same in every worker, or a write made through one
+# of them would leave the others answering with old entries and 304s. The
+# Redis backend keeps it next to the shared entries; with the per-process LRU
+# backend it lives in the cache_versions table, re-read at most every
+# CATALOG_VERSION_POLL seconds.
+
+VERSION_KEY = 'catalog:version'
+
+cache_versions = db.Table(
+    'cache_versions',
+    db.Column('name', db.String(50), primary_key=True),
+    db.Column('version', db.Integer, nullable=False)
+)
+
+class DatabaseVersions:
+    # Version counters for backends that aren't shared between processes.
+    # Uses its own connection, so callers' transactions are not involved.
+    def __init__(self, poll=1.0):
+        self.poll = poll
+        self._read = {}   # name -> (version, read at)
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._read.get(name)
+        if entry is not None and time.monotonic() - entry[1] < self.poll:
+            return entry[0]
+        with db.engine.connect() as conn:
+            version = conn.execute(select(cache_versions.c.version).where(cache_versions.c.name == name)).scalar() or 0
+        with self._lock:
+            self._read[name] = (version, time.monotonic())
+        return version
+
+    def incr(self, name):
+        for attempt in range(2):
+            try:
+                with db.engine.begin() as conn:
+                    result = conn.execute(
+                        update(cache_versions).where(cache_versions.c.name == name)
+                        .values(version=cache_versions.c.version + 1)
+                    )
+                    if result.rowcount == 0:
+                        conn.execute(insert(cache_versions).values(name=name, version=1))
+                    version = conn.execute(select(cache_versions.c.version).where(cache_versions.c.name == name)).scalar()
+                break
+            except IntegrityError:
+                # Another process inserted the row first; update it instead
+                if attempt:
+                    raise
+        with self._lock:
+            self._read[name] = (version, time.monotonic())
+        return version
+
+    def clear(self):
+        with self._lock:
+            self._read.clear()
+
+class LRUBackend:
+    shared = False
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()   # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ex if ex else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            value, expires_at = self._entries.get(key, (0, None))
+            value = int(value) + 1
+            self._entries[key] = (value, expires_at)
+            return value
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class RedisBackend:
+    # Works with any client exposing redis-py's get/set(ex=)/incr, so a local
+    # fake can stand in for a real server
+    shared = True
+
+    def __init__(self, client, prefix='electro:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def set(self, key, value, ex=None):
+        self.client.set(self.prefix + key, value, ex=ex)
+
+    def incr(self, key):
+        return int(self.client.incr(self.prefix + key))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        pass
+
+class ResponseCache:
+    def __init__(self):
+        self.backend = LRUBackend()
+        self.versions = DatabaseVersions()
+        self.ttl = 300
+        self.max_age = 60
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def init_app(self, app, backend=None):
+        self.ttl = int(app.config.get('CATALOG_CACHE_TTL', 300))
+        self.max_age = int(app.config.get('CATALOG_CACHE_MAX_AGE', 60))
+
+        if backend is None:
+            kind = app.config.get('CACHE_BACKEND', 'memory')
+            if kind == 'redis':
+                if redis is None:
+                    raise RuntimeError('CACHE_BACKEND=redis requires the redis package')
+                backend = RedisBackend(redis.Redis.from_url(app.config['CACHE_REDIS_URL']))
+            else:
+                backend = LRUBackend(int(app.config.get('CACHE_MAX_ENTRIES', 1024)))
+        self.backend = backend
+        if getattr(backend, 'shared', False):
+            self.versions = backend
+        else:
+            self.versions = DatabaseVersions(float(app.config.get('CATALOG_VERSION_POLL', 1.0)))
+
+    def catalog_version(self):
+        return int(self.versions.get(VERSION_KEY) or 0)
+
+    def bump_catalog_version(self):
+        return self.versions.incr(VERSION_KEY)
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'versions': type(self.versions).__name__,
+            'catalog_version': self.catalog_version(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified
+        }
+
+    def _key(self):
+        args = sorted(request.args.items(multi=True))
+        return f'{request.path}?{urlencode(args)}'
+
+    def _store_when_done(self, key, chunks, mimetype):
+        body = []
+        try:
+            for chunk in chunks:
+                body.append(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+                yield chunk
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+        entry = {'body': b''.join(body).decode('utf-8'), 'mimetype': mimetype}
+        self.backend.set(key, json.dumps(entry), ex=self.ttl)
+
+    def cached(self, f):
+        # Caches 200 responses of a public GET view and answers conditional
+        # requests with 304 before the view (or the cache) is touched
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            version = self.catalog_version()
+            key = f'catalog:{version}:{self._key()}'
+            etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+            cache_control = f'public, max-age={self.max_age}'
+
+            # Weak: the tag names the cached content, whatever its encoding
+            if request.if_none_match.contains_weak(etag):
+                self.not_modified += 1
+                response = make_response('', 304)
+                response.set_etag(etag, weak=True)
+                response.headers['Cache-Control'] = cache_control
+                return response
+
+            cached = self.backend.get(key)
+            if cached is not None:
+                self.hits += 1
+                entry = json.loads(cached)
+                response = make_response(entry['body'], 200)
+                response.mimetype = entry['mimetype']
+            else:
+                self.misses += 1
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if response.is_streamed:
+                    # Sent as it is produced; cached once it is complete
+                    response.response = self._store_when_done(key, response.response, response.mimetype)
+                else:
+                    entry = {'body': response.get_data(as_text=True), 'mimetype': response.mimetype}
+                    self.backend.set(key, json.dumps(entry), ex=self.ttl)
+
+            # Lets the compression layer reuse compressed copies of this entry
+            g.compress_cache_key = key
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = cache_control
+            return response
+
+        return decorated
+
+response_cache = ResponseCache()
@@ -0,0 +1,416 @@
+from collections import OrderedDict
+from sqlalchemy import case, delete, func, insert, update
+from sqlalchemy.exc import IntegrityError
+import atexit
+import datetime
+import logging
+import threading
+from .extensions import db
+from .models import CartItem, Product
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Server-side carts, as {(product_id, color): quantity}.
+#
+# The default database backend has no cache: every change is one atomic
+# statement on cart_items, committed at once, so all workers see the same
+# cart and concurrent adds to a line add up.
+#
+# The cached backends keep the live copy of a cart and load it from
+# cart_items on first use. Changes only touch the cache and mark the cart
+# dirty; a background thread writes dirty carts back every
+# CART_FLUSH_INTERVAL seconds (one DELETE + one bulk INSERT per batch), so
+# adding and removing items doesn't write to the database on every click.
+# CART_FLUSH_INTERVAL=0 writes each change through instead. The Redis backend
+# keeps each cart as one hash (field "<product_id>|<color>") shared by all
+# workers. The memory backend is per process, so it refuses to start when
+# WEB_CONCURRENCY says there is more than one worker: their copies would
+# overwrite each other's changes.
+
+logger = logging.getLogger(__name__)
+
+MAX_LINE_QUANTITY = 99
+MAX_LINES = 100
+FLUSH_BATCH = 500
+
+class CartError(ValueError):
+    pass
+
+class CartNotLoaded(Exception):
+    # A cached cart left the cache before a change could be applied to it
+    pass
+
+class DatabaseCartBackend:
+    cached = False
+
+    def get(self, user_id):
+        rows = db.session.query(CartItem.product_id, CartItem.color, CartItem.quantity).filter(
+            CartItem.user_id == user_id
+        )
+        return {(row.product_id, row.color): row.quantity for row in rows}
+
+    def load(self, user_id, lines):
+        return self.get(user_id)
+
+    def update(self, user_id, key, quantity, increment=False):
+        # Set (or add to) one line's quantity; 0 removes it. Another request
+        # inserting the same line first makes the INSERT fail: the change is
+        # retried once as an UPDATE.
+        for attempt in range(2):
+            try:
+                return self._update(user_id, key, quantity, increment)
+            except IntegrityError:
+                db.session.rollback()
+            except Exception:
+                db.session.rollback()
+                raise
+        raise CartError('The cart changed while updating it, please retry')
+
+    def _update(self, user_id, key, quantity, increment):
+        product_id, color = key
+        line = (CartItem.user_id == user_id, CartItem.product_id == product_id, CartItem.color == color)
+        now = datetime.datetime.utcnow()
+        if quantity <= 0 and not increment:
+            db.session.execute(delete(CartItem).where(*line))
+            db.session.commit()
+            return 0
+        if increment:
+            value = case(
+                (CartItem.quantity + quantity > MAX_LINE_QUANTITY, MAX_LINE_QUANTITY),
+                else_=CartItem.quantity + quantity
+            )
+        else:
+            value = min(quantity, MAX_LINE_QUANTITY)
+        result = db.session.execute(
+            update(CartItem).where(*line).values(quantity=value, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            lines = db.session.query(func.count()).select_from(CartItem).filter(CartItem.user_id == user_id).scalar()
+            if lines >= MAX_LINES:
+                raise CartError(f'A cart holds at most {MAX_LINES} items')
+            db.session.execute(insert(CartItem).values(
+                user_id=user_id, product_id=product_id, color=color,
+                quantity=min(quantity, MAX_LINE_QUANTITY), updated_at=now
+            ))
+        db.session.commit()
+
+    def clear(self, user_id):
+        db.session.execute(delete(CartItem).where(CartItem.user_id == user_id))
+        db.session.commit()
+
+    def mark_dirty(self, user_ids):
+        pass
+
+    def pop_dirty(self, user_ids=None):
+        return []
+
+class MemoryCartBackend:
+    cached = True
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._carts = OrderedDict()   # user_id -> {(product_id, color): quantity}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            lines = self._carts.get(user_id)
+            if lines is None:
+                return None
+            self._carts.move_to_end(user_id)
+            return dict(lines)
+
+    def load(self, user_id, lines):
+        # Cache a cart read from the database, unless a newer copy got there first
+        with self._lock:
+            cached = self._carts.setdefault(user_id, dict(lines))
+            self._carts.move_to_end(user_id)
+            self._evict(keep=user_id)
+            return dict(cached)
+
+    def update(self, user_id, key, quantity, increment=False):
+        # Set (or add to) one line's quantity; 0 removes it
+        with self._lock:
+            lines = self._carts.get(user_id)
+            if lines is None:
+                raise CartNotLoaded(user_id)
+            if increment:
+                quantity += lines.get(key, 0)
+            quantity = min(quantity, MAX_LINE_QUANTITY)
+            if quantity <= 0:
+                lines.pop(key, None)
+            else:
+                if key not in lines and len(lines) >= MAX_LINES:
+                    raise CartError(f'A cart holds at most {MAX_LINES} items')
+                lines[key] = quantity
+            self._dirty.add(user_id)
+            return quantity
+
+    def clear(self, user_id):
+        with self._lock:
+            self._carts[user_id] = {}
+            self._carts.move_to_end(user_id)
+            self._dirty.add(user_id)
+
+    def mark_dirty(self, user_ids):
+        with self._lock:
+            self._dirty.update(user_ids)
+
+    def pop_dirty(self, user_ids=None):
+        with self._lock:
+            if user_ids is None:
+                popped, self._dirty = self._dirty, set()
+                return list(popped)
+            popped = [user_id for user_id in user_ids if user_id in self._dirty]
+            self._dirty.difference_update(popped)
+            return popped
+
+    def _evict(self, keep):
+        # Only carts already written back can be dropped
+        for user_id in list(self._carts):
+            if len(self._carts) <= self.maxsize:
+                break
+            if user_id != keep and user_id not in self._dirty:
+                del self._carts[user_id]
+
+class RedisCartBackend:
+    cached = True
+    LOADED = '_'   # sentinel field, so an empty cart is told apart from an unloaded one
+
+    def __init__(self, client, prefix='electro:cart:', ttl=7 * 24 * 3600):
+        self.client = client
+        self.prefix = prefix
+        self.dirty_key = prefix + 'dirty'
+        self.ttl = ttl
+
+    def _key(self, user_id):
+        return self.prefix + user_id
+
+    @staticmethod
+    def _decode(value):
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def get(self, user_id):
+        fields = self.client.hgetall(self._key(user_id))
+        if not fields:
+            return None
+        lines = {}
+        for field, quantity in fields.items():
+            field = self._decode(field)
+            if field != self.LOADED:
+                product_id, _, color = field.partition('|')
+                lines[(product_id, color)] = int(quantity)
+        return lines
+
+    def load(self, user_id, lines):
+        key = self._key(user_id)
+        if self.client.hsetnx(key, self.LOADED, 1):
+            if lines:
+                self.client.hset(key, mapping={f'{product_id}|{color}': quantity for (product_id, color), quantity in lines.items()})
+            self.client.expire(key, self.ttl)
+        return self.get(user_id) or {}
+
+    def update(self, user_id, key, quantity, increment=False):
+        cart_key = self._key(user_id)
+        field = f'{key[0]}|{key[1]}'
+        if increment:
+            quantity = int(self.client.hincrby(cart_key, field, quantity))
+        if quantity <= 0:
+            self.client.hdel(cart_key, field)
+        else:
+            if not increment:
+                self.client.hset(cart_key, field, min(quantity, MAX_LINE_QUANTITY))
+            elif quantity > MAX_LINE_QUANTITY:
+                self.client.hset(cart_key, field, MAX_LINE_QUANTITY)
+            if self.client.hlen(cart_key) > MAX_LINES + 1:
+                self.client.hdel(cart_key, field)
+                raise CartError(f'A cart holds at most {MAX_LINES} items')
+        self.client.expire(cart_key, self.ttl)
+        if not self.client.hexists(cart_key, self.LOADED):
+            # The hash expired before the write, which started a new one
+            # holding just this line; flushing it would drop the others
+            self.client.delete(cart_key)
+            raise CartNotLoaded(user_id)
+        self.client.sadd(self.dirty_key, user_id)
+        return max(0, min(quantity, MAX_LINE_QUANTITY))
+
+    def clear(self, user_id):
+        key = self._key(user_id)
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, self.LOADED, 1)
+        pipe.expire(key, self.ttl)
+        pipe.sadd(self.dirty_key, user_id)
+        pipe.execute()
+
+    def mark_dirty(self, user_ids):
+        if user_ids:
+            self.client.sadd(self.dirty_key, *user_ids)
+
+    def pop_dirty(self, user_ids=None):
+        if user_ids is None:
+            return [self._decode(user_id) for user_id in self.client.spop(self.dirty_key, FLUSH_BATCH * 10) or []]
+        return [user_id for user_id in user_ids if self.client.srem(self.dirty_key, user_id)]
+
+class CartStore:
+    def __init__(self):
+        self.backend = DatabaseCartBackend()
+        self.flush_interval = 0
+        self.flushed = 0
+        self.flush_errors = 0
+        self._app = None
+        self._flusher = None
+        self._stop = threading.Event()
+
+    def init_app(self, app, backend=None):
+        self.flush_interval = float(app.config.get('CART_FLUSH_INTERVAL', 2))
+        if backend is None:
+            kind = app.config.get('CART_BACKEND', 'database')
+            if kind == 'redis':
+                if redis is None:
+                    raise RuntimeError('CART_BACKEND=redis requires the redis package')
+                backend = RedisCartBackend(redis.Redis.from_url(app.config['CART_REDIS_URL']))
+            elif kind == 'memory':
+                if int(app.config.get('WEB_CONCURRENCY', 1)) > 1:
+                    raise RuntimeError(
+                        'CART_BACKEND=memory keeps carts per process; use database or redis with several workers'
+                    )
+                backend = MemoryCartBackend(int(app.config.get('CART_MAX_CACHED', 10000)))
+            else:
+                backend = DatabaseCartBackend()
+        self.backend = backend
+        self._app = app
+        if not backend.cached:
+            self.flush_interval = 0
+
+        if self.flush_interval > 0 and self._flusher is None:
+            self._flusher = threading.Thread(target=self._run, name='cart-flusher', daemon=True)
+            self._flusher.start()
+            atexit.register(self.shutdown)
+
+    def _run(self):
+        with self._app.app_context():
+            while not self._stop.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception('Cart flush failed')
+                finally:
+                    db.session.remove()
+
+    def shutdown(self):
+        # Write back whatever is still dirty when the process exits
+        self._stop.set()
+        with self._app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Cart flush failed')
+
+    def lines(self, user_id):
+        lines = self.backend.get(user_id)
+        if lines is None:
+            rows = db.session.query(CartItem.product_id, CartItem.color, CartItem.quantity).filter(
+                CartItem.user_id == user_id
+            )
+            lines = self.backend.load(user_id, {(row.product_id, row.color): row.quantity for row in rows})
+        return lines
+
+    def _apply(self, user_id, key, quantity, increment=False):
+        # One line change to a cart already loaded with lines(). A cached
+        # cart can leave the cache before the change lands; it is loaded from
+        # cart_items again and the change applied once more.
+        try:
+            self.backend.update(user_id, key, quantity, increment=increment)
+        except CartNotLoaded:
+            self.lines(user_id)
+            self.backend.update(user_id, key, quantity, increment=increment)
+
+    def _update(self, user_id, product_id, color, quantity, increment=False):
+        self.lines(user_id)
+        self._apply(user_id, (product_id, color or ''), quantity, increment=increment)
+        self._written(user_id)
+
+    def _written(self, user_id):
+        if self.flush_interval <= 0:
+            self.flush([user_id])
+
+    def add(self, user_id, product_id, color, quantity):
+        self._update(user_id, product_id, color, quantity, increment=True)
+
+    def set_quantity(self, user_id, product_id, color, quantity):
+        self._update(user_id, product_id, color, quantity)
+
+    def remove(self, user_id, product_id, color):
+        self._update(user_id, product_id, color, 0)
+
+    def clear(self, user_id):
+        self.backend.clear(user_id)
+        self._written(user_id)
+
+    def merge(self, user_id, items):
+        # Fold a guest cart into the user's cart, adding up repeated lines
+        self.lines(user_id)
+        try:
+            for product_id, color, quantity in items:
+                self._apply(user_id, (product_id, color or ''), quantity, increment=True)
+        finally:
+            self._written(user_id)
+
+    def flush(self, user_ids=None):
+        # Write dirty carts (all, or the given users) back to cart_items.
+        # Returns the number of carts written.
+        user_ids = self.backend.pop_dirty(user_ids)
+        written = 0
+        for start in range(0, len(user_ids), FLUSH_BATCH):
+            written += self._write(user_ids[start:start + FLUSH_BATCH])
+        return written
+
+    def _write(self, user_ids):
+        carts = {}
+        for user_id in user_ids:
+            lines = self.backend.get(user_id)
+            if lines is not None:
+                carts[user_id] = lines
+        if not carts:
+            return 0
+
+        # Lines for products deleted since they were added are dropped here
+        product_ids = {product_id for lines in carts.values() for product_id, _ in lines}
+        known = {
+            product_id for (product_id,) in db.session.query(Product.id).filter(Product.id.in_(list(product_ids)))
+        } if product_ids else set()
+        now = datetime.datetime.utcnow()
+        rows = [
+            {'user_id': user_id, 'product_id': product_id, 'color': color, 'quantity': quantity, 'updated_at': now}
+            for user_id, lines in carts.items()
+            for (product_id, color), quantity in lines.items()
+            if product_id in known
+        ]
+        try:
+            db.session.execute(delete(CartItem).where(CartItem.user_id.in_(list(carts))))
+            if rows:
+                db.session.execute(insert(CartItem), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.backend.mark_dirty(list(carts))
+            self.flush_errors += 1
+            raise
+        self.flushed += len(carts)
+        return len(carts)
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'flush_interval': self.flush_interval,
+            'flushed': self.flushed,
+            'flush_errors': self.flush_errors
+        }
+
+cart_store = CartStore()
@@ -0,0 +1,123 @@
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.orm import undefer
+import json
+from .extensions import db
+from .models import Product
+
+# Denormalized product documents.
+#
+# Admin writes and imports store each product's serialized to_dict() in
+# products.document. With PRODUCT_DOCUMENTS enabled, product pages and
+# listings send the stored JSON as-is: one row per product, no child-table
+# queries and no per-request dict building. Columns that change outside admin
+# writes (rating aggregates on every review) are left out of the document and
+# spliced in from the same row when it is read. Stock is left out altogether,
+# like everywhere in the cached catalog (see Product.STOCK_FIELDS).
+#
+# Products written before documents existed (or by hand) have none and are
+# served the normal way; `flask products check-documents --repair` compares
+# every document with the normalized tables and rewrites missing or stale ones.
+
+LIVE_FIELDS = ('rating', 'rating_count', 'updated_at')
+LIVE_COLUMNS = tuple(getattr(Product, field) for field in LIVE_FIELDS)
+
+def enabled():
+    return bool(current_app.config.get('PRODUCT_DOCUMENTS'))
+
+def render_document(product):
+    data = product.to_dict(stock=False)
+    for field in LIVE_FIELDS:
+        data.pop(field, None)
+    return json.dumps(data, separators=(',', ':'), sort_keys=True)
+
+def store_document(product):
+    # Call after the product's fields and children are set, before committing.
+    # The product is reloaded so the document holds what the database stores
+    # (a float price, not the int the request sent) and children replaced
+    # with bulk deletes aren't served from the session.
+    db.session.flush()
+    db.session.expire(product)
+    product.document = render_document(product)
+
+def store_documents(products):
+    # Store documents for a batch of fully loaded products in one executemany
+    if products:
+        db.session.execute(
+            update(Product),
+            [{'id': product.id, 'document': render_document(product)} for product in products]
+        )
+
+def document_query():
+    # The columns a document read needs, plus the listing sort keys
+    return db.session.query(
+        Product.id, Product.document, Product.price, Product.discount_price,
+        Product.is_featured, Product.created_at, *LIVE_COLUMNS
+    )
+
+def document_response(key, documents, **extra):
+    # A JSON response around already serialized documents: {key: document},
+    # or {key: [documents...]} for a list, plus any extra values
+    if isinstance(documents, list):
+        documents = '[' + ','.join(documents) + ']'
+    body = '{' + json.dumps(key) + ':' + documents
+    for name, value in extra.items():
+        body += ',' + json.dumps(name) + ':' + json.dumps(value)
+    return current_app.response_class(body + '}', mimetype='application/json')
+
+def document_json(row):
+    # The stored document plus the live columns of the same row, as JSON text
+    live = {
+        'rating': row.rating,
+        'rating_count': row.rating_count,
+        'updated_at': row.updated_at.isoformat() if row.updated_at else None
+    }
+    return row.document[:-1] + ',' + json.dumps(live, separators=(',', ':'))[1:]
+
+def documents_json(rows):
+    # JSON text per row; rows without a document are rendered from the
+    # normalized tables in one batch
+    missing = [row.id for row in rows if not row.document]
+    rendered = {}
+    if missing:
+        rendered = {
+            product.id: json.dumps(product.to_dict(stock=False), separators=(',', ':'))
+            for product in Product.catalog_query().filter(Product.id.in_(missing))
+        }
+    return [document_json(row) if row.document else rendered[row.id] for row in rows]
+
+def iter_documents_json(rows, batch_size=500):
+    # documents_json() over a lazily fetched result, one batch at a time
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield from documents_json(batch)
+            batch = []
+    yield from documents_json(batch)
+
+def check_documents(batch_size=500, repair=False):
+    # Compare every stored document with a fresh rendering. Returns counts and
+    # the ids of missing and stale documents (rewritten when repair is set).
+    result = {'checked': 0, 'missing': [], 'stale': []}
+    last_id = None
+    while True:
+        query = Product.catalog_query().options(undefer(Product.document)).order_by(Product.id)
+        if last_id is not None:
+            query = query.filter(Product.id > last_id)
+        products = query.limit(batch_size).all()
+        if not products:
+            break
+        for product in products:
+            expected = render_document(product)
+            if product.document != expected:
+                result['missing' if not product.document else 'stale'].append(product.id)
+                if repair:
+                    product.document = expected
+        result['checked'] += len(products)
+        last_id = products[-1].id
+        if repair:
+            db.session.commit()
+        else:
+            db.session.rollback()
+    return result
@@ -0,0 +1,210 @@
+from flask.cli import AppGroup
+import click
+
+# Maintenance commands, registered on the app in main.py:
+#   flask ratings backfill
+#   flask analytics rebuild
+#   flask products import FILE / flask products export FILE
+#   flask schema upgrade / flask schema status
+#   flask inventory sweep [--every SECONDS]
+#   flask payments work / flask payments requeue / flask payments stub
+#   flask static compress
+
+ratings_cli = AppGroup('ratings', help='Product rating maintenance.')
+
+@ratings_cli.command('backfill')
+def backfill_ratings():
+    """Recompute stored rating aggregates from the ratings table."""
+    from src.models.rating import recompute_rating_aggregates
+    from src.cache import response_cache
+
+    count = recompute_rating_aggregates()
+    response_cache.bump_catalog_version()
+    click.echo(f'Recomputed rating aggregates for {count} rated products.')
+
+analytics_cli = AppGroup('analytics', help='Admin analytics maintenance.')
+
+@analytics_cli.command('rebuild')
+def rebuild_analytics():
+    """Recompute the daily order rollup from the orders table."""
+    from src.models import OrderDailyStat
+
+    count = OrderDailyStat.rebuild()
+    click.echo(f'Rebuilt {count} daily order rollup rows.')
+
+products_cli = AppGroup('products', help='Bulk product import and export, stored product documents.')
+
+@products_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default=None,
+              help='Input format; guessed from the file extension by default.')
+@click.option('--batch-size', default=500, show_default=True)
+def import_products_command(path, fmt, batch_size):
+    """Create or update products from an NDJSON or CSV feed."""
+    from src.product_io import read_csv, read_ndjson, import_products
+    from src.cache import response_cache
+
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    with open(path, encoding='utf-8', newline='') as stream:
+        records = read_csv(stream) if fmt == 'csv' else read_ndjson(stream)
+        result = import_products(records, batch_size=batch_size)
+    response_cache.bump_catalog_version()
+
+    click.echo(f"Created {result['created']}, updated {result['updated']}, failed {result['failed']}.")
+    for error in result['errors']:
+        click.echo(f"  line {error['line']}: {error['error']}", err=True)
+
+@products_cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='ndjson', show_default=True)
+def export_products_command(path, fmt):
+    """Write the whole catalog to PATH ('-' for stdout)."""
+    from src.product_io import export_rows, EXPORT_COLUMNS
+    from src.streaming import export_lines
+
+    with click.open_file(path, 'w', encoding='utf-8') as output:
+        for chunk in export_lines(export_rows(fmt), fmt, EXPORT_COLUMNS):
+            output.write(chunk)
+
+@products_cli.command('check-documents')
+@click.option('--repair', is_flag=True, help='Rewrite missing and stale documents.')
+@click.option('--batch-size', default=500, show_default=True)
+def check_documents_command(repair, batch_size):
+    """Compare the stored product documents with the normalized tables."""
+    from src.catalog_documents import check_documents
+    from src.cache import response_cache
+
+    result = check_documents(batch_size=batch_size, repair=repair)
+    click.echo(f"Checked {result['checked']} products: {len(result['missing'])} missing, "
+               f"{len(result['stale'])} stale documents.")
+    for product_id in result['stale'][:20]:
+        click.echo(f'  stale: {product_id}')
+    if repair and (result['missing'] or result['stale']):
+        response_cache.bump_catalog_version()
+        click.echo('Repaired.')
+
+schema_cli = AppGroup('schema', help='Database schema migrations.')
+
+@schema_cli.command('upgrade')
+def upgrade_schema():
+    """Apply pending schema migrations."""
+    from src.migrations import upgrade
+
+    applied = upgrade()
+    click.echo(f"Applied migrations: {', '.join(map(str, applied))}." if applied else 'Schema is up to date.')
+
+@schema_cli.command('status')
+def schema_status():
+    """List migrations and when they were applied."""
+    from src.migrations import status, drift
+    from src.extensions import db
+
+    for version, description, applied_at in status():
+        state = applied_at.isoformat(sep=' ', timespec='seconds') if applied_at else 'pending'
+        click.echo(f'{version:>4}  {state:<19}  {description}')
+    with db.engine.connect() as conn:
+        missing = drift(conn)
+    if missing:
+        click.echo(f"Missing from the database: {', '.join(missing)}")
+
+inventory_cli = AppGroup('inventory', help='Stock reservation maintenance.')
+
+@inventory_cli.command('sweep')
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--every', type=float, default=None,
+              help='Keep running and sweep every N seconds.')
+def sweep_reservations(batch_size, every):
+    """Release expired checkout reservations back to stock."""
+    from src.models import InventoryReservation
+    from src.routes.inventory import invalidate_availability
+    import time
+
+    while True:
+        released, product_ids = InventoryReservation.sweep(batch_size=batch_size)
+        invalidate_availability(product_ids)
+        if released or every is None:
+            click.echo(f'Released {released} expired reservations.')
+        if every is None:
+            break
+        time.sleep(every)
+
+payments_cli = AppGroup('payments', help='Stripe webhook inbox processing.')
+
+@payments_cli.command('work')
+@click.option('--workers', default=4, show_default=True)
+@click.option('--batch-size', default=100, show_default=True)
+@click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to wait when the inbox is empty.')
+@click.option('--once', is_flag=True, help='Process the due events once and exit.')
+def work_payments(workers, batch_size, poll_interval, once):
+    """Process stored Stripe webhook events."""
+    from flask import current_app
+    from src.webhooks import drain, run_workers
+
+    if once:
+        processed, failed = drain(batch_size)
+        click.echo(f'Processed {processed} events, {failed} failed.')
+        return
+    run_workers(current_app._get_current_object(), workers=workers, batch_size=batch_size, poll_interval=poll_interval)
+
+@payments_cli.command('requeue')
+@click.argument('event_ids', nargs=-1)
+def requeue_payments(event_ids):
+    """Send dead-lettered events (all, or EVENT_IDS) back to the queue."""
+    from src.webhooks import requeue
+
+    count = requeue(list(event_ids) or None)
+    click.echo(f'Requeued {count} events.')
+
+@payments_cli.command('stub')
+@click.option('--count', default=1000, show_default=True)
+@click.option('--url', default=None, help='Webhook URL of a running server; posts in-process by default.')
+@click.option('--duplicates', default=0.0, show_default=True, help='Fraction of events delivered twice.')
+def stub_payments(count, url, duplicates):
+    """Emit signed payment_intent.succeeded events for load tests."""
+    from flask import current_app
+    from src.models import Product, User
+    from src.models.inventory import unit_price
+    from src.routes.payment import endpoint_secret
+    from src.webhooks import sign, stub_payment_event
+    import json
+    import random
+    import time
+
+    user = User.query.first()
+    product = Product.query.filter(Product.stock_quantity.is_(None)).first()
+    if user is None or product is None:
+        raise click.ClickException('Needs at least one user and one product without tracked stock.')
+
+    if url:
+        import requests
+        session = requests.Session()
+        post = lambda body, headers: session.post(url, data=body, headers=headers, timeout=10).status_code
+    else:
+        client = current_app.test_client()
+        post = lambda body, headers: client.post('/api/payment/webhook', data=body, headers=headers).status_code
+
+    # Priced the way create_payment_intent prices it, so the events pass the
+    # webhook's amount check
+    price = unit_price(product)
+    items = [{'product_id': product.id, 'quantity': 1, 'price': price}]
+    statuses = {}
+    started = time.perf_counter()
+    for _ in range(count):
+        body = json.dumps(stub_payment_event(user.id, items, amount=price))
+        deliveries = 2 if random.random() < duplicates else 1
+        for _ in range(deliveries):
+            status = post(body, {'Content-Type': 'application/json', 'Stripe-Signature': sign(body, endpoint_secret)})
+            statuses[status] = statuses.get(status, 0) + 1
+    elapsed = time.perf_counter() - started
+    click.echo(f'Sent {sum(statuses.values())} deliveries in {elapsed:.1f}s '
+               f'({sum(statuses.values()) / elapsed * 60:.0f}/min): {statuses}')
+
+static_cli = AppGroup('static', help='Built storefront assets.')
+
+@static_cli.command('compress')
+def compress_static():
+    """Write .gz (and .br) variants of the built assets for precompressed serving."""
+    from src.static_assets import static_assets
+
+    written = static_assets.compress()
+    click.echo(f'Wrote {written} precompressed files under {static_assets.root}.')
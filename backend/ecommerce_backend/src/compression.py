@@ -0,0 +1,142 @@
+from collections import OrderedDict
+from flask import g, request
+import gzip
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response compression.
+#
+# An after_request hook compresses text responses (JSON, NDJSON, CSV, HTML,
+# ...) with the best encoding the client accepts: brotli when the brotli
+# package is installed, otherwise gzip. Bodies under COMPRESS_MIN_SIZE are
+# sent as they are. Streamed responses are compressed chunk by chunk and
+# flushed as they go, so they keep streaming.
+#
+# Responses of the catalog response cache are compressed once per cache entry
+# and encoding: the compressed bytes are kept in a small in-process LRU keyed
+# by the versioned cache key (see ResponseCache.cached), so a catalog write
+# retires them along with the entries.
+
+COMPRESSIBLE = {
+    'application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml',
+    'text/csv', 'text/css', 'text/html', 'text/javascript', 'text/plain'
+}
+
+class Compressor:
+    def __init__(self):
+        self.min_size = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 5
+        self.cache_max_bytes = 32 * 1024 * 1024
+        self._cache = OrderedDict()   # (cache key, encoding) -> compressed bytes
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.compressed = 0
+        self.streamed = 0
+        self.cache_hits = 0
+
+    def init_app(self, app):
+        self.min_size = int(app.config.get('COMPRESS_MIN_SIZE', 1024))
+        self.gzip_level = int(app.config.get('COMPRESS_GZIP_LEVEL', 6))
+        self.brotli_quality = int(app.config.get('COMPRESS_BROTLI_QUALITY', 5))
+        self.cache_max_bytes = int(app.config.get('COMPRESS_CACHE_BYTES', 32 * 1024 * 1024))
+        app.after_request(self.after_request)
+
+    def encodings(self):
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def compress_cached(self, key, data, encoding):
+        with self._lock:
+            compressed = self._cache.get((key, encoding))
+            if compressed is not None:
+                self._cache.move_to_end((key, encoding))
+                self.cache_hits += 1
+                return compressed
+
+        compressed = self.compress(data, encoding)
+        if len(compressed) <= self.cache_max_bytes:
+            with self._lock:
+                if (key, encoding) not in self._cache:
+                    self._cache[(key, encoding)] = compressed
+                    self._cache_bytes += len(compressed)
+                while self._cache_bytes > self.cache_max_bytes:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_bytes -= len(evicted)
+        return compressed
+
+    def compress_stream(self, chunks, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)   # 31: gzip container
+            compress = compressor.compress
+            flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+            finish = compressor.flush
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                data = compress(chunk) + flush()
+                if data:
+                    yield data
+            yield finish()
+        finally:
+            # Closing the original iterable tears down stream_with_context
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    def after_request(self, response):
+        if (
+            response.status_code != 200
+            or request.method == 'HEAD'
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE
+        ):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings())
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self.compress_stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+            self.streamed += 1
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            key = g.get('compress_cache_key')
+            response.set_data(self.compress_cached(key, data, encoding) if key else self.compress(data, encoding))
+            self.compressed += 1
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def stats(self):
+        with self._lock:
+            cached, cached_bytes = len(self._cache), self._cache_bytes
+        return {
+            'encodings': list(self.encodings()),
+            'min_size': self.min_size,
+            'compressed': self.compressed,
+            'streamed': self.streamed,
+            'cache_hits': self.cache_hits,
+            'cached_entries': cached,
+            'cached_bytes': cached_bytes
+        }
+
+compressor = Compressor()
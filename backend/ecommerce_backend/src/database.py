@@ -0,0 +1,126 @@
+from flask import g, has_app_context, make_response
+from flask_sqlalchemy.session import Session
+from functools import wraps
+from sqlalchemy import event
+from urllib.parse import quote_plus
+
+# Database engine configuration, read from the environment:
+#
+#   DATABASE_URL            full SQLAlchemy URL; otherwise built from
+#   DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME (MySQL via PyMySQL);
+#                           otherwise the local SQLite file test.db
+#   DATABASE_REPLICA_URL    optional read replica for routes marked @read_replica
+#   DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+#   SQLITE_BUSY_TIMEOUT     milliseconds a SQLite writer waits for the lock
+#
+# SQLite connections are switched to WAL with synchronous=NORMAL so readers
+# don't block the writer, and wait busy_timeout ms instead of failing with
+# "database is locked" when several workers write at once.
+
+DEFAULT_DATABASE_URL = 'sqlite:///test.db'
+REPLICA_BIND = 'replica'
+
+def env_bool(environ, name, default):
+    value = environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def database_url(environ):
+    if environ.get('DATABASE_URL'):
+        return environ['DATABASE_URL']
+    if environ.get('DB_HOST'):
+        user = quote_plus(environ.get('DB_USER', 'root'))
+        password = quote_plus(environ.get('DB_PASSWORD', ''))
+        credentials = f'{user}:{password}' if password else user
+        host = environ['DB_HOST']
+        port = environ.get('DB_PORT', '3306')
+        name = environ.get('DB_NAME', 'ecommerce')
+        return f'mysql+pymysql://{credentials}@{host}:{port}/{name}?charset=utf8mb4'
+    return DEFAULT_DATABASE_URL
+
+def engine_options(url, environ):
+    if url.startswith('sqlite'):
+        # One file, one writer: a connection pool only adds contention, so
+        # keep SQLAlchemy's defaults and rely on the pragmas below
+        return {}
+    return {
+        'pool_size': int(environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(environ.get('DB_POOL_TIMEOUT', 30)),
+        # Below MySQL's default wait_timeout so idle connections are never
+        # handed out after the server has closed them
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 280)),
+        'pool_pre_ping': env_bool(environ, 'DB_POOL_PRE_PING', True)
+    }
+
+def database_config(environ):
+    # Flask config for db.init_app(): app.config.update(database_config(os.environ))
+    url = database_url(environ)
+    config = {
+        'SQLALCHEMY_DATABASE_URI': url,
+        'SQLALCHEMY_ENGINE_OPTIONS': engine_options(url, environ),
+        'SQLITE_BUSY_TIMEOUT': int(environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+    }
+    replica_url = environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND: dict(engine_options(replica_url, environ), url=replica_url)
+        }
+    return config
+
+def init_app(app, db):
+    # Call after db.init_app(app), which creates the engines
+    busy_timeout = int(app.config.get('SQLITE_BUSY_TIMEOUT', 5000))
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', sqlite_pragmas(busy_timeout))
+
+def sqlite_pragmas(busy_timeout):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        cursor.close()
+    return on_connect
+
+class RoutingSession(Session):
+    # Sends plain SELECTs issued inside a @read_replica view to the replica
+    # engine. Flushes, DML and raw SQL always go to the primary, and without a
+    # configured replica everything does.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and getattr(clause, 'is_select', False)
+            and has_app_context()
+            and g.get('read_replica')
+        ):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def read_replica(f):
+    # Marks a read-only view whose queries may be served by the replica
+    # (which can lag the primary by the replication delay). A streamed
+    # response keeps querying while it is sent (stream_with_context), so the
+    # replica stays selected until the response is closed.
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g.read_replica = True
+        request_g = g._get_current_object()
+        streamed = False
+        try:
+            response = make_response(f(*args, **kwargs))
+            if response.is_streamed:
+                response.call_on_close(lambda: setattr(request_g, 'read_replica', False))
+                streamed = True
+            return response
+        finally:
+            if not streamed:
+                g.read_replica = False
+    return decorated
@@ -0,0 +1,198 @@
+from collections import deque
+from flask import g, has_request_context, request
+from sqlalchemy import event
+import threading
+import time
+from .metrics import Histogram, DEFAULT_BUCKETS
+
+# Per-route request instrumentation.
+#
+# Every request is timed and attributed to its route template (e.g.
+# /api/products/<product_id>), so the label set stays small. For each
+# (method, blueprint, route) we keep histograms of latency, SQL statements
+# per request, time spent in SQL and response bytes (after compression),
+# plus counts by status. SQL is measured with engine cursor events; only
+# statements run while a request is being handled are counted.
+#
+# Streamed responses are finished when their last chunk is sent, so their
+# latency and size include the streaming.
+#
+# Requests slower than SLOW_REQUEST_SECONDS are logged with their statement
+# list and the last SLOW_REQUEST_LOG_SIZE of them are kept for the admin API.
+# metrics_text() renders everything in the Prometheus text format.
+
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Statements kept per request for the slow-request log
+MAX_STATEMENTS = 200
+MAX_STATEMENT_LENGTH = 500
+
+class RouteStats:
+    def __init__(self):
+        self.latency = Histogram(DEFAULT_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.sql_time = Histogram(DEFAULT_BUCKETS)
+        self.response_bytes = Histogram(BYTES_BUCKETS)
+        self.statuses = {}
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.statements = []   # (statement, seconds)
+
+    def record_statement(self, statement, seconds):
+        self.sql_count += 1
+        self.sql_time += seconds
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append((statement[:MAX_STATEMENT_LENGTH], seconds))
+
+class Instrumentation:
+    def __init__(self):
+        self.enabled = True
+        self.slow_seconds = 1.0
+        self.routes = {}   # (method, blueprint, route) -> RouteStats
+        self.slow_requests = deque(maxlen=50)
+        self._lock = threading.Lock()
+        self._app = None
+
+    def init_app(self, app, db):
+        # Call after db.init_app(app). Register before other after_request
+        # hooks (e.g. compression): hooks run in reverse order, so this one
+        # sees the final response.
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.slow_seconds = float(app.config.get('SLOW_REQUEST_SECONDS', 1.0))
+        self.slow_requests = deque(maxlen=int(app.config.get('SLOW_REQUEST_LOG_SIZE', 50)))
+        self._app = app
+        if not self.enabled:
+            return
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(engine, 'handle_error', self._handle_error)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        if has_request_context():
+            metrics = g.get('request_metrics')
+            if metrics is not None:
+                metrics.record_statement(statement, time.perf_counter() - started)
+
+    def _handle_error(self, context):
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    def _before_request(self):
+        g.request_metrics = RequestMetrics()
+
+    def _after_request(self, response):
+        metrics = g.get('request_metrics')
+        if metrics is None:
+            return response
+        labels = (request.method, request.blueprint or '', request.url_rule.rule if request.url_rule else '<unmatched>')
+        request_info = {'method': request.method, 'path': request.full_path.rstrip('?')}
+
+        if response.is_streamed:
+            response.response = self._count_stream(response.response, metrics, labels, response.status_code, request_info)
+        else:
+            self.finish(metrics, labels, response.status_code, response.calculate_content_length() or 0, request_info)
+        return response
+
+    def _count_stream(self, chunks, metrics, labels, status, request_info):
+        sent = 0
+        try:
+            for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            self.finish(metrics, labels, status, sent, request_info)
+
+    def finish(self, metrics, labels, status, size, request_info):
+        duration = time.perf_counter() - metrics.started
+        with self._lock:
+            stats = self.routes.get(labels)
+            if stats is None:
+                stats = self.routes[labels] = RouteStats()
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        stats.latency.observe(duration)
+        stats.statements.observe(metrics.sql_count)
+        stats.sql_time.observe(metrics.sql_time)
+        stats.response_bytes.observe(size)
+
+        if duration >= self.slow_seconds:
+            method, blueprint, route = labels
+            entry = dict(
+                request_info,
+                route=route,
+                status=status,
+                seconds=round(duration, 6),
+                sql_count=metrics.sql_count,
+                sql_seconds=round(metrics.sql_time, 6),
+                response_bytes=size,
+                at=time.time(),
+                statements=[
+                    {'sql': statement, 'seconds': round(seconds, 6)}
+                    for statement, seconds in metrics.statements
+                ]
+            )
+            self.slow_requests.append(entry)
+            self._app.logger.warning(
+                'Slow request: %s %s -> %s in %.3fs (%d SQL statements, %.3fs in SQL, %d bytes)',
+                method, request_info['path'], status, duration, metrics.sql_count, metrics.sql_time, size
+            )
+
+    def slow_log(self):
+        return list(self.slow_requests)
+
+    def metrics_text(self):
+        with self._lock:
+            routes = [(labels, stats, dict(stats.statuses)) for labels, stats in sorted(self.routes.items())]
+
+        lines = []
+        histograms = [
+            ('http_request_duration_seconds', 'Request latency by route.', 'latency'),
+            ('http_request_sql_statements', 'SQL statements executed per request.', 'statements'),
+            ('http_request_sql_seconds', 'Time spent executing SQL per request.', 'sql_time'),
+            ('http_response_size_bytes', 'Response body size as sent.', 'response_bytes')
+        ]
+        for name, help_text, attribute in histograms:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, stats, _ in routes:
+                label_text = format_labels(labels)
+                snapshot = getattr(stats, attribute).snapshot()
+                for bound, count in snapshot['buckets'].items():
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {count}')
+                lines.append(f'{name}_sum{{{label_text}}} {snapshot["sum"]}')
+                lines.append(f'{name}_count{{{label_text}}} {snapshot["count"]}')
+
+        lines.append('# HELP http_requests_total Requests by route and status.')
+        lines.append('# TYPE http_requests_total counter')
+        for labels, _, statuses in routes:
+            label_text = format_labels(labels)
+            for status, count in sorted(statuses.items()):
+                lines.append(f'http_requests_total{{{label_text},status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    method, blueprint, route = labels
+    return f'method="{escape_label(method)}",blueprint="{escape_label(blueprint)}",route="{escape_label(route)}"'
+
+instrumentation = Instrumentation()
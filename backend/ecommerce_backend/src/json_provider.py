@@ -0,0 +1,65 @@
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.engine import Row
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON encoding for API responses and request bodies.
+#
+# Uses orjson when it is installed and Flask's stdlib encoder otherwise. Both
+# produce the same documents: compact (unless JSON_COMPACT is off), keys in
+# insertion order, UTF-8 instead of \u escapes, and Flask's conventions for
+# dates, decimals and UUIDs. Query result rows (e.g. from column projections)
+# can be passed as they are and are encoded as objects.
+
+class FastJSONProvider(DefaultJSONProvider):
+    ensure_ascii = False
+    sort_keys = False
+    compact = True
+
+    # orjson would write datetimes as ISO strings; Flask's default() keeps the
+    # HTTP date format the stdlib encoder uses
+    ORJSON_OPTIONS = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+    )
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.compact = app.config.get('JSON_COMPACT', True)
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Row):
+            return o._asdict()
+        return DefaultJSONProvider.default(o)
+
+    def _indent(self):
+        return (self.compact is None and self._app.debug) or self.compact is False
+
+    def dumps_bytes(self, obj, indent=False):
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=self.default,
+                                    option=self.ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+            except TypeError:
+                # Values orjson refuses (e.g. integers over 64 bits)
+                pass
+        kwargs = {'indent': 2} if indent else {'separators': (',', ':')}
+        return super().dumps(obj, **kwargs).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        # Encode straight to bytes; no intermediate str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj, indent=self._indent()) + b'\n', mimetype=self.mimetype)
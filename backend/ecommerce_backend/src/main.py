@@ -2,21 +2,103 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))  # DON'T CHANGE THIS !!!
 
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, jsonify, request
 from flask_cors import CORS
 from src.extensions import db
-from .routes import auth_bp, admin_bp, user_bp, order_bp, payment_bp, rating_bp, product_bp
+from src import database
+from src.search import search_index
+from src.cache import response_cache
+from src.compression import compressor
+from src.instrumentation import instrumentation
+from src.static_assets import static_assets
+from src.payment_gateway import payment_gateway
+from src.cart_store import cart_store
+from src.json_provider import FastJSONProvider
+from src.commands import ratings_cli, analytics_cli, products_cli, schema_cli, inventory_cli, payments_cli, static_cli
+from src.migrations import upgrade as upgrade_schema, check as check_schema
+from .routes import auth_bp, admin_bp, user_bp, order_bp, payment_bp, rating_bp, product_bp, inventory_bp, cart_bp
 import os
 
 app = Flask(__name__)
 CORS(app)
 
-# Configure SQLAlchemy to use SQLite for testing
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test.db'
+# Database URL, pool settings and optional read replica come from the
+# environment (see src/database.py); defaults to the SQLite file test.db
+app.config.update(database.database_config(os.environ))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Catalog response cache: 'memory' (per process) or 'redis'. With 'memory'
+# the catalog version is shared through the database and re-read at most
+# every CATALOG_VERSION_POLL seconds.
+app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'memory')
+app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+app.config['CATALOG_VERSION_POLL'] = float(os.environ.get('CATALOG_VERSION_POLL', 1.0))
+
+# Payment gateway: 'stripe', or 'fake' for offline load tests
+app.config['PAYMENT_GATEWAY'] = os.environ.get('PAYMENT_GATEWAY', 'stripe')
+app.config['STRIPE_SECRET_KEY'] = os.environ.get('STRIPE_SECRET_KEY', 'sk_test_51OXaMpLkjaNGkjsNGkjsNGkjsN')
+app.config['STRIPE_CONNECT_TIMEOUT'] = float(os.environ.get('STRIPE_CONNECT_TIMEOUT', 3.05))
+app.config['STRIPE_READ_TIMEOUT'] = float(os.environ.get('STRIPE_READ_TIMEOUT', 10))
+app.config['PAYMENT_FAKE_LATENCY'] = float(os.environ.get('PAYMENT_FAKE_LATENCY', 0))
+
+# Seconds checkout holds reserved stock, and how long availability summaries are cached
+app.config['RESERVATION_TTL'] = int(os.environ.get('RESERVATION_TTL', 900))
+app.config['AVAILABILITY_CACHE_TTL'] = int(os.environ.get('AVAILABILITY_CACHE_TTL', 5))
+
+# Serve catalog reads from the stored product documents (src/catalog_documents.py)
+app.config['PRODUCT_DOCUMENTS'] = os.environ.get('PRODUCT_DOCUMENTS', 'false').lower() == 'true'
+
+# Server-side carts: 'database' (written through), or cached in 'redis' or
+# 'memory' (single worker only) and written back to the database every
+# CART_FLUSH_INTERVAL seconds (0 writes every change through)
+app.config['CART_BACKEND'] = os.environ.get('CART_BACKEND', 'database')
+app.config['CART_REDIS_URL'] = os.environ.get('CART_REDIS_URL', app.config['CACHE_REDIS_URL'])
+app.config['CART_FLUSH_INTERVAL'] = float(os.environ.get('CART_FLUSH_INTERVAL', 2))
+# Worker processes serving the app (as set for gunicorn)
+app.config['WEB_CONCURRENCY'] = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# JSON responses: orjson when installed, compact unless JSON_COMPACT=false
+app.config['JSON_COMPACT'] = os.environ.get('JSON_COMPACT', 'true').lower() != 'false'
+app.json = FastJSONProvider(app)
+
+# Compress text responses of at least COMPRESS_MIN_SIZE bytes (gzip, or
+# brotli when installed); compressed catalog cache entries are kept in
+# memory up to COMPRESS_CACHE_BYTES
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+app.config['COMPRESS_GZIP_LEVEL'] = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+app.config['COMPRESS_CACHE_BYTES'] = int(os.environ.get('COMPRESS_CACHE_BYTES', 32 * 1024 * 1024))
+
+# Built storefront to serve (defaults to src/static); files under
+# STATIC_IMMUTABLE_PREFIX are fingerprinted and cached for a year
+app.config['STATIC_ROOT'] = os.environ.get('STATIC_ROOT')
+app.config['STATIC_IMMUTABLE_PREFIX'] = os.environ.get('STATIC_IMMUTABLE_PREFIX', 'assets/')
+
+# Per-route latency, SQL and response size metrics on /api/metrics (bearer
+# METRICS_TOKEN required when set); requests slower than
+# SLOW_REQUEST_SECONDS are logged with their SQL statements
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() != 'false'
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['SLOW_REQUEST_SECONDS'] = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))
+app.config['SLOW_REQUEST_LOG_SIZE'] = int(os.environ.get('SLOW_REQUEST_LOG_SIZE', 50))
+
+# Search: SEARCH_BACKEND is 'fts5' on SQLite and 'memory' otherwise; memory
+# indexes pick up other processes' catalog changes every SEARCH_SYNC_INTERVAL
+# seconds, re-reading the last SEARCH_SYNC_LAG seconds of the change log
+if os.environ.get('SEARCH_BACKEND'):
+    app.config['SEARCH_BACKEND'] = os.environ['SEARCH_BACKEND']
+app.config['SEARCH_SYNC_INTERVAL'] = float(os.environ.get('SEARCH_SYNC_INTERVAL', 1.0))
+app.config['SEARCH_SYNC_LAG'] = int(os.environ.get('SEARCH_SYNC_LAG', 60))
+
 # Initialize extensions
 db.init_app(app)
+database.init_app(app, db)
+instrumentation.init_app(app, db)
+response_cache.init_app(app)
+payment_gateway.init_app(app)
+cart_store.init_app(app)
+compressor.init_app(app)
+static_assets.init_app(app)
 
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -26,24 +108,43 @@ app.register_blueprint(order_bp, url_prefix='/api/orders')
 app.register_blueprint(payment_bp, url_prefix='/api/payment')
 app.register_blueprint(rating_bp, url_prefix='/api/ratings')
 app.register_blueprint(product_bp, url_prefix='/api/products')
+app.register_blueprint(inventory_bp, url_prefix='/api/inventory')
+app.register_blueprint(cart_bp, url_prefix='/api/cart')
+
+# Register CLI commands
+app.cli.add_command(ratings_cli)
+app.cli.add_command(analytics_cli)
+app.cli.add_command(products_cli)
+app.cli.add_command(schema_cli)
+app.cli.add_command(inventory_cli)
+app.cli.add_command(payments_cli)
+app.cli.add_command(static_cli)
 
-# Create database tables
+# Create database tables, then bring older databases up to date
 with app.app_context():
     db.create_all()
+    upgrade_schema()
+    check_schema()
+    search_index.init_app(app)
 
 # API routes
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy'}), 200
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    token = app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'message': 'Invalid metrics token!'}), 401
+    return instrumentation.metrics_text(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 # Serve static files
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    if path and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, 'index.html')
+    # From the manifest built at startup (src/static_assets.py)
+    return static_assets.serve(path)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
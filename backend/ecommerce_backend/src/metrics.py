@@ -0,0 +1,43 @@
+from contextlib import contextmanager
+import bisect
+import threading
+import time
+
+# Small in-process metric types shared by the instrumented subsystems.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    # Fixed-bucket latency histogram (seconds), safe to share between threads
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)   # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def snapshot(self):
+        # Cumulative counts per upper bound, like Prometheus buckets
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative, running = {}, 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        return {'count': count, 'sum': round(total, 6), 'buckets': cumulative}
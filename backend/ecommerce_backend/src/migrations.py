@@ -0,0 +1,206 @@
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+import datetime
+from .extensions import db
+
+# Versioned schema migrations.
+#
+# db.create_all() creates missing tables but never changes existing ones, so
+# databases created before a column or index was added to the models would
+# silently drift. Each migration below brings such a database up to date and
+# is written to be a no-op on a fresh database (create_all already built
+# everything), so a new install simply records every version as applied.
+#
+# upgrade() runs at startup right after create_all(); `flask schema upgrade`
+# and `flask schema status` do the same from the command line. Append new
+# migrations with the next version number; never edit an applied one.
+#
+# A column or index added to the models must ship with its migration in the
+# same change. check() runs after upgrade() and refuses to start on a schema
+# that is still missing any of them, rather than failing requests later.
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(f):
+        MIGRATIONS.append((version, description, f))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return f
+    return register
+
+def add_column(conn, table, name, ddl):
+    # ALTER TABLE ... ADD COLUMN unless the column is already there
+    columns = {column['name'] for column in inspect(conn).get_columns(table)}
+    if name not in columns:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+
+def create_index(conn, table, name):
+    # Create an index declared on the models (by name) unless it exists
+    for index in db.metadata.tables[table].indexes:
+        if index.name == name:
+            index.create(conn, checkfirst=True)
+            return
+    raise KeyError(f'No index {name} declared on {table}')
+
+def delete_duplicates(conn, table, columns):
+    # Keep one row (the smallest id) per group so a unique index can be built.
+    # The derived table keeps MySQL from rejecting a self-referencing DELETE.
+    group = ', '.join(columns)
+    conn.execute(text(
+        f'DELETE FROM {table} WHERE id NOT IN '
+        f'(SELECT id FROM (SELECT MIN(id) AS id FROM {table} GROUP BY {group}) AS keep)'
+    ))
+
+@migration(1, 'Add stored rating aggregates and helpful vote counts')
+def add_rating_columns(conn):
+    add_column(conn, 'products', 'rating_count', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(conn, 'products', 'rating_sum', 'INTEGER NOT NULL DEFAULT 0')
+    for score in range(1, 6):
+        add_column(conn, 'products', f'rating_{score}', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(conn, 'ratings', 'helpful_count', 'INTEGER NOT NULL DEFAULT 0')
+
+@migration(2, 'Index hot lookup columns; one rating and wishlist entry per user and product')
+def add_indexes(conn):
+    delete_duplicates(conn, 'ratings', ('product_id', 'user_id'))
+    delete_duplicates(conn, 'wishlist_items', ('user_id', 'product_id'))
+    conn.execute(text('DELETE FROM rating_helpful_votes WHERE rating_id NOT IN (SELECT id FROM ratings)'))
+
+    indexes = {
+        'products': (
+            'ix_products_created_at_id', 'ix_products_category_created_at',
+            'ix_products_is_featured_created_at', 'ix_products_is_new_created_at'
+        ),
+        'product_images': ('ix_product_images_product_id',),
+        'product_features': ('ix_product_features_product_id',),
+        'product_specifications': ('ix_product_specifications_product_id',),
+        'product_colors': ('ix_product_colors_product_id',),
+        'orders': ('ix_orders_user_id_created_at', 'ix_orders_created_at_id', 'ix_orders_status_created_at'),
+        'order_items': ('ix_order_items_order_id', 'ix_order_items_product_id'),
+        'wishlist_items': ('ux_wishlist_items_user_id_product_id', 'ix_wishlist_items_product_id'),
+        'ratings': ('ux_ratings_product_id_user_id', 'ix_ratings_product_id_created_at', 'ix_ratings_user_id'),
+        'users': ('ix_users_created_at_id',)
+    }
+    for table, names in indexes.items():
+        for name in names:
+            create_index(conn, table, name)
+
+@migration(3, 'Backfill stored rating aggregates')
+def backfill_rating_aggregates(conn):
+    counts = ', '.join(
+        f'rating_{score} = (SELECT COUNT(*) FROM ratings r WHERE r.product_id = products.id AND r.score = {score})'
+        for score in range(1, 6)
+    )
+    conn.execute(text(
+        'UPDATE products SET '
+        'rating_count = (SELECT COUNT(*) FROM ratings r WHERE r.product_id = products.id), '
+        'rating_sum = (SELECT COALESCE(SUM(r.score), 0) FROM ratings r WHERE r.product_id = products.id), '
+        f'{counts}'
+    ))
+    conn.execute(text(
+        'UPDATE products SET rating = ROUND(rating_sum * 1.0 / rating_count, 1) WHERE rating_count > 0'
+    ))
+
+@migration(4, 'Backfill the daily order rollup')
+def backfill_order_daily_stats(conn):
+    # Only when the rollup is empty; `flask analytics rebuild` redoes it fully
+    if conn.execute(text('SELECT COUNT(*) FROM order_daily_stats')).scalar():
+        return
+    conn.execute(text(
+        'INSERT INTO order_daily_stats (day, status, order_count, revenue) '
+        "SELECT DATE(created_at), COALESCE(status, 'pending'), COUNT(*), COALESCE(SUM(total_amount), 0) "
+        'FROM orders WHERE created_at IS NOT NULL '
+        "GROUP BY DATE(created_at), COALESCE(status, 'pending')"
+    ))
+
+@migration(5, 'Track stock quantities on products')
+def add_stock_quantity(conn):
+    add_column(conn, 'products', 'stock_quantity', 'INTEGER')
+
+@migration(6, 'Variant stock, order item colors and inventory reservations')
+def add_variant_stock(conn):
+    # inventory_reservations itself is created by create_all()
+    add_column(conn, 'product_colors', 'stock_quantity', 'INTEGER')
+    add_column(conn, 'order_items', 'color', 'VARCHAR(50)')
+
+@migration(7, 'Index wishlists by date added')
+def add_wishlist_index(conn):
+    create_index(conn, 'wishlist_items', 'ix_wishlist_items_user_id_added_at')
+
+@migration(8, 'Store precomputed product documents')
+def add_product_document(conn):
+    # Filled by admin writes and `flask products check-documents --repair`
+    add_column(conn, 'products', 'document', 'TEXT')
+
+@migration(9, 'Index review pages sorted by score and helpfulness')
+def add_review_sort_indexes(conn):
+    create_index(conn, 'ratings', 'ix_ratings_product_id_score_created_at')
+    create_index(conn, 'ratings', 'ix_ratings_product_id_helpful_count_created_at')
+    create_index(conn, 'ratings', 'ix_ratings_product_id_score_newest')
+
+def applied_versions(conn):
+    return {version for (version,) in conn.execute(select(schema_migrations.c.version))}
+
+def pending_migrations(engine=None):
+    with (engine or db.engine).begin() as conn:
+        metadata.create_all(conn)
+        applied = applied_versions(conn)
+    return [entry for entry in MIGRATIONS if entry[0] not in applied]
+
+def upgrade(engine=None):
+    # Apply pending migrations in order, each in its own transaction together
+    # with its schema_migrations row. Returns the versions applied.
+    engine = engine or db.engine
+    done = []
+    for version, description, f in pending_migrations(engine):
+        try:
+            with engine.begin() as conn:
+                if version in applied_versions(conn):
+                    continue
+                f(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=version, description=description, applied_at=datetime.datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Another process applied the same version concurrently
+            continue
+        done.append(version)
+    return done
+
+def drift(conn):
+    # Columns and indexes declared on the models but missing from the database
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            missing.append(table.name)
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(f'{table.name}.{column.name}' for column in table.columns if column.name not in columns)
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index.name for index in table.indexes if index.name not in indexes)
+    return missing
+
+def check(engine=None):
+    with (engine or db.engine).connect() as conn:
+        missing = drift(conn)
+    if missing:
+        raise RuntimeError(f"Database schema is missing {', '.join(missing)}; add a migration for them.")
+
+def status():
+    with db.engine.begin() as conn:
+        metadata.create_all(conn)
+        applied = {
+            row.version: row.applied_at
+            for row in conn.execute(select(schema_migrations.c.version, schema_migrations.c.applied_at))
+        }
+    return [(version, description, applied.get(version)) for version, description, _ in MIGRATIONS]
@@ -2,4 +2,8 @@ from ..extensions import db
 from .user import User
 from .product import Product, ProductImage, ProductFeature, ProductSpecification, ProductColor, Category
 from .order import Order, OrderItem, WishlistItem
-from .rating import Rating
+from .inventory import InventoryReservation, OrderError, InsufficientStock
+from .rating import Rating, RatingHelpfulVote
+from .analytics import OrderDailyStat
+from .payment import StripeEvent
+from .cart import CartItem
@@ -0,0 +1,100 @@
+import datetime
+from ..extensions import db
+
+class OrderDailyStat(db.Model):
+    __tablename__ = 'order_daily_stats'
+
+    # One row per (UTC creation day, order status); maintained incrementally
+    # whenever an order is created or changes status so the admin analytics
+    # never have to scan the orders table
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+    @classmethod
+    def add(cls, day, status, order_count, revenue):
+        # Atomic upsert so concurrent orders on the same day don't race
+        table = cls.__table__
+        values = {'day': day, 'status': status, 'order_count': order_count, 'revenue': revenue}
+        dialect = db.session.get_bind().dialect.name
+
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(table).values(**values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['day', 'status'],
+                set_={
+                    'order_count': table.c.order_count + stmt.excluded.order_count,
+                    'revenue': table.c.revenue + stmt.excluded.revenue
+                }
+            )
+        elif dialect in ('mysql', 'mariadb'):
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(table).values(**values)
+            stmt = stmt.on_duplicate_key_update(
+                order_count=table.c.order_count + stmt.inserted.order_count,
+                revenue=table.c.revenue + stmt.inserted.revenue
+            )
+        else:
+            result = db.session.execute(
+                table.update()
+                .where(table.c.day == day, table.c.status == status)
+                .values(order_count=table.c.order_count + order_count, revenue=table.c.revenue + revenue)
+            )
+            if result.rowcount:
+                return
+            stmt = table.insert().values(**values)
+
+        db.session.execute(stmt)
+
+    @classmethod
+    def record_order(cls, order):
+        # Call in the same transaction that inserts the order
+        if order.created_at is None:
+            order.created_at = datetime.datetime.utcnow()
+        cls.add(order.created_at.date(), order.status or 'pending', 1, order.total_amount or 0.0)
+
+    @classmethod
+    def record_status_change(cls, order, old_status):
+        if old_status == order.status:
+            return
+        day = order.created_at.date()
+        amount = order.total_amount or 0.0
+        cls.add(day, old_status or 'pending', -1, -amount)
+        cls.add(day, order.status, 1, amount)
+
+    @classmethod
+    def rebuild(cls):
+        # Recompute all rows from the orders table in one grouped pass
+        from .order import Order
+
+        day = db.func.date(Order.created_at)
+        rows = db.session.query(
+            day, Order.status, db.func.count(Order.id), db.func.sum(Order.total_amount)
+        ).group_by(day, Order.status).all()
+
+        db.session.query(cls).delete()
+        db.session.bulk_insert_mappings(cls, [
+            {
+                'day': order_day if isinstance(order_day, datetime.date) else datetime.date.fromisoformat(order_day),
+                'status': status or 'pending',
+                'order_count': count,
+                'revenue': revenue or 0.0
+            }
+            for order_day, status, count, revenue in rows
+            if order_day is not None
+        ])
+        db.session.commit()
+        return len(rows)
+
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'status': self.status,
+            'order_count': self.order_count,
+            'revenue': self.revenue
+        }
@@ -0,0 +1,23 @@
+import datetime
+from ..extensions import db
+
+class CartItem(db.Model):
+    __tablename__ = 'cart_items'
+
+    # One row per cart line. Carts are read and written through
+    # src/cart_store.py, which either changes rows here directly or keeps the
+    # live copy in a cache and writes a user's whole cart back in one
+    # statement pair.
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), primary_key=True)
+    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), primary_key=True, index=True)
+    color = db.Column(db.String(50), primary_key=True, default='')   # '' when the product has no colour choice
+    quantity = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'product_id': self.product_id,
+            'color': self.color or None,
+            'quantity': self.quantity,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -0,0 +1,249 @@
+import datetime
+import uuid
+from sqlalchemy import update
+from ..extensions import db
+from .product import Product, ProductColor
+
+class OrderError(ValueError):
+    pass
+
+class InsufficientStock(OrderError):
+    def __init__(self, product_ids):
+        super().__init__(f"Insufficient stock for: {', '.join(product_ids)}")
+        self.product_ids = product_ids
+
+def parse_lines(items):
+    # [{'product_id', 'quantity', 'color'?}, ...] -> {(product_id, color): quantity},
+    # merging repeated lines
+    if not isinstance(items, list) or not items:
+        raise OrderError('items must be a non-empty list')
+    lines = {}
+    for item in items:
+        if not isinstance(item, dict) or not item.get('product_id'):
+            raise OrderError('Every item needs a product_id')
+        quantity = item.get('quantity')
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+            raise OrderError('quantity must be a positive integer')
+        key = (str(item['product_id']), str(item['color']) if item.get('color') else None)
+        lines[key] = lines.get(key, 0) + quantity
+    return lines
+
+def load_products(product_ids):
+    # The columns pricing and stock checks need, in one IN query
+    products = {
+        row.id: row
+        for row in db.session.query(
+            Product.id, Product.price, Product.discount_price, Product.in_stock, Product.stock_quantity
+        ).filter(Product.id.in_(list(product_ids)))
+    }
+    missing = [product_id for product_id in product_ids if product_id not in products]
+    if missing:
+        raise OrderError(f"Unknown products: {', '.join(missing)}")
+    return products
+
+def unit_price(product):
+    return product.discount_price if product.discount_price is not None else product.price
+
+def load_colors(lines):
+    # {(product_id, color name): row} for the variants named in lines
+    product_ids = {product_id for product_id, color in lines if color}
+    if not product_ids:
+        return {}
+    return {
+        (row.product_id, row.name): row
+        for row in db.session.query(
+            ProductColor.id, ProductColor.product_id, ProductColor.name, ProductColor.stock_quantity
+        ).filter(ProductColor.product_id.in_(product_ids))
+    }
+
+def take_stock(lines):
+    # Check and take stock for {(product_id, color): quantity} with one
+    # conditional UPDATE per table. Returns the loaded products for pricing.
+    per_product = {}
+    for (product_id, color), quantity in lines.items():
+        per_product[product_id] = per_product.get(product_id, 0) + quantity
+    products = load_products(per_product)
+    colors = load_colors(lines)
+
+    unavailable = []
+    product_take = {}
+    for product_id, quantity in per_product.items():
+        product = products[product_id]
+        if product.stock_quantity is None:
+            if product.in_stock is False:
+                unavailable.append(product_id)
+        elif product.stock_quantity < quantity:
+            unavailable.append(product_id)
+        else:
+            product_take[product_id] = quantity
+
+    color_take = {}
+    for (product_id, color), quantity in lines.items():
+        if not color:
+            continue
+        variant = colors.get((product_id, color))
+        if variant is None:
+            raise OrderError(f'Unknown color {color} for product {product_id}')
+        if variant.stock_quantity is None:
+            continue
+        if variant.stock_quantity < quantity:
+            unavailable.append(product_id)
+        else:
+            color_take[variant.id] = quantity
+    if unavailable:
+        raise InsufficientStock(sorted(set(unavailable)))
+
+    # Re-checked atomically: another checkout may have taken the units since
+    if not Product.decrement_stock(product_take) or not ProductColor.decrement_stock(color_take):
+        raise InsufficientStock(sorted(per_product))
+    return products
+
+def restore_stock(lines):
+    # Give {(product_id, color): quantity} back to tracked stock
+    per_product = {}
+    for (product_id, color), quantity in lines.items():
+        per_product[product_id] = per_product.get(product_id, 0) + quantity
+    per_color = {}
+    colors = load_colors(lines)
+    for (product_id, color), quantity in lines.items():
+        variant = colors.get((product_id, color)) if color else None
+        if variant is not None:
+            per_color[variant.id] = per_color.get(variant.id, 0) + quantity
+    Product.increment_stock(per_product)
+    ProductColor.increment_stock(per_color)
+
+def reserved_lines(rows):
+    # Reservation rows -> {(product_id, color): quantity}
+    lines = {}
+    for row in rows:
+        key = (row.product_id, row.color)
+        lines[key] = lines.get(key, 0) + row.quantity
+    return lines
+
+class InventoryReservation(db.Model):
+    __tablename__ = 'inventory_reservations'
+    __table_args__ = (
+        # The expiry sweep reads active reservations oldest-expiry first
+        db.Index('ix_inventory_reservations_status_expires_at', 'status', 'expires_at'),
+    )
+
+    # Units held for a checkout. They are taken from stock when reserved, so
+    # converting on payment only flips the status; releasing (cancel or
+    # expiry) puts them back. Rows of one checkout share a checkout_id.
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    checkout_id = db.Column(db.String(36), nullable=False, index=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    color = db.Column(db.String(50), nullable=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='active')  # active, converted, released
+    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    @classmethod
+    def reserve(cls, user_id, items, ttl):
+        # Hold stock for items in the current transaction; replaces any
+        # active checkout of the same user. Raises OrderError.
+        lines = parse_lines(items)
+        if not cls.release_rows(cls.query.filter_by(user_id=user_id, status='active').all()):
+            raise OrderError('Checkout changed while reserving, please retry!')
+        take_stock(lines)
+
+        checkout_id = str(uuid.uuid4())
+        now = datetime.datetime.utcnow()
+        rows = [
+            cls(
+                checkout_id=checkout_id, user_id=user_id, product_id=product_id, color=color,
+                quantity=quantity, status='active', expires_at=now + datetime.timedelta(seconds=ttl),
+                created_at=now
+            )
+            for (product_id, color), quantity in lines.items()
+        ]
+        db.session.add_all(rows)
+        return rows
+
+    @classmethod
+    def active(cls, checkout_id, user_id):
+        now = datetime.datetime.utcnow()
+        return cls.query.filter(
+            cls.checkout_id == checkout_id, cls.user_id == user_id,
+            cls.status == 'active', cls.expires_at > now
+        ).all()
+
+    @classmethod
+    def convert(cls, rows, order_id):
+        # Mark a checkout's rows as sold to order_id, in the current
+        # transaction. A payment may arrive after the reservation expired:
+        # rows still held are converted all the same, and units the expiry
+        # sweep (or a cancel) already gave back are taken from stock again,
+        # raising InsufficientStock if they are gone.
+        if any(row.status == 'converted' for row in rows):
+            raise OrderError('Reservation was already used!')
+
+        held = [row for row in rows if row.status == 'active']
+        if held:
+            result = db.session.execute(
+                update(cls)
+                .where(cls.id.in_([row.id for row in held]), cls.status == 'active')
+                .values(status='converted', order_id=order_id)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != len(held):
+                # The sweep released some of them meanwhile
+                converted = {row_id for (row_id,) in db.session.query(cls.id).filter(cls.order_id == order_id)}
+                held = [row for row in held if row.id in converted]
+
+        released = [row for row in rows if row not in held]
+        if released:
+            take_stock(reserved_lines(released))
+
+    @classmethod
+    def release_rows(cls, rows):
+        # Flip active rows to released and restock them, in the current
+        # transaction. Returns False if another process got to a row first.
+        if not rows:
+            return True
+        result = db.session.execute(
+            update(cls)
+            .where(cls.id.in_([row.id for row in rows]), cls.status == 'active')
+            .values(status='released')
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(rows):
+            return False
+        restore_stock(reserved_lines(rows))
+        return True
+
+    @classmethod
+    def sweep(cls, batch_size=500):
+        # Release expired reservations batch_size rows per transaction.
+        # Returns (released count, affected product ids).
+        released, product_ids = 0, set()
+        while True:
+            rows = cls.query.filter(
+                cls.status == 'active', cls.expires_at <= datetime.datetime.utcnow()
+            ).order_by(cls.expires_at).limit(batch_size).with_for_update(skip_locked=True).all()
+            if not rows:
+                break
+            if not cls.release_rows(rows):
+                # Raced with a checkout converting some of them; retry later
+                db.session.rollback()
+                break
+            released += len(rows)
+            product_ids.update(row.product_id for row in rows)
+            db.session.commit()
+        db.session.commit()
+        return released, product_ids
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'checkout_id': self.checkout_id,
+            'product_id': self.product_id,
+            'color': self.color,
+            'quantity': self.quantity,
+            'status': self.status,
+            'order_id': self.order_id,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
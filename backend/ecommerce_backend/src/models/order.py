@@ -2,9 +2,20 @@ from flask_sqlalchemy import SQLAlchemy
 import datetime
 import uuid
 from ..extensions import db
+from .analytics import OrderDailyStat
+from .product import Product
+from .inventory import (
+    OrderError, InsufficientStock, InventoryReservation, load_products, parse_lines, reserved_lines, take_stock, unit_price
+)
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # A user's order history and the admin listing, newest first
+        db.Index('ix_orders_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_orders_created_at_id', 'created_at', 'id'),
+        db.Index('ix_orders_status_created_at', 'status', 'created_at'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
@@ -20,8 +31,55 @@ class Order(db.Model):
     # Relationships
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade="all, delete-orphan")
     
-    def to_dict(self):
-        return {
+    @classmethod
+    def place(cls, user_id, items=None, reservation_id=None, prices=None, **fields):
+        # Add an order to the current transaction. Items are either
+        # [{'product_id', 'quantity', 'color'?}, ...], whose stock is taken
+        # now with conditional UPDATEs, or the reservation reservation_id,
+        # whose units were taken at checkout and are converted, also after it
+        # expired (see InventoryReservation.convert). Lines are priced from
+        # prices ({(product_id, color): unit price}, frozen when the payment
+        # was created) and otherwise from the products table (one IN query).
+        # Raises OrderError for bad input; the caller rolls back then, or
+        # commits.
+        reservations = None
+        if reservation_id:
+            reservations = InventoryReservation.query.filter_by(checkout_id=reservation_id, user_id=user_id).all()
+        if reservations:
+            lines = reserved_lines(reservations)
+            products = load_products({product_id for product_id, _ in lines})
+        else:
+            # Also a payment whose reservation is unknown: its items are
+            # taken from stock instead
+            if reservation_id and not items:
+                raise OrderError('Reservation not found!')
+            lines = parse_lines(items)
+            products = take_stock(lines)
+        
+        prices = prices or {}
+        order_items = []
+        for (product_id, color), quantity in lines.items():
+            price = prices.get((product_id, color))
+            if price is None:
+                price = unit_price(products[product_id])
+            order_items.append(OrderItem(product_id=product_id, color=color, quantity=quantity, price=price))
+        
+        order = cls(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            total_amount=round(sum(item.price * item.quantity for item in order_items), 2),
+            items=order_items,
+            **fields
+        )
+        db.session.add(order)
+        if reservations:
+            InventoryReservation.convert(reservations, order.id)
+        OrderDailyStat.record_order(order)
+        return order
+    
+    def to_dict(self, include_items=True, products=None):
+        # products: optional {product_id: summary row} to name the items
+        data = {
             'id': self.id,
             'user_id': self.user_id,
             'status': self.status,
@@ -30,35 +88,60 @@ class Order(db.Model):
             'billing_address': self.billing_address,
             'payment_method': self.payment_method,
             'payment_status': self.payment_status,
-            'items': [item.to_dict() for item in self.items],
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+        if include_items:
+            data['items'] = [item.to_dict(products) for item in self.items]
+        return data
 
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=False)
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=False, index=True)
+    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False, index=True)
+    color = db.Column(db.String(50), nullable=True)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)  # Price at time of purchase
     
-    def to_dict(self):
+    @staticmethod
+    def product_summaries(items):
+        # {product_id: (id, name, image)} for the given items, in one IN query
+        product_ids = {item.product_id for item in items}
+        if not product_ids:
+            return {}
         return {
+            row.id: row
+            for row in db.session.query(Product.id, Product.name, Product.image).filter(Product.id.in_(product_ids))
+        }
+    
+    def to_dict(self, products=None):
+        data = {
             'id': self.id,
             'order_id': self.order_id,
             'product_id': self.product_id,
+            'color': self.color,
             'quantity': self.quantity,
             'price': self.price
         }
+        if products is not None:
+            product = products.get(self.product_id)
+            data['product_name'] = product.name if product else None
+            data['product_image'] = product.image if product else None
+        return data
 
 class WishlistItem(db.Model):
     __tablename__ = 'wishlist_items'
+    __table_args__ = (
+        db.Index('ux_wishlist_items_user_id_product_id', 'user_id', 'product_id', unique=True),
+        # A user's wishlist, newest first
+        db.Index('ix_wishlist_items_user_id_added_at', 'user_id', 'added_at'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False, index=True)
     added_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     
     def to_dict(self):
@@ -0,0 +1,36 @@
+import datetime
+from ..extensions import db
+
+class StripeEvent(db.Model):
+    __tablename__ = 'stripe_events'
+    __table_args__ = (
+        # Workers claim due events in arrival order
+        db.Index('ix_stripe_events_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    # Webhook inbox. Verified events are stored as received, keyed by the
+    # Stripe event id so redeliveries are dropped, and processed later by
+    # `flask payments work` (see src/webhooks.py).
+    id = db.Column(db.String(255), primary_key=True)
+    type = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, processed, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # When a pending event is next due, or when a claimed one's lease runs out
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    claimed_by = db.Column(db.String(36), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    received_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
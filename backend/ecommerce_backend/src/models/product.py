@@ -1,11 +1,59 @@
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import defer, selectinload
 import datetime
 import uuid
 from ..extensions import db
 
-class Product(db.Model):
+class StockMixin:
+    # Conditional stock updates for models with an id and a nullable
+    # stock_quantity (NULL = not tracked). Never read-modify-write.
+    
+    @classmethod
+    def decrement_stock(cls, quantities):
+        # Take {id: quantity} from tracked stock with one conditional UPDATE.
+        # Returns False when some row had too few units left; the caller must
+        # then roll back, since the other rows were decremented.
+        if not quantities:
+            return True
+        wanted = case(quantities, value=cls.id)
+        remaining = cls.stock_quantity - wanted
+        values = {'stock_quantity': remaining}
+        if hasattr(cls, 'in_stock'):
+            values['in_stock'] = remaining > 0
+        result = db.session.execute(
+            update(cls)
+            .where(cls.id.in_(list(quantities)), cls.stock_quantity >= wanted)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == len(quantities)
+    
+    @classmethod
+    def increment_stock(cls, quantities):
+        # Give {id: quantity} back to tracked stock
+        if not quantities:
+            return
+        values = {'stock_quantity': cls.stock_quantity + case(quantities, value=cls.id)}
+        if hasattr(cls, 'in_stock'):
+            values['in_stock'] = True
+        db.session.execute(
+            update(cls)
+            .where(cls.id.in_(list(quantities)), cls.stock_quantity.isnot(None))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+class Product(StockMixin, db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        # Listing filters combined with the default newest-first order
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+        db.Index('ix_products_category_created_at', 'category', 'created_at'),
+        db.Index('ix_products_is_featured_created_at', 'is_featured', 'created_at'),
+        db.Index('ix_products_is_new_created_at', 'is_new', 'created_at'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(100), nullable=False)
@@ -13,13 +61,26 @@ class Product(db.Model):
     price = db.Column(db.Float, nullable=False)
     discount_price = db.Column(db.Float, nullable=True)
     rating = db.Column(db.Float, default=0.0)
+    # Rating aggregates, kept in step with the ratings table by
+    # apply_rating_change() so reads never have to scan reviews
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_1 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_2 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_3 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_4 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_5 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     image = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text, nullable=False)
     in_stock = db.Column(db.Boolean, default=True)
+    # Units on hand; NULL means stock isn't tracked and in_stock alone decides
+    stock_quantity = db.Column(db.Integer, nullable=True)
     is_new = db.Column(db.Boolean, default=False)
     is_featured = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    # Precomputed JSON of to_dict() for document reads (src/catalog_documents.py)
+    document = db.deferred(db.Column(db.Text, nullable=True))
     
     # Relationships
     images = db.relationship('ProductImage', backref='product', lazy=True, cascade="all, delete-orphan")
@@ -29,55 +90,142 @@ class Product(db.Model):
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
     wishlist_items = db.relationship('WishlistItem', backref='product', lazy=True)
     
-    def to_dict(self):
+    # Serialized fields backed by child tables or large columns; they are only
+    # loaded when a response actually asks for them
+    COLLECTION_FIELDS = ('images', 'features', 'specifications', 'colors')
+    FIELDS = (
+        'id', 'name', 'category', 'price', 'discount_price', 'rating', 'rating_count', 'image',
+        'images', 'description', 'features', 'specifications', 'colors',
+        'in_stock', 'stock_quantity', 'is_new', 'is_featured', 'created_at', 'updated_at'
+    )
+    # Stock changes on every order, so the cached public catalog responses
+    # leave it out; the storefront reads it from /api/inventory/availability
+    STOCK_FIELDS = ('in_stock', 'stock_quantity')
+    CATALOG_FIELDS = (
+        'id', 'name', 'category', 'price', 'discount_price', 'rating', 'rating_count', 'image',
+        'images', 'description', 'features', 'specifications', 'colors',
+        'is_new', 'is_featured', 'created_at', 'updated_at'
+    )
+    
+    @classmethod
+    def catalog_query(cls, fields=None):
+        return cls.query.options(*cls.catalog_options(fields))
+    
+    @classmethod
+    def catalog_options(cls, fields=None):
+        # Load the child collections with one IN query per table instead of
+        # one lazy query per product and relationship
+        options = [
+            selectinload(getattr(cls, name))
+            for name in cls.COLLECTION_FIELDS
+            if fields is None or name in fields
+        ]
+        if fields is not None and 'description' not in fields:
+            options.append(defer(cls.description))
+        return options
+    
+    @classmethod
+    def apply_rating_change(cls, product_id, old_score=None, new_score=None):
+        # Adjust the stored aggregates for one rating insert (old_score=None),
+        # update or delete (new_score=None) with a single atomic UPDATE, so
+        # concurrent ratings never overwrite each other's counts
+        count_delta = (new_score is not None) - (old_score is not None)
+        sum_delta = (new_score or 0) - (old_score or 0)
+        new_count = cls.rating_count + count_delta
+        new_sum = cls.rating_sum + sum_delta
+        
+        values = {
+            'rating_count': new_count,
+            'rating_sum': new_sum,
+            'rating': case(
+                (new_count > 0, func.round(new_sum * 1.0 / new_count, 1)),
+                else_=0.0
+            )
+        }
+        for score, delta in ((old_score, -1), (new_score, 1)):
+            if score is not None:
+                column = getattr(cls, f'rating_{score}')
+                values[column.key] = values.get(column.key, column) + delta
+        
+        db.session.execute(
+            update(cls).where(cls.id == product_id).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+    
+    def rating_summary(self):
+        count = self.rating_count or 0
         return {
+            'average_score': round(self.rating_sum / count, 1) if count else 0,
+            'total_ratings': count,
+            'histogram': {str(score): getattr(self, f'rating_{score}') or 0 for score in range(1, 6)}
+        }
+    
+    def to_dict(self, fields=None, stock=True):
+        data = {
             'id': self.id,
             'name': self.name,
             'category': self.category,
             'price': self.price,
             'discount_price': self.discount_price,
             'rating': self.rating,
+            'rating_count': self.rating_count,
             'image': self.image,
-            'images': [img.url for img in self.images],
-            'description': self.description,
-            'features': [feature.text for feature in self.features],
-            'specifications': {spec.key: spec.value for spec in self.specifications},
-            'colors': [color.name for color in self.colors],
             'in_stock': self.in_stock,
+            'stock_quantity': self.stock_quantity,
             'is_new': self.is_new,
             'is_featured': self.is_featured,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+        
+        if fields is None or 'description' in fields:
+            data['description'] = self.description
+        if fields is None or 'images' in fields:
+            data['images'] = [img.url for img in self.images]
+        if fields is None or 'features' in fields:
+            data['features'] = [feature.text for feature in self.features]
+        if fields is None or 'specifications' in fields:
+            data['specifications'] = {spec.key: spec.value for spec in self.specifications}
+        if fields is None or 'colors' in fields:
+            data['colors'] = [color.name for color in self.colors]
+        
+        if not stock:
+            for field in self.STOCK_FIELDS:
+                del data[field]
+        if fields is not None:
+            data = {key: value for key, value in data.items() if key in fields}
+        return data
 
 class ProductImage(db.Model):
     __tablename__ = 'product_images'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False, index=True)
     url = db.Column(db.String(255), nullable=False)
     
 class ProductFeature(db.Model):
     __tablename__ = 'product_features'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False, index=True)
     text = db.Column(db.String(255), nullable=False)
     
 class ProductSpecification(db.Model):
     __tablename__ = 'product_specifications'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False, index=True)
     key = db.Column(db.String(100), nullable=False)
     value = db.Column(db.String(255), nullable=False)
     
-class ProductColor(db.Model):
+class ProductColor(StockMixin, db.Model):
     __tablename__ = 'product_colors'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False, index=True)
     name = db.Column(db.String(50), nullable=False)
+    # Units of this variant on hand; NULL means only the product's stock counts
+    stock_quantity = db.Column(db.Integer, nullable=True)
     
 class Category(db.Model):
     __tablename__ = 'categories'
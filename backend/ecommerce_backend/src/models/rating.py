@@ -5,26 +5,89 @@ from ..extensions import db
 
 class Rating(db.Model):
     __tablename__ = 'ratings'
+    __table_args__ = (
+        # One rating per user and product; also serves the product's review pages
+        db.Index('ux_ratings_product_id_user_id', 'product_id', 'user_id', unique=True),
+        db.Index('ix_ratings_product_id_created_at', 'product_id', 'created_at'),
+        # Review pages sorted by score or helpfulness
+        db.Index('ix_ratings_product_id_score_created_at', 'product_id', 'score', 'created_at', 'id'),
+        db.Index('ix_ratings_product_id_helpful_count_created_at', 'product_id', 'helpful_count', 'created_at', 'id'),
+        db.Index('ix_ratings_user_id', 'user_id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
     score = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.Text, nullable=True)
+    helpful_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     
     # Relationships
     user = db.relationship('User', backref='ratings')
     
-    def to_dict(self):
+    def to_dict(self, username=None):
+        # Listings pass the username fetched by a join so serializing a page
+        # of reviews doesn't lazy-load one user per rating
         return {
             'id': self.id,
             'product_id': self.product_id,
             'user_id': self.user_id,
-            'username': self.user.username,
+            'username': username if username is not None else self.user.username,
             'score': self.score,
             'comment': self.comment,
+            'helpful_count': self.helpful_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        }
+
+# Lowest-rated review pages: score ascending, newest first within a score
+db.Index('ix_ratings_product_id_score_newest', Rating.product_id, Rating.score, Rating.created_at.desc(), Rating.id.desc())
+
+class RatingHelpfulVote(db.Model):
+    __tablename__ = 'rating_helpful_votes'
+    __table_args__ = (
+        db.UniqueConstraint('rating_id', 'user_id', name='uq_rating_helpful_vote'),
+    )
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    rating_id = db.Column(db.String(36), db.ForeignKey('ratings.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+def recompute_rating_aggregates():
+    # Rebuild every product's rating aggregates from the ratings table with a
+    # single grouped query, then write them back with one executemany UPDATE.
+    # Returns the number of products that have ratings.
+    from sqlalchemy import case, func, update
+    from .product import Product
+
+    histogram = [func.sum(case((Rating.score == score, 1), else_=0)) for score in range(1, 6)]
+    rows = db.session.query(
+        Rating.product_id,
+        func.count(Rating.id),
+        func.sum(Rating.score),
+        *histogram
+    ).group_by(Rating.product_id).all()
+
+    # Products without ratings are reset first
+    db.session.execute(
+        update(Product).values(
+            rating=0.0, rating_count=0, rating_sum=0,
+            rating_1=0, rating_2=0, rating_3=0, rating_4=0, rating_5=0
+        ).execution_options(synchronize_session=False)
+    )
+    if rows:
+        db.session.execute(update(Product), [
+            {
+                'id': product_id,
+                'rating_count': count,
+                'rating_sum': total,
+                'rating': round(total / count, 1),
+                **{f'rating_{score}': int(hist[score - 1]) for score in range(1, 6)}
+            }
+            for product_id, count, total, *hist in rows
+        ])
+    db.session.commit()
+    return len(rows)
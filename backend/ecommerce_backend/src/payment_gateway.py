@@ -0,0 +1,211 @@
+from requests.adapters import HTTPAdapter
+import hashlib
+import json
+import random
+import requests
+import stripe
+import threading
+import time
+import uuid
+from .metrics import Histogram
+
+# Payment gateway used by checkout.
+#
+# Every call goes through PaymentGateway, which records a latency histogram
+# per call and trips a circuit breaker after repeated transport or server
+# failures, so a Stripe outage fails checkouts fast (503) instead of tying up
+# workers until the timeouts. The Stripe backend keeps one keep-alive
+# requests session with explicit connect/read timeouts; the fake backend
+# needs no network, for offline load tests (PAYMENT_GATEWAY=fake).
+
+class GatewayError(Exception):
+    pass
+
+class GatewayUnavailable(GatewayError):
+    pass
+
+class CircuitBreaker:
+    # closed: calls pass. open: calls fail fast until reset_timeout has
+    # passed. half-open: a single trial call decides whether to close again.
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class StripeBackend:
+    def __init__(self, api_key, connect_timeout=3.05, read_timeout=10.0, max_network_retries=2, pool_size=10):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        http_client = stripe.RequestsClient(timeout=(connect_timeout, read_timeout), session=session)
+        self.client = stripe.StripeClient(api_key, http_client=http_client, max_network_retries=max_network_retries)
+
+    def create_payment_intent(self, amount, currency, metadata, idempotency_key):
+        # Newer stripe releases move the services under client.v1
+        service = getattr(self.client, 'v1', self.client).payment_intents
+        intent = service.create(
+            params={
+                'amount': amount,
+                'currency': currency,
+                'automatic_payment_methods': {'enabled': True},
+                'metadata': metadata
+            },
+            options={'idempotency_key': idempotency_key}
+        )
+        return {'id': intent.id, 'client_secret': intent.client_secret, 'amount': intent.amount, 'status': intent.status}
+
+    def is_transient(self, error):
+        # Failures that say something about Stripe's health (as opposed to a
+        # declined card or a bad request) count towards the breaker
+        if isinstance(error, (stripe.error.APIConnectionError, stripe.error.RateLimitError)):
+            return True
+        return isinstance(error, stripe.error.StripeError) and (error.http_status or 500) >= 500
+
+class FakeBackend:
+    # Answers like Stripe without the network. Honours idempotency keys.
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.intents = {}
+        self._lock = threading.Lock()
+
+    def create_payment_intent(self, amount, currency, metadata, idempotency_key):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise GatewayError('Simulated gateway failure')
+        with self._lock:
+            intent = self.intents.get(idempotency_key)
+            if intent is None:
+                intent_id = f'pi_fake_{uuid.uuid4().hex}'
+                intent = {
+                    'id': intent_id,
+                    'client_secret': f'{intent_id}_secret_{uuid.uuid4().hex[:16]}',
+                    'amount': amount,
+                    'currency': currency,
+                    'metadata': metadata,
+                    'status': 'requires_payment_method'
+                }
+                self.intents[idempotency_key] = intent
+            return dict(intent)
+
+    def is_transient(self, error):
+        return True
+
+class PaymentGateway:
+    def __init__(self):
+        self.backend = None
+        self.breaker = CircuitBreaker()
+        self.latency = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app, backend=None):
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(app.config.get('PAYMENT_BREAKER_THRESHOLD', 5)),
+            reset_timeout=float(app.config.get('PAYMENT_BREAKER_RESET', 30))
+        )
+        if backend is None:
+            if app.config.get('PAYMENT_GATEWAY', 'stripe') == 'fake':
+                backend = FakeBackend(latency=float(app.config.get('PAYMENT_FAKE_LATENCY', 0)))
+            else:
+                backend = StripeBackend(
+                    app.config['STRIPE_SECRET_KEY'],
+                    connect_timeout=float(app.config.get('STRIPE_CONNECT_TIMEOUT', 3.05)),
+                    read_timeout=float(app.config.get('STRIPE_READ_TIMEOUT', 10)),
+                    max_network_retries=int(app.config.get('STRIPE_MAX_RETRIES', 2))
+                )
+        self.backend = backend
+
+    def call(self, name, *args, **kwargs):
+        if not self.breaker.allow():
+            raise GatewayUnavailable('Payment service unavailable')
+        with self._lock:
+            histogram = self.latency.setdefault(name, Histogram())
+        started = time.perf_counter()
+        try:
+            result = getattr(self.backend, name)(*args, **kwargs)
+        except (stripe.error.StripeError, GatewayError) as e:
+            with self._lock:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            if self.backend.is_transient(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise GatewayError(getattr(e, 'user_message', None) or str(e)) from e
+        except Exception:
+            # Anything unexpected counts as a failure too, and ends a trial
+            # call so the breaker isn't left half-open for good
+            with self._lock:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            self.breaker.record_failure()
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started)
+        self.breaker.record_success()
+        return result
+
+    def create_payment_intent(self, amount, currency, metadata, idempotency_key):
+        return self.call('create_payment_intent', amount, currency, metadata, idempotency_key)
+
+    def stats(self):
+        with self._lock:
+            latency = dict(self.latency)
+            errors = dict(self.errors)
+        return {
+            'backend': type(self.backend).__name__,
+            'breaker': self.breaker.state,
+            'calls': {
+                name: dict(histogram.snapshot(), errors=errors.get(name, 0))
+                for name, histogram in latency.items()
+            }
+        }
+
+payment_gateway = PaymentGateway()
+
+def cart_idempotency_key(user_id, items, amount, checkout_id=None):
+    # The same cart submitted twice (double click, client retry) maps to the
+    # same PaymentIntent. A reservation id makes each checkout distinct;
+    # without one, the key changes every 10 minutes so a paid cart can be
+    # bought again later.
+    cart = sorted(
+        (str(item.get('product_id')), str(item.get('color') or ''), str(item.get('quantity')))
+        for item in items if isinstance(item, dict)
+    )
+    scope = checkout_id or int(time.time() // 600)
+    canonical = json.dumps([user_id, amount, cart, scope], separators=(',', ':'))
+    return 'checkout-' + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
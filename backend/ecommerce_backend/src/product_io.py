@@ -0,0 +1,350 @@
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import SQLAlchemyError
+import csv
+import datetime
+import json
+import uuid
+from .extensions import db
+from .models import Product, ProductImage, ProductFeature, ProductSpecification, ProductColor
+from .search import search_index
+from .catalog_documents import store_documents
+
+# Bulk product import/export for supplier feeds.
+#
+# Rows use the same keys as Product.to_dict(). In NDJSON every line is one
+# product object. In CSV the list columns (images, features, colors) are
+# separated by '|' and specifications is a JSON object. A row with an `id`
+# that already exists updates that product (child collections present in the
+# row replace the stored ones); any other row creates a new product.
+#
+# A color is a name, or {"name", "stock_quantity"} for a variant with its own
+# stock ("name:quantity" in CSV); exports write variants that way, so they
+# import back unchanged. Replacing a product's colors keeps the stored stock
+# of variants named again without a stock_quantity.
+
+REQUIRED_FIELDS = ('name', 'category', 'price', 'image', 'description')
+SCALAR_FIELDS = (
+    'name', 'category', 'price', 'discount_price', 'image', 'description',
+    'in_stock', 'stock_quantity', 'is_new', 'is_featured'
+)
+BOOLEAN_FIELDS = ('in_stock', 'is_new', 'is_featured')
+LIST_FIELDS = ('images', 'features', 'colors')
+MAX_LENGTHS = {'name': 100, 'category': 50, 'image': 255}
+
+EXPORT_COLUMNS = (
+    'id', 'name', 'category', 'price', 'discount_price', 'rating', 'image', 'description',
+    'in_stock', 'stock_quantity', 'is_new', 'is_featured', 'images', 'features', 'specifications', 'colors',
+    'created_at', 'updated_at'
+)
+
+# child table, row key, value columns
+CHILD_TABLES = (
+    (ProductImage, 'images', lambda value: {'url': value}),
+    (ProductFeature, 'features', lambda value: {'text': value}),
+    (ProductSpecification, 'specifications', lambda item: {'key': item[0], 'value': item[1]}),
+    (ProductColor, 'colors', lambda color: {'name': color['name'], 'stock_quantity': color['stock_quantity']})
+)
+
+MAX_REPORTED_ERRORS = 1000
+
+class RowError(ValueError):
+    pass
+
+def read_ndjson(stream):
+    # Yields (line number, record, error) from a text stream
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, 'Expected a JSON object'
+            continue
+        yield line_no, record, None
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for raw in reader:
+        record = {key: value for key, value in raw.items() if key and value not in (None, '')}
+        try:
+            for field in LIST_FIELDS:
+                if field in record:
+                    record[field] = [item.strip() for item in record[field].split('|') if item.strip()]
+            if 'colors' in record:
+                record['colors'] = [csv_color(item) for item in record['colors']]
+            if 'specifications' in record:
+                record['specifications'] = json.loads(record['specifications'])
+        except ValueError as e:
+            yield reader.line_num, None, f'Invalid specifications JSON: {e}'
+            continue
+        yield reader.line_num, record, None
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in ('true', '1', 'yes', 'y'):
+        return True
+    if text in ('false', '0', 'no', 'n'):
+        return False
+    raise RowError(f'Invalid boolean: {value}')
+
+def parse_price(field, value):
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{field} must be a number')
+    if price < 0:
+        raise RowError(f'{field} must not be negative')
+    return price
+
+def parse_quantity(value):
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        raise RowError('stock_quantity must be an integer')
+    if isinstance(value, float) and value != quantity:
+        raise RowError('stock_quantity must be an integer')
+    if quantity < 0:
+        raise RowError('stock_quantity must not be negative')
+    return quantity
+
+def csv_color(item):
+    # "name:quantity" -> a variant with its own stock; anything else is a name
+    name, _, quantity = item.rpartition(':')
+    if name.strip() and quantity.strip().isdigit():
+        return {'name': name.strip(), 'stock_quantity': int(quantity)}
+    return item
+
+def parse_color(value):
+    # A color name or {'name', 'stock_quantity'?} -> {'name'}, plus
+    # 'stock_quantity' when the entry sets it
+    if isinstance(value, dict):
+        if value.get('name') in (None, ''):
+            raise RowError('Every color needs a name')
+        color = {'name': str(value['name'])}
+        if 'stock_quantity' in value:
+            quantity = value['stock_quantity']
+            color['stock_quantity'] = None if quantity in (None, '') else parse_quantity(quantity)
+    else:
+        color = {'name': str(value)}
+    if len(color['name']) > 50:
+        raise RowError('Color names are at most 50 characters')
+    return color
+
+def variant_stock(product_ids):
+    # {(product_id, color name): stock_quantity} of the stored variants that
+    # track their own stock, to keep it when the colors are replaced
+    if not product_ids:
+        return {}
+    return {
+        (row.product_id, row.name): row.stock_quantity
+        for row in db.session.query(ProductColor.product_id, ProductColor.name, ProductColor.stock_quantity).filter(
+            ProductColor.product_id.in_(list(product_ids)), ProductColor.stock_quantity.isnot(None)
+        )
+    }
+
+def resolve_colors(product_id, colors, stock):
+    # Fill in stock_quantity for parsed colors that don't set it
+    return [
+        dict(color, stock_quantity=color['stock_quantity'] if 'stock_quantity' in color else stock.get((product_id, color['name'])))
+        for color in colors
+    ]
+
+def export_color(color):
+    # A ProductColor in the form parse_color() reads back
+    if color.stock_quantity is None:
+        return color.name
+    return {'name': color.name, 'stock_quantity': color.stock_quantity}
+
+def validate_row(record, existing=False):
+    # Returns a cleaned copy of the record or raises RowError. Updates of an
+    # existing product only need the fields they change.
+    if not existing:
+        for field in REQUIRED_FIELDS:
+            if record.get(field) in (None, ''):
+                raise RowError(f'Missing required field: {field}')
+
+    clean = {}
+    if record.get('id'):
+        clean['id'] = str(record['id'])
+    for field in SCALAR_FIELDS:
+        if field not in record:
+            continue
+        value = record[field]
+        if field == 'price':
+            value = parse_price(field, value)
+        elif field == 'discount_price':
+            value = None if value in (None, '') else parse_price(field, value)
+        elif field == 'stock_quantity':
+            value = None if value in (None, '') else parse_quantity(value)
+        elif field in BOOLEAN_FIELDS:
+            value = parse_bool(value)
+        else:
+            value = str(value)
+            if field in MAX_LENGTHS and len(value) > MAX_LENGTHS[field]:
+                raise RowError(f'{field} is longer than {MAX_LENGTHS[field]} characters')
+        clean[field] = value
+    if clean.get('stock_quantity') is not None:
+        clean['in_stock'] = clean['stock_quantity'] > 0
+
+    for field in LIST_FIELDS:
+        if field in record:
+            if not isinstance(record[field], list):
+                raise RowError(f'{field} must be a list')
+            if field == 'colors':
+                clean[field] = [parse_color(value) for value in record[field]]
+            else:
+                clean[field] = [str(value) for value in record[field]]
+    if 'specifications' in record:
+        if not isinstance(record['specifications'], dict):
+            raise RowError('specifications must be an object')
+        clean['specifications'] = {str(key): str(value) for key, value in record['specifications'].items()}
+    return clean
+
+def write_batch(batch):
+    # Upsert a batch of (line number, record) pairs in one transaction.
+    # Returns (created, updated, errors).
+    ids = [record['id'] for _, record in batch if record.get('id')]
+    existing = set()
+    if ids:
+        existing = {product_id for (product_id,) in db.session.query(Product.id).filter(Product.id.in_(ids))}
+
+    now = datetime.datetime.utcnow()
+    inserts, updates, rows, errors = [], [], [], []
+    seen = set()
+    for line_no, record in batch:
+        is_update = record.get('id') in existing
+        try:
+            clean = validate_row(record, existing=is_update)
+            if clean.get('id') in seen:
+                raise RowError(f'Duplicate id in batch: {clean["id"]}')
+        except RowError as e:
+            errors.append({'line': line_no, 'error': str(e)})
+            continue
+
+        values = {field: clean[field] for field in SCALAR_FIELDS if field in clean}
+        values['updated_at'] = now
+        if is_update:
+            values['id'] = clean['id']
+            updates.append(values)
+        else:
+            values['id'] = clean.get('id') or str(uuid.uuid4())
+            values.setdefault('in_stock', True)
+            values.setdefault('is_new', False)
+            values.setdefault('is_featured', False)
+            values['created_at'] = now
+            inserts.append(values)
+        clean['id'] = values['id']
+        seen.add(clean['id'])
+        rows.append((clean, is_update))
+
+    if inserts:
+        db.session.execute(insert(Product), inserts)
+    if updates:
+        db.session.execute(update(Product), updates)
+
+    # Child collections: clear the ones an update replaces, then insert all
+    # child rows of the batch with one executemany per table. Variant stock
+    # is read before the colors are cleared.
+    stock = variant_stock([clean['id'] for clean, is_update in rows if is_update and 'colors' in clean])
+    for clean, _ in rows:
+        if 'colors' in clean:
+            clean['colors'] = resolve_colors(clean['id'], clean['colors'], stock)
+    for model, key, columns in CHILD_TABLES:
+        replaced = [clean['id'] for clean, is_update in rows if is_update and key in clean]
+        if replaced:
+            db.session.execute(
+                delete(model).where(model.product_id.in_(replaced))
+                .execution_options(synchronize_session=False)
+            )
+        children = []
+        for clean, _ in rows:
+            values = clean.get(key)
+            if not values:
+                continue
+            items = values.items() if isinstance(values, dict) else values
+            for item in items:
+                children.append(dict(columns(item), id=str(uuid.uuid4()), product_id=clean['id']))
+        if children:
+            db.session.execute(insert(model), children)
+
+    if rows:
+        batch_ids = [clean['id'] for clean, _ in rows]
+        products = Product.catalog_query().filter(Product.id.in_(batch_ids)).all()
+        search_index.index_products(products)
+        store_documents(products)
+
+    db.session.commit()
+    created = sum(1 for _, is_update in rows if not is_update)
+    return created, len(rows) - created, errors
+
+def import_products(records, batch_size=500):
+    # records yields (line number, record, error) as produced by read_ndjson()
+    # and read_csv(). A failing row is reported and skipped; it never aborts
+    # the rest of the import.
+    result = {'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+
+    def report(errors):
+        result['failed'] += len(errors)
+        room = MAX_REPORTED_ERRORS - len(result['errors'])
+        result['errors'].extend(errors[:max(room, 0)])
+
+    def flush(batch):
+        try:
+            created, updated, errors = write_batch(batch)
+        except SQLAlchemyError:
+            db.session.rollback()
+            # Retry row by row to isolate the rows the database rejects
+            created, updated, errors = 0, 0, []
+            for line_no, record in batch:
+                try:
+                    row_created, row_updated, row_errors = write_batch([(line_no, record)])
+                except SQLAlchemyError as e:
+                    db.session.rollback()
+                    errors.append({'line': line_no, 'error': str(e.orig if hasattr(e, 'orig') else e)})
+                    continue
+                created += row_created
+                updated += row_updated
+                errors.extend(row_errors)
+        result['created'] += created
+        result['updated'] += updated
+        report(errors)
+
+    batch = []
+    for line_no, record, error in records:
+        if error:
+            report([{'line': line_no, 'error': error}])
+            continue
+        batch.append((line_no, record))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    result['errors_truncated'] = result['failed'] > len(result['errors'])
+    return result
+
+def export_rows(fmt='ndjson', batch_size=500):
+    # Streams every product as a dict, batch_size rows (plus one IN query per
+    # child table) at a time
+    query = Product.catalog_query().order_by(Product.id).yield_per(batch_size)
+    for product in query:
+        row = product.to_dict()
+        row['colors'] = [export_color(color) for color in product.colors]
+        if fmt == 'csv':
+            row['colors'] = [
+                color if isinstance(color, str) else f"{color['name']}:{color['stock_quantity']}"
+                for color in row['colors']
+            ]
+            for field in LIST_FIELDS:
+                row[field] = '|'.join(row[field])
+            row['specifications'] = json.dumps(row['specifications'])
+        yield row
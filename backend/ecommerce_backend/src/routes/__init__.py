@@ -5,3 +5,5 @@ from .order import order_bp
 from .payment import payment_bp
 from .rating import rating_bp
 from .product import product_bp
+from .inventory import inventory_bp
+from .cart import cart_bp
@@ -1,24 +1,38 @@
 from flask import Blueprint, request, jsonify
 from src.models import Product, ProductImage, ProductFeature, ProductSpecification, ProductColor, Category, db
-from src.routes.auth import token_required
+from src.models import Order, OrderItem, OrderDailyStat, User, StripeEvent
+from src.product_io import (
+    read_csv, read_ndjson, import_products, export_rows, parse_color, resolve_colors, variant_stock, RowError, EXPORT_COLUMNS
+)
+from src.streaming import stream_export
+from sqlalchemy import func
+import datetime
+import io
+from src.routes.decorators import admin_required, identity_cache
+from src.search import search_index
+from src.catalog_documents import store_document
+from src.cache import response_cache
+from src.compression import compressor
+from src.instrumentation import instrumentation
+from src.routes.inventory import invalidate_availability
+from src import webhooks
+from src.payment_gateway import payment_gateway
 
 admin_bp = Blueprint('admin', __name__)
 
-# Admin-only decorator
-def admin_required(f):
-    @token_required
-    def decorated(current_user, *args, **kwargs):
-        if not current_user.is_admin():
-            return jsonify({'message': 'Admin privileges required!'}), 403
-        return f(current_user, *args, **kwargs)
-    decorated.__name__ = f.__name__
-    return decorated
+def parse_colors(data):
+    # Colors are names, or {'name': ..., 'stock_quantity': ...} for variants
+    # with their own stock. None when the request doesn't set them; raises
+    # RowError.
+    if 'colors' not in data or not isinstance(data['colors'], list):
+        return None
+    return [parse_color(entry) for entry in data['colors']]
 
 # Product Management
 @admin_bp.route('/products', methods=['GET'])
 @admin_required
 def get_all_products(current_user):
-    products = Product.query.all()
+    products = Product.catalog_query().all()
     return jsonify({
         'products': [product.to_dict() for product in products]
     }), 200
@@ -26,7 +40,7 @@ def get_all_products(current_user):
 @admin_bp.route('/products/<product_id>', methods=['GET'])
 @admin_required
 def get_product(current_user, product_id):
-    product = Product.query.filter_by(id=product_id).first()
+    product = Product.catalog_query().filter_by(id=product_id).first()
     if not product:
         return jsonify({'message': 'Product not found!'}), 404
     
@@ -44,6 +58,10 @@ def create_product(current_user):
     for field in required_fields:
         if field not in data:
             return jsonify({'message': f'Missing required field: {field}'}), 400
+    try:
+        colors = parse_colors(data)
+    except RowError as e:
+        return jsonify({'message': str(e)}), 400
     
     # Create new product
     new_product = Product(
@@ -53,7 +71,8 @@ def create_product(current_user):
         discount_price=data.get('discount_price'),
         image=data['image'],
         description=data['description'],
-        in_stock=data.get('in_stock', True),
+        in_stock=data.get('in_stock', True) if data.get('stock_quantity') is None else data['stock_quantity'] > 0,
+        stock_quantity=data.get('stock_quantity'),
         is_new=data.get('is_new', False),
         is_featured=data.get('is_featured', False)
     )
@@ -80,12 +99,14 @@ def create_product(current_user):
             db.session.add(product_spec)
     
     # Add colors
-    if 'colors' in data and isinstance(data['colors'], list):
-        for color_name in data['colors']:
-            product_color = ProductColor(product_id=new_product.id, name=color_name)
-            db.session.add(product_color)
+    if colors is not None:
+        for color in resolve_colors(new_product.id, colors, {}):
+            db.session.add(ProductColor(product_id=new_product.id, **color))
     
+    store_document(new_product)
+    search_index.index_product(new_product)
     db.session.commit()
+    response_cache.bump_catalog_version()
     
     return jsonify({
         'message': 'Product created successfully!',
@@ -100,6 +121,10 @@ def update_product(current_user, product_id):
         return jsonify({'message': 'Product not found!'}), 404
     
     data = request.get_json()
+    try:
+        colors = parse_colors(data)
+    except RowError as e:
+        return jsonify({'message': str(e)}), 400
     
     # Update basic product fields
     if 'name' in data:
@@ -116,6 +141,11 @@ def update_product(current_user, product_id):
         product.description = data['description']
     if 'in_stock' in data:
         product.in_stock = data['in_stock']
+    if 'stock_quantity' in data:
+        # None stops tracking; a count also drives in_stock
+        product.stock_quantity = data['stock_quantity']
+        if product.stock_quantity is not None:
+            product.in_stock = product.stock_quantity > 0
     if 'is_new' in data:
         product.is_new = data['is_new']
     if 'is_featured' in data:
@@ -152,16 +182,22 @@ def update_product(current_user, product_id):
             db.session.add(product_spec)
     
     # Update colors
-    if 'colors' in data and isinstance(data['colors'], list):
+    if colors is not None:
+        # Variants named again without a stock_quantity keep their stock
+        stock = variant_stock([product.id])
+        
         # Remove existing colors
         ProductColor.query.filter_by(product_id=product.id).delete()
         
         # Add new colors
-        for color_name in data['colors']:
-            product_color = ProductColor(product_id=product.id, name=color_name)
-            db.session.add(product_color)
+        for color in resolve_colors(product.id, colors, stock):
+            db.session.add(ProductColor(product_id=product.id, **color))
     
+    store_document(product)
+    search_index.index_product(product)
     db.session.commit()
+    response_cache.bump_catalog_version()
+    invalidate_availability([product.id])
     
     return jsonify({
         'message': 'Product updated successfully!',
@@ -175,13 +211,51 @@ def delete_product(current_user, product_id):
     if not product:
         return jsonify({'message': 'Product not found!'}), 404
     
+    search_index.remove_product(product.id)
     db.session.delete(product)
     db.session.commit()
+    response_cache.bump_catalog_version()
+    invalidate_availability([product_id])
     
     return jsonify({
         'message': 'Product deleted successfully!'
     }), 200
 
+# Bulk import/export
+@admin_bp.route('/products/import', methods=['POST'])
+@admin_required
+def import_products_bulk(current_user):
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'message': 'format must be ndjson or csv!'}), 400
+    
+    try:
+        batch_size = min(max(int(request.args.get('batch_size', 500)), 1), 5000)
+    except ValueError:
+        return jsonify({'message': 'batch_size must be an integer!'}), 400
+    
+    # Read the body as a stream instead of loading the whole feed
+    stream = io.TextIOWrapper(io.BufferedReader(request.stream), encoding='utf-8', newline='')
+    records = read_csv(stream) if fmt == 'csv' else read_ndjson(stream)
+    result = import_products(records, batch_size=batch_size)
+    response_cache.bump_catalog_version()
+    
+    return jsonify({
+        'message': 'Import finished!',
+        **result
+    }), 200
+
+@admin_bp.route('/products/export', methods=['GET'])
+@admin_required
+def export_products_bulk(current_user):
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'message': 'format must be ndjson or csv!'}), 400
+    
+    return stream_export(export_rows(fmt), fmt, 'products', columns=EXPORT_COLUMNS)
+
 # Category Management
 @admin_bp.route('/categories', methods=['GET'])
 @admin_required
@@ -211,6 +285,7 @@ def create_category(current_user):
     
     db.session.add(new_category)
     db.session.commit()
+    response_cache.bump_catalog_version()
     
     return jsonify({
         'message': 'Category created successfully!',
@@ -234,6 +309,7 @@ def update_category(current_user, category_id):
         category.description = data['description']
     
     db.session.commit()
+    response_cache.bump_catalog_version()
     
     return jsonify({
         'message': 'Category updated successfully!',
@@ -249,7 +325,163 @@ def delete_category(current_user, category_id):
     
     db.session.delete(category)
     db.session.commit()
+    response_cache.bump_catalog_version()
     
     return jsonify({
         'message': 'Category deleted successfully!'
     }), 200
+
+# Analytics
+# Order statuses that don't count towards revenue
+NON_REVENUE_STATUSES = ('cancelled',)
+
+@admin_bp.route('/analytics', methods=['GET'])
+@admin_required
+def get_analytics(current_user):
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), 366)
+    except ValueError:
+        return jsonify({'message': 'days must be an integer!'}), 400
+    
+    today = datetime.datetime.utcnow().date()
+    start = today - datetime.timedelta(days=days - 1)
+    start_at = datetime.datetime.combine(start, datetime.time.min)
+    counted = OrderDailyStat.status.notin_(NON_REVENUE_STATUSES)
+    
+    # Everything order-related comes from the daily rollup, whose size
+    # depends on the number of days rather than the number of orders
+    daily = db.session.query(
+        OrderDailyStat.day,
+        func.sum(OrderDailyStat.order_count),
+        func.sum(OrderDailyStat.revenue)
+    ).filter(OrderDailyStat.day >= start, counted) \
+        .group_by(OrderDailyStat.day).order_by(OrderDailyStat.day).all()
+    
+    by_status = db.session.query(
+        OrderDailyStat.status,
+        func.sum(OrderDailyStat.order_count),
+        func.sum(OrderDailyStat.revenue)
+    ).filter(OrderDailyStat.day >= start) \
+        .group_by(OrderDailyStat.status).all()
+    
+    all_time_orders, all_time_revenue = db.session.query(
+        func.sum(OrderDailyStat.order_count),
+        func.sum(OrderDailyStat.revenue)
+    ).filter(counted).one()
+    
+    period_orders = sum(int(count or 0) for _, count, _ in daily)
+    period_revenue = sum(float(revenue or 0.0) for _, _, revenue in daily)
+    
+    # Top products and new users only look at the requested window
+    top_products = db.session.query(
+        OrderItem.product_id,
+        Product.name,
+        func.sum(OrderItem.quantity),
+        func.sum(OrderItem.quantity * OrderItem.price)
+    ).join(Order, Order.id == OrderItem.order_id) \
+        .outerjoin(Product, Product.id == OrderItem.product_id) \
+        .filter(Order.created_at >= start_at, Order.status.notin_(NON_REVENUE_STATUSES)) \
+        .group_by(OrderItem.product_id, Product.name) \
+        .order_by(func.sum(OrderItem.quantity * OrderItem.price).desc()) \
+        .limit(5).all()
+    
+    signup_day = func.date(User.created_at)
+    new_users = db.session.query(signup_day, func.count(User.id)) \
+        .filter(User.created_at >= start_at) \
+        .group_by(signup_day).order_by(signup_day).all()
+    
+    recent_orders = db.session.query(Order.id, Order.total_amount, Order.status, Order.created_at, User.username) \
+        .outerjoin(User, User.id == Order.user_id) \
+        .order_by(Order.created_at.desc()).limit(5).all()
+    
+    return jsonify({
+        'period': {'start': start.isoformat(), 'end': today.isoformat(), 'days': days},
+        'totals': {
+            'users': User.query.count(),
+            'products': Product.query.count(),
+            'orders': int(all_time_orders or 0),
+            'revenue': round(float(all_time_revenue or 0.0), 2)
+        },
+        'period_totals': {
+            'orders': period_orders,
+            'revenue': round(period_revenue, 2),
+            'average_order_value': round(period_revenue / period_orders, 2) if period_orders else 0.0,
+            'new_users': sum(count for _, count in new_users)
+        },
+        'daily': [
+            {'day': str(day), 'orders': int(count or 0), 'revenue': round(float(revenue or 0.0), 2)}
+            for day, count, revenue in daily
+        ],
+        'orders_by_status': {
+            status: {'orders': int(count or 0), 'revenue': round(float(revenue or 0.0), 2)}
+            for status, count, revenue in by_status
+        },
+        'top_products': [
+            {'product_id': product_id, 'name': name, 'quantity': int(quantity or 0), 'revenue': round(float(revenue or 0.0), 2)}
+            for product_id, name, quantity, revenue in top_products
+        ],
+        'new_users': [{'day': str(day), 'users': count} for day, count in new_users],
+        'recent_orders': [
+            {
+                'id': order_id,
+                'user': username,
+                'amount': amount,
+                'status': status,
+                'created_at': created_at.isoformat() if created_at else None
+            }
+            for order_id, amount, status, created_at, username in recent_orders
+        ]
+    }), 200
+
+# System
+@admin_bp.route('/auth-cache', methods=['GET'])
+@admin_required
+def get_auth_cache_stats(current_user):
+    return jsonify({
+        'auth_cache': identity_cache.stats()
+    }), 200
+
+@admin_bp.route('/response-cache', methods=['GET'])
+@admin_required
+def get_response_cache_stats(current_user):
+    return jsonify({
+        'response_cache': response_cache.stats(),
+        'compression': compressor.stats()
+    }), 200
+
+@admin_bp.route('/slow-requests', methods=['GET'])
+@admin_required
+def get_slow_requests(current_user):
+    # Most recent first
+    return jsonify({
+        'threshold_seconds': instrumentation.slow_seconds,
+        'slow_requests': instrumentation.slow_log()[::-1]
+    }), 200
+
+@admin_bp.route('/payment-gateway', methods=['GET'])
+@admin_required
+def get_payment_gateway_stats(current_user):
+    return jsonify({
+        'payment_gateway': payment_gateway.stats()
+    }), 200
+
+# Stripe webhook inbox
+@admin_bp.route('/webhook-events', methods=['GET'])
+@admin_required
+def get_webhook_events(current_user):
+    status = request.args.get('status', 'dead')
+    events = StripeEvent.query.filter_by(status=status).order_by(StripeEvent.received_at.desc()).limit(100).all()
+    return jsonify({
+        'counts': webhooks.stats(),
+        'events': [event.to_dict() for event in events]
+    }), 200
+
+@admin_bp.route('/webhook-events/<event_id>/retry', methods=['POST'])
+@admin_required
+def retry_webhook_event(current_user, event_id):
+    if not webhooks.requeue([event_id]):
+        return jsonify({'message': 'No dead event with that id!'}), 404
+    
+    return jsonify({
+        'message': 'Event requeued!'
+    }), 200
@@ -1,16 +1,12 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from src.models import User, db
-from src.routes.decorators import token_required, admin_required
+from src.routes.decorators import token_required, admin_required, identity_cache, SECRET_KEY
 import jwt
 import datetime
-import os
 
 auth_bp = Blueprint('auth', __name__)
 
-# Secret key for JWT
-SECRET_KEY = os.environ.get('SECRET_KEY', 'dev_secret_key')
-
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -66,19 +62,19 @@ def login():
     user = User.query.filter_by(username=username).first()
     
     # Debug logging
-    print(f"Login attempt - Username: '{username}', User found: {user is not None}")
+    current_app.logger.debug("Login attempt - Username: '%s', User found: %s", username, user is not None)
     
     # Check if user exists
     if not user:
-        print(f"Login failed - User not found: '{username}'")
+        current_app.logger.debug("Login failed - User not found: '%s'", username)
         return jsonify({'message': 'Invalid username or password!'}), 401
     
     # Check if password is correct
     password_correct = user.check_password(data['password'])
-    print(f"Login attempt - Password check result: {password_correct}")
+    current_app.logger.debug("Login attempt - Password check result: %s", password_correct)
     
     if not password_correct:
-        print(f"Login failed - Incorrect password for user: '{username}'")
+        current_app.logger.debug("Login failed - Incorrect password for user: '%s'", username)
         return jsonify({'message': 'Invalid username or password!'}), 401
     
     # Generate JWT token
@@ -99,7 +95,7 @@ def login():
 @token_required
 def get_profile(current_user):
     return jsonify({
-        'user': current_user.to_dict()
+        'user': current_user.profile
     }), 200
 
 @auth_bp.route('/profile', methods=['PUT'])
@@ -120,6 +116,7 @@ def update_profile(current_user):
         current_user.set_password(data['password'])
     
     db.session.commit()
+    identity_cache.invalidate_user(current_user.id)
     
     return jsonify({
         'message': 'Profile updated successfully!',
@@ -129,7 +126,8 @@ def update_profile(current_user):
 @auth_bp.route('/check-auth', methods=['GET'])
 @token_required
 def check_auth(current_user):
+    # From the identity cache: no database read on a cache hit
     return jsonify({
         'authenticated': True,
-        'user': current_user.to_dict()
+        'user': current_user.profile
     }), 200
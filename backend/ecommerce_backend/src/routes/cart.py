@@ -0,0 +1,237 @@
+from flask import Blueprint, request, jsonify
+from src.models import Product, ProductColor, Order, CartItem, OrderError, InsufficientStock, db
+from src.routes.inventory import availability, invalidate_availability
+from src.routes.auth import token_required
+from src.cart_store import cart_store, CartError, MAX_LINE_QUANTITY, MAX_LINES
+
+cart_bp = Blueprint('cart', __name__)
+
+# Changes answer with the cart's lines straight from the cart store; GET (and
+# checkout) reprice every line against the catalog.
+
+def cart_lines(lines):
+    return {
+        'items': [
+            {'product_id': product_id, 'color': color or None, 'quantity': quantity}
+            for (product_id, color), quantity in lines.items()
+        ],
+        'total_items': sum(lines.values())
+    }
+
+def price_cart(lines):
+    # Current price and stock for every line, from one products/colours query
+    product_ids = list({product_id for product_id, _ in lines})
+    products, colors = {}, {}
+    if product_ids:
+        rows = db.session.query(
+            Product.id, Product.name, Product.image, Product.price, Product.discount_price,
+            Product.in_stock, Product.stock_quantity,
+            ProductColor.name.label('color'), ProductColor.stock_quantity.label('color_stock')
+        ).outerjoin(ProductColor, ProductColor.product_id == Product.id).filter(Product.id.in_(product_ids))
+        for row in rows:
+            products[row.id] = row
+            if row.color is not None:
+                colors[(row.id, row.color)] = row.color_stock
+
+    items = []
+    subtotal = 0.0
+    for (product_id, color), quantity in lines.items():
+        product = products.get(product_id)
+        item = {'product_id': product_id, 'color': color or None, 'quantity': quantity, 'issues': []}
+        if product is None:
+            item['issues'].append('unavailable')
+            items.append(item)
+            continue
+
+        unit_price = product.discount_price if product.discount_price is not None else product.price
+        item.update({
+            'name': product.name,
+            'image': product.image,
+            'unit_price': unit_price,
+            'line_total': round(unit_price * quantity, 2)
+        })
+        subtotal += unit_price * quantity
+
+        stock = product.stock_quantity
+        if color:
+            if (product_id, color) not in colors:
+                item['issues'].append('unknown_color')
+            elif colors[(product_id, color)] is not None:
+                stock = colors[(product_id, color)] if stock is None else min(stock, colors[(product_id, color)])
+        if (product.stock_quantity is None and product.in_stock is False) or stock == 0:
+            item['issues'].append('out_of_stock')
+        elif stock is not None and stock < quantity:
+            item['issues'].append('insufficient_stock')
+            item['available_quantity'] = stock
+        items.append(item)
+
+    return {
+        'items': items,
+        'total_items': sum(lines.values()),
+        'subtotal': round(subtotal, 2),
+        'ready': bool(items) and not any(item['issues'] for item in items)
+    }
+
+def parse_item(data, minimum=1):
+    # (product_id, color, quantity) from a request body, checked against the
+    # cached availability summary rather than the products table
+    if not data.get('product_id'):
+        raise CartError('Missing required field: product_id')
+    quantity = data.get('quantity', 1)
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < minimum:
+        raise CartError(f'quantity must be an integer of at least {minimum}')
+    product_id = str(data['product_id'])
+    color = str(data['color']) if data.get('color') else None
+
+    summary = availability([product_id]).get(product_id)
+    if summary is None:
+        raise LookupError('Product not found!')
+    if color and color not in {variant['color'] for variant in summary['variants']}:
+        raise CartError(f'Unknown color: {color}')
+    return product_id, color, min(quantity, MAX_LINE_QUANTITY)
+
+@cart_bp.route('/', methods=['GET'])
+@token_required
+def get_cart(current_user):
+    return jsonify({
+        'cart': price_cart(cart_store.lines(current_user.id))
+    }), 200
+
+@cart_bp.route('/items', methods=['POST'])
+@token_required
+def add_item(current_user):
+    try:
+        product_id, color, quantity = parse_item(request.get_json() or {})
+        cart_store.add(current_user.id, product_id, color, quantity)
+    except LookupError as e:
+        return jsonify({'message': str(e)}), 404
+    except CartError as e:
+        return jsonify({'message': str(e)}), 400
+
+    return jsonify({
+        'message': 'Item added to cart!',
+        'cart': cart_lines(cart_store.lines(current_user.id))
+    }), 200
+
+@cart_bp.route('/items', methods=['PUT'])
+@token_required
+def update_item(current_user):
+    # quantity 0 removes the line
+    try:
+        product_id, color, quantity = parse_item(request.get_json() or {}, minimum=0)
+        cart_store.set_quantity(current_user.id, product_id, color, quantity)
+    except LookupError as e:
+        return jsonify({'message': str(e)}), 404
+    except CartError as e:
+        return jsonify({'message': str(e)}), 400
+
+    return jsonify({
+        'message': 'Cart updated!',
+        'cart': cart_lines(cart_store.lines(current_user.id))
+    }), 200
+
+@cart_bp.route('/items/<product_id>', methods=['DELETE'])
+@token_required
+def remove_item(current_user, product_id):
+    cart_store.remove(current_user.id, product_id, request.args.get('color'))
+    return jsonify({
+        'message': 'Item removed from cart!',
+        'cart': cart_lines(cart_store.lines(current_user.id))
+    }), 200
+
+@cart_bp.route('/', methods=['DELETE'])
+@token_required
+def clear_cart(current_user):
+    cart_store.clear(current_user.id)
+    return jsonify({
+        'message': 'Cart cleared!'
+    }), 200
+
+@cart_bp.route('/merge', methods=['POST'])
+@token_required
+def merge_cart(current_user):
+    # Called after login with the cart kept in the browser while logged out.
+    # Lines for products that no longer exist are skipped.
+    data = request.get_json() or {}
+    items = data.get('items')
+    if not isinstance(items, list):
+        return jsonify({'message': 'Missing required field: items'}), 400
+    if len(items) > MAX_LINES:
+        return jsonify({'message': f'A cart holds at most {MAX_LINES} items'}), 400
+
+    lines = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get('product_id'):
+            return jsonify({'message': 'Every item needs a product_id'}), 400
+        quantity = item.get('quantity', 1)
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+            return jsonify({'message': 'quantity must be a positive integer'}), 400
+        lines.append((str(item['product_id']), str(item['color']) if item.get('color') else None, quantity))
+
+    summaries = availability(list({product_id for product_id, _, _ in lines}))
+    known = [line for line in lines if line[0] in summaries]
+    try:
+        cart_store.merge(current_user.id, known)
+    except CartError as e:
+        return jsonify({'message': str(e)}), 400
+
+    return jsonify({
+        'message': 'Cart merged!',
+        'skipped': sorted({product_id for product_id, _, _ in lines if product_id not in summaries}),
+        'cart': price_cart(cart_store.lines(current_user.id))
+    }), 200
+
+@cart_bp.route('/checkout', methods=['POST'])
+@token_required
+def checkout(current_user):
+    data = request.get_json() or {}
+    required_fields = ['shipping_address', 'billing_address', 'payment_method']
+    for field in required_fields:
+        if field not in data:
+            return jsonify({'message': f'Missing required field: {field}'}), 400
+
+    lines = cart_store.lines(current_user.id)
+    if not lines:
+        return jsonify({'message': 'Cart is empty!'}), 400
+
+    # The total shown to the customer must still be the total charged
+    if data.get('expected_total') is not None:
+        try:
+            expected_total = round(float(data['expected_total']), 2)
+        except (TypeError, ValueError):
+            return jsonify({'message': 'expected_total must be a number!'}), 400
+        summary = price_cart(lines)
+        if expected_total != summary['subtotal']:
+            return jsonify({'message': 'Cart prices have changed!', 'cart': summary}), 409
+
+    # Order, stock and the emptied cart in one transaction
+    try:
+        new_order = Order.place(
+            current_user.id,
+            [
+                {'product_id': product_id, 'color': color or None, 'quantity': quantity}
+                for (product_id, color), quantity in lines.items()
+            ],
+            shipping_address=data['shipping_address'],
+            billing_address=data['billing_address'],
+            payment_method=data['payment_method'],
+            status='pending',
+            payment_status='pending'
+        )
+        CartItem.query.filter_by(user_id=current_user.id).delete(synchronize_session=False)
+        db.session.flush()
+        order_data = new_order.to_dict()
+        db.session.commit()
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'product_ids': e.product_ids}), 409
+    except OrderError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+
+    cart_store.clear(current_user.id)
+    invalidate_availability({item['product_id'] for item in order_data['items']})
+    return jsonify({
+        'message': 'Order created successfully!',
+        'order': order_data
+    }), 201
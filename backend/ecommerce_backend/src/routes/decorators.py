@@ -1,68 +1,226 @@
 from functools import wraps
+from collections import OrderedDict
 from flask import request, jsonify
-from src.models import User
+from src.cache import response_cache
+from src.models import User, db
 import jwt
 import os
+import threading
+import time
 
 SECRET_KEY = os.environ.get('SECRET_KEY', 'dev_secret_key')
 
+# Per-process cache of verified token -> user identity. Tokens are only
+# decoded and looked up in the database on a miss; entries expire after
+# AUTH_CACHE_TTL seconds (or when the token itself expires) and are dropped
+# as soon as the user is changed through the API.
+#
+# A change made through another worker is seen through a shared identity
+# version, kept with the catalog version (Redis, or the cache_versions table
+# re-read every CATALOG_VERSION_POLL seconds): invalidate_user bumps it, and
+# entries cached under an older version are misses.
+VERSION_KEY = 'identity:version'
+
+class IdentityCache:
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()   # token -> (identity, expires_at, version)
+        self._tokens_by_user = {}       # user_id -> set of cached tokens
+        self._lock = threading.Lock()
+
+    def version(self):
+        return int(response_cache.versions.get(VERSION_KEY) or 0)
+
+    def get(self, token, version):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= time.time() or entry[2] != version:
+                if entry is not None:
+                    self._discard(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, token, identity, version, token_expires_at=None):
+        # version: read before the user was loaded, so a change committed
+        # meanwhile retires the entry
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self._lock:
+            self._discard(token)
+            self._entries[token] = (identity, expires_at, version)
+            self._tokens_by_user.setdefault(identity['id'], set()).add(token)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        # Call after the change is committed
+        with self._lock:
+            for token in self._tokens_by_user.pop(user_id, set()):
+                self._entries.pop(token, None)
+                self.invalidations += 1
+        response_cache.versions.incr(VERSION_KEY)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def _discard(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry[0]['id'])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[0]['id']]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+identity_cache = IdentityCache(
+    maxsize=int(os.environ.get('AUTH_CACHE_SIZE', 10000)),
+    ttl=int(os.environ.get('AUTH_CACHE_TTL', 60))
+)
+
+class UserGone(Exception):
+    # The token's user was deleted after its identity was cached
+    pass
+
+# The authenticated user passed to route handlers. id, username, role and
+# profile (the user's to_dict()) come from the identity cache; anything else
+# (relationships, updates) loads the User row on first access.
+class CurrentUser:
+    def __init__(self, identity, user=None):
+        object.__setattr__(self, '_identity', identity)
+        object.__setattr__(self, '_user', user)
+
+    @property
+    def id(self):
+        return self._identity['id']
+
+    @property
+    def username(self):
+        return self._identity['username']
+
+    @property
+    def role(self):
+        return self._identity['role']
+
+    @property
+    def profile(self):
+        return self._identity['profile']
+
+    def is_admin(self):
+        return self.role == 'admin'
+
+    def _load(self):
+        if self._user is None:
+            user = db.session.get(User, self.id)
+            if user is None:
+                raise UserGone(self.id)
+            object.__setattr__(self, '_user', user)
+        return self._user
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+def authenticate():
+    # Returns (current_user, None) or (None, error response)
+    token = None
+
+    if 'Authorization' in request.headers:
+        auth_header = request.headers['Authorization']
+        if auth_header.startswith('Bearer '):
+            token = auth_header.split(' ')[1]
+
+    if not token:
+        return None, (jsonify({'message': 'Token is missing!'}), 401)
+
+    version = identity_cache.version()
+    identity = identity_cache.get(token, version)
+    if identity is not None:
+        return CurrentUser(identity), None
+
+    try:
+        data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    except jwt.ExpiredSignatureError:
+        return None, (jsonify({'message': 'Token has expired!'}), 401)
+    except jwt.InvalidTokenError:
+        return None, (jsonify({'message': 'Invalid token!'}), 401)
+
+    user = User.query.filter_by(id=data.get('user_id')).first()
+    if not user:
+        return None, (jsonify({'message': 'User not found!'}), 401)
+
+    identity = {'id': user.id, 'username': user.username, 'role': user.role, 'profile': user.to_dict()}
+    identity_cache.set(token, identity, version, data.get('exp'))
+    return CurrentUser(identity, user), None
+
+def call_as(f, current_user, *args, **kwargs):
+    # A cached identity can outlive its user (deleted through another
+    # worker); answer like an unknown user instead of failing mid-request
+    try:
+        return f(current_user, *args, **kwargs)
+    except UserGone:
+        db.session.rollback()
+        identity_cache.invalidate_user(current_user.id)
+        return jsonify({'message': 'User not found!'}), 401
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
-        
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-        
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            current_user = User.query.filter_by(id=data['user_id']).first()
-            
-            if not current_user:
-                return jsonify({'message': 'User not found!'}), 401
-                
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired!'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Invalid token!'}), 401
-            
-        return f(current_user, *args, **kwargs)
-    
+        current_user, error = authenticate()
+        if error:
+            return error
+        return call_as(f, current_user, *args, **kwargs)
+
     return decorated
 
 def admin_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
-        
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-        
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            current_user = User.query.filter_by(id=data['user_id']).first()
-            
-            if not current_user:
-                return jsonify({'message': 'User not found!'}), 401
-            
-            if current_user.role != 'admin':
-                return jsonify({'message': 'Admin privileges required!'}), 403
-                
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired!'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Invalid token!'}), 401
-            
-        return f(current_user, *args, **kwargs)
-    
-    return decorated 
\ No newline at end of file
+        current_user, error = authenticate()
+        if error:
+            return error
+
+        # The role is always checked against the database: a demotion must
+        # not wait for the cached identity to go
+        user = db.session.get(User, current_user.id)
+        if user is None:
+            identity_cache.invalidate_user(current_user.id)
+            return jsonify({'message': 'User not found!'}), 401
+        if user.role != current_user.role:
+            identity_cache.invalidate_user(current_user.id)
+        if user.role != 'admin':
+            return jsonify({'message': 'Admin privileges required!'}), 403
+        current_user = CurrentUser(dict(current_user._identity, role=user.role), user)
+
+        return call_as(f, current_user, *args, **kwargs)
+
+    return decorated
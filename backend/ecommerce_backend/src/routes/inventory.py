@@ -0,0 +1,146 @@
+from flask import Blueprint, request, jsonify, current_app
+from src.models import Product, ProductColor, InventoryReservation, OrderError, InsufficientStock, db
+from src.routes.auth import token_required
+from src.cache import response_cache
+from src.database import read_replica
+import json
+
+inventory_bp = Blueprint('inventory', __name__)
+
+MAX_AVAILABILITY_IDS = 100
+
+# Storefront availability is served from a short-lived per-product summary in
+# the response cache backend. Stock writes made through this API drop the
+# affected entries; anything else is picked up when they expire.
+#
+# This is the only place the storefront reads stock from: cached catalog
+# payloads leave it out (Product.STOCK_FIELDS), so orders and reservations
+# never retire them. Call after the write is committed.
+
+def availability_key(product_id):
+    return f'availability:{product_id}'
+
+def invalidate_availability(product_ids):
+    if not product_ids:
+        return
+    response_cache.backend.delete(*[availability_key(product_id) for product_id in product_ids])
+
+def availability(product_ids):
+    # {product_id: summary}; cache misses are loaded with one IN query per table
+    summaries = {}
+    missing = []
+    for product_id in product_ids:
+        cached = response_cache.backend.get(availability_key(product_id))
+        if cached is not None:
+            summaries[product_id] = json.loads(cached)
+        else:
+            missing.append(product_id)
+    if not missing:
+        return summaries
+
+    products = db.session.query(Product.id, Product.in_stock, Product.stock_quantity).filter(Product.id.in_(missing))
+    loaded = {
+        row.id: {
+            'product_id': row.id,
+            'in_stock': bool(row.in_stock) if row.stock_quantity is None else row.stock_quantity > 0,
+            'stock_quantity': row.stock_quantity,
+            'variants': []
+        }
+        for row in products
+    }
+    variants = db.session.query(ProductColor.product_id, ProductColor.name, ProductColor.stock_quantity).filter(
+        ProductColor.product_id.in_(list(loaded))
+    ).order_by(ProductColor.product_id, ProductColor.name)
+    for row in variants:
+        summary = loaded[row.product_id]
+        summary['variants'].append({
+            'color': row.name,
+            'in_stock': summary['in_stock'] and (row.stock_quantity is None or row.stock_quantity > 0),
+            'stock_quantity': row.stock_quantity
+        })
+
+    ttl = int(current_app.config.get('AVAILABILITY_CACHE_TTL', 5))
+    for product_id, summary in loaded.items():
+        response_cache.backend.set(availability_key(product_id), json.dumps(summary), ex=ttl)
+    summaries.update(loaded)
+    return summaries
+
+@inventory_bp.route('/availability', methods=['GET'])
+@read_replica
+def get_availability():
+    product_ids = [product_id for product_id in request.args.get('product_ids', '').split(',') if product_id]
+    if not product_ids:
+        return jsonify({'message': 'product_ids is required!'}), 400
+    if len(product_ids) > MAX_AVAILABILITY_IDS:
+        return jsonify({'message': f'At most {MAX_AVAILABILITY_IDS} product_ids per request!'}), 400
+
+    summaries = availability(product_ids)
+    return jsonify({
+        'availability': [summaries[product_id] for product_id in product_ids if product_id in summaries]
+    }), 200
+
+@inventory_bp.route('/reservations', methods=['POST'])
+@token_required
+def create_reservation(current_user):
+    data = request.get_json() or {}
+    if 'items' not in data:
+        return jsonify({'message': 'Missing required field: items'}), 400
+
+    # Hold the units for RESERVATION_TTL seconds while the customer pays
+    ttl = int(current_app.config.get('RESERVATION_TTL', 900))
+    try:
+        rows = InventoryReservation.reserve(current_user.id, data['items'], ttl)
+        db.session.flush()
+        reservation = {
+            'id': rows[0].checkout_id,
+            'expires_at': rows[0].expires_at.isoformat(),
+            'items': [row.to_dict() for row in rows]
+        }
+        db.session.commit()
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'product_ids': e.product_ids}), 409
+    except OrderError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+
+    invalidate_availability({row['product_id'] for row in reservation['items']})
+    return jsonify({
+        'message': 'Items reserved!',
+        'reservation': reservation
+    }), 201
+
+@inventory_bp.route('/reservations/<checkout_id>', methods=['GET'])
+@token_required
+def get_reservation(current_user, checkout_id):
+    rows = InventoryReservation.query.filter_by(checkout_id=checkout_id, user_id=current_user.id).all()
+    if not rows:
+        return jsonify({'message': 'Reservation not found!'}), 404
+
+    return jsonify({
+        'reservation': {
+            'id': checkout_id,
+            'expires_at': rows[0].expires_at.isoformat(),
+            'items': [row.to_dict() for row in rows]
+        }
+    }), 200
+
+@inventory_bp.route('/reservations/<checkout_id>', methods=['DELETE'])
+@token_required
+def release_reservation(current_user, checkout_id):
+    rows = InventoryReservation.query.filter_by(
+        checkout_id=checkout_id, user_id=current_user.id, status='active'
+    ).all()
+    if not rows:
+        return jsonify({'message': 'Reservation not found!'}), 404
+
+    product_ids = {row.product_id for row in rows}
+    if not InventoryReservation.release_rows(rows):
+        db.session.rollback()
+        return jsonify({'message': 'Reservation was already used!'}), 409
+    db.session.commit()
+
+    invalidate_availability(product_ids)
+    return jsonify({
+        'message': 'Reservation released!'
+    }), 200
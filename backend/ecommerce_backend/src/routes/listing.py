@@ -0,0 +1,98 @@
+from sqlalchemy import and_, literal, or_
+import base64
+import datetime
+import json
+
+# Shared helpers for paginated list endpoints. Cursors are opaque to the
+# client: a url-safe base64 JSON array holding the sort key values of the last
+# row on the page, which the next request turns into a keyset WHERE clause.
+
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+def encode_cursor(values):
+    encoded = []
+    for value in values:
+        if isinstance(value, datetime.datetime):
+            encoded.append({'dt': value.isoformat()})
+        else:
+            encoded.append(value)
+    raw = json.dumps(encoded, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor!')
+
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor!')
+
+    decoded = []
+    for value in values:
+        if isinstance(value, dict) and 'dt' in value:
+            decoded.append(datetime.datetime.fromisoformat(value['dt']))
+        else:
+            decoded.append(value)
+    return decoded
+
+def parse_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer!')
+    if limit < 1:
+        raise ValueError('limit must be positive!')
+    return min(limit, maximum)
+
+def parse_fields(value, allowed, always=('id',)):
+    # Returns None when no projection was requested
+    if not value:
+        return None
+    fields = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = fields - set(allowed)
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+    return fields | set(always)
+
+def parse_datetime(value, field):
+    # Accepts an ISO date or datetime; returns None when the value is empty
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{field} must be an ISO date or datetime!')
+
+def keyset_condition(order, values):
+    # order is a list of (column expression, descending) pairs; the condition
+    # selects rows strictly after `values` in that lexicographic order
+    # Booleans need an explicit literal, SQLAlchemy refuses `column < True`
+    values = [literal(value) if isinstance(value, bool) else value for value in values]
+    clauses = []
+    for index, (column, descending) in enumerate(order):
+        value = values[index]
+        step = column < value if descending else column > value
+        equal = [order[i][0] == values[i] for i in range(index)]
+        clauses.append(and_(*equal, step) if equal else step)
+    return or_(*clauses)
+
+def order_by_clauses(order):
+    return [column.desc() if descending else column.asc() for column, descending in order]
+
+def paginate(query, order, cursor, limit, key):
+    # Fetch one extra row to know whether another page exists. `key` maps a
+    # result row to the values of the order columns for the next cursor.
+    if cursor:
+        query = query.filter(keyset_condition(order, decode_cursor(cursor, len(order))))
+    rows = query.order_by(*order_by_clauses(order)).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(key(rows[-1]))
+    return rows, next_cursor
@@ -1,27 +1,116 @@
 from flask import Blueprint, request, jsonify
-from src.models import Order, OrderItem, db
+from src.models import Order, OrderItem, OrderDailyStat, OrderError, InsufficientStock, Product, WishlistItem, db
+from src.routes.inventory import invalidate_availability
 from src.routes.auth import token_required, admin_required
+from src.routes.listing import parse_datetime, parse_limit, paginate
+from src.streaming import stream_export
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 
 order_bp = Blueprint('order', __name__)
 
+ORDER_EXPORT_COLUMNS = (
+    'id', 'user_id', 'status', 'total_amount', 'payment_method', 'payment_status',
+    'shipping_address', 'billing_address', 'created_at', 'updated_at'
+)
+
+def filtered_orders(args):
+    # Admin order filters shared by the listing and the export
+    query = Order.query
+    if args.get('status'):
+        query = query.filter(Order.status == args['status'])
+    if args.get('payment_status'):
+        query = query.filter(Order.payment_status == args['payment_status'])
+    if args.get('user_id'):
+        query = query.filter(Order.user_id == args['user_id'])
+    created_from = parse_datetime(args.get('created_from'), 'created_from')
+    created_to = parse_datetime(args.get('created_to'), 'created_to')
+    if created_from:
+        query = query.filter(Order.created_at >= created_from)
+    if created_to:
+        query = query.filter(Order.created_at < created_to)
+    return query
+
+ORDER_VIEWS = ('full', 'summary')
+ORDER_PAGE_ORDER = [(Order.created_at, True), (Order.id, True)]
+
+def parse_view(args):
+    view = args.get('view', 'full')
+    if view not in ORDER_VIEWS:
+        raise ValueError('view must be full or summary!')
+    return view
+
+def listed_orders(query, args, view, default_limit=50, maximum=500):
+    # One page of orders, newest first. The full view preloads the items
+    # with one IN query; the summary view doesn't load them at all.
+    if view == 'full':
+        query = query.options(selectinload(Order.items))
+    limit = parse_limit(args.get('limit'), default=default_limit, maximum=maximum)
+    return paginate(query, ORDER_PAGE_ORDER, args.get('cursor'), limit, lambda order: [order.created_at, order.id])
+
+def order_listing(orders, view):
+    # Product names and images for every item come from one more query; the
+    # summary view reports item counts (one grouped query) instead of items
+    if view == 'summary':
+        counts = dict(
+            db.session.query(OrderItem.order_id, func.sum(OrderItem.quantity))
+            .filter(OrderItem.order_id.in_([order.id for order in orders]))
+            .group_by(OrderItem.order_id)
+        ) if orders else {}
+        return [
+            dict(order.to_dict(include_items=False), item_count=int(counts.get(order.id) or 0))
+            for order in orders
+        ]
+    products = OrderItem.product_summaries([item for order in orders for item in order.items])
+    return [order.to_dict(products=products) for order in orders]
+
+def order_detail(order):
+    return order.to_dict(products=OrderItem.product_summaries(order.items))
+
 # Order Management (Admin)
 @order_bp.route('/admin/orders', methods=['GET'])
 @admin_required
 def get_all_orders(current_user):
-    orders = Order.query.all()
+    fmt = request.args.get('format')
+    if fmt is not None and fmt not in ('ndjson', 'csv'):
+        return jsonify({'message': 'format must be ndjson or csv!'}), 400
+    
+    try:
+        query = filtered_orders(request.args)
+        view = parse_view(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    # Export mode streams every matching order from a server-side cursor
+    if fmt:
+        export = query.order_by(Order.created_at.desc(), Order.id.desc())
+        if fmt == 'ndjson':
+            export = export.options(selectinload(Order.items))
+            rows = (order.to_dict() for order in export.yield_per(1000))
+        else:
+            rows = (order.to_dict(include_items=False) for order in export.yield_per(1000))
+        return stream_export(rows, fmt, 'orders', columns=ORDER_EXPORT_COLUMNS)
+    
+    try:
+        orders, next_cursor = listed_orders(query, request.args, view)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     return jsonify({
-        'orders': [order.to_dict() for order in orders]
+        'orders': order_listing(orders, view),
+        'next_cursor': next_cursor
     }), 200
 
 @order_bp.route('/admin/orders/<order_id>', methods=['GET'])
 @admin_required
 def get_order_admin(current_user, order_id):
-    order = Order.query.filter_by(id=order_id).first()
+    order = Order.query.options(selectinload(Order.items)).filter_by(id=order_id).first()
     if not order:
         return jsonify({'message': 'Order not found!'}), 404
     
     return jsonify({
-        'order': order.to_dict()
+        'order': order_detail(order)
     }), 200
 
 @order_bp.route('/admin/orders/<order_id>', methods=['PUT'])
@@ -32,37 +121,48 @@ def update_order_status(current_user, order_id):
         return jsonify({'message': 'Order not found!'}), 404
     
     data = request.get_json()
+    old_status = order.status
     
     if 'status' in data:
         order.status = data['status']
     if 'payment_status' in data:
         order.payment_status = data['payment_status']
     
+    OrderDailyStat.record_status_change(order, old_status)
     db.session.commit()
     
     return jsonify({
         'message': 'Order updated successfully!',
-        'order': order.to_dict()
+        'order': order_detail(order)
     }), 200
 
 # User Orders
 @order_bp.route('/orders', methods=['GET'])
 @token_required
 def get_user_orders(current_user):
-    orders = Order.query.filter_by(user_id=current_user.id).all()
+    # Newest first, a page at a time (limit/cursor); view=summary omits items
+    try:
+        view = parse_view(request.args)
+        orders, next_cursor = listed_orders(
+            Order.query.filter(Order.user_id == current_user.id), request.args, view, maximum=100
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     return jsonify({
-        'orders': [order.to_dict() for order in orders]
+        'orders': order_listing(orders, view),
+        'next_cursor': next_cursor
     }), 200
 
 @order_bp.route('/orders/<order_id>', methods=['GET'])
 @token_required
 def get_order(current_user, order_id):
-    order = Order.query.filter_by(id=order_id, user_id=current_user.id).first()
+    order = Order.query.options(selectinload(Order.items)).filter_by(id=order_id, user_id=current_user.id).first()
     if not order:
         return jsonify({'message': 'Order not found!'}), 404
     
     return jsonify({
-        'order': order.to_dict()
+        'order': order_detail(order)
     }), 200
 
 @order_bp.route('/orders', methods=['POST'])
@@ -70,97 +170,199 @@ def get_order(current_user, order_id):
 def create_order(current_user):
     data = request.get_json()
     
-    # Validate required fields
-    required_fields = ['total_amount', 'shipping_address', 'billing_address', 'payment_method', 'items']
+    # Validate required fields. Items come from the request, or from the
+    # checkout reservation when reservation_id is given. Prices and the total
+    # are computed from the catalog; any sent by the client are ignored.
+    required_fields = ['shipping_address', 'billing_address', 'payment_method']
     for field in required_fields:
         if field not in data:
             return jsonify({'message': f'Missing required field: {field}'}), 400
+    if 'items' not in data and not data.get('reservation_id'):
+        return jsonify({'message': 'Missing required field: items'}), 400
     
-    # Create new order
-    new_order = Order(
-        user_id=current_user.id,
-        total_amount=data['total_amount'],
-        shipping_address=data['shipping_address'],
-        billing_address=data['billing_address'],
-        payment_method=data['payment_method'],
-        status='pending',
-        payment_status='pending'
-    )
-    
-    db.session.add(new_order)
-    db.session.commit()
-    
-    # Add order items
-    if isinstance(data['items'], list):
-        for item_data in data['items']:
-            if 'product_id' in item_data and 'quantity' in item_data and 'price' in item_data:
-                order_item = OrderItem(
-                    order_id=new_order.id,
-                    product_id=item_data['product_id'],
-                    quantity=item_data['quantity'],
-                    price=item_data['price']
-                )
-                db.session.add(order_item)
-    
-    db.session.commit()
+    # Order, items, stock and the analytics rollup in a single transaction
+    try:
+        new_order = Order.place(
+            current_user.id,
+            data.get('items'),
+            reservation_id=data.get('reservation_id'),
+            shipping_address=data['shipping_address'],
+            billing_address=data['billing_address'],
+            payment_method=data['payment_method'],
+            status='pending',
+            payment_status='pending'
+        )
+        db.session.flush()
+        order_data = new_order.to_dict()
+        db.session.commit()
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'product_ids': e.product_ids}), 409
+    except OrderError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
     
+    invalidate_availability({item['product_id'] for item in order_data['items']})
     return jsonify({
         'message': 'Order created successfully!',
-        'order': new_order.to_dict()
+        'order': order_data
     }), 201
 
 # Wishlist Management
+MAX_WISHLIST_IDS = 100
+
+def parse_product_ids(value):
+    # A list from a JSON body, or a comma separated query string value
+    if isinstance(value, str):
+        value = [product_id for product_id in value.split(',') if product_id]
+    if not isinstance(value, list) or not value or not all(isinstance(product_id, str) and product_id for product_id in value):
+        raise ValueError('product_ids must be a non-empty list of ids!')
+    if len(value) > MAX_WISHLIST_IDS:
+        raise ValueError(f'At most {MAX_WISHLIST_IDS} product_ids per request!')
+    return list(dict.fromkeys(value))
+
+def wishlist_entry(row):
+    return {
+        'id': row.id,
+        'product_id': row.product_id,
+        'added_at': row.added_at.isoformat() if row.added_at else None,
+        'product': {
+            'id': row.product_id,
+            'name': row.name,
+            'price': row.price,
+            'discount_price': row.discount_price,
+            'image': row.image,
+            'rating': row.rating,
+            'rating_count': row.rating_count,
+            'in_stock': bool(row.in_stock) if row.stock_quantity is None else row.stock_quantity > 0,
+            'stock_quantity': row.stock_quantity
+        }
+    }
+
 @order_bp.route('/wishlist', methods=['GET'])
 @token_required
 def get_wishlist(current_user):
-    wishlist_items = current_user.wishlist_items
+    # Entries joined with a product summary in one query, newest first
+    query = db.session.query(
+        WishlistItem.id, WishlistItem.product_id, WishlistItem.added_at,
+        Product.name, Product.price, Product.discount_price, Product.image,
+        Product.rating, Product.rating_count, Product.in_stock, Product.stock_quantity
+    ).join(Product, Product.id == WishlistItem.product_id).filter(WishlistItem.user_id == current_user.id)
+    
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        rows, next_cursor = paginate(
+            query,
+            [(WishlistItem.added_at, True), (WishlistItem.id, True)],
+            request.args.get('cursor'), limit,
+            lambda row: [row.added_at, row.id]
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     return jsonify({
-        'wishlist': [item.to_dict() for item in wishlist_items]
+        'wishlist': [wishlist_entry(row) for row in rows],
+        'next_cursor': next_cursor
+    }), 200
+
+@order_bp.route('/wishlist/contains', methods=['GET'])
+@token_required
+def wishlist_contains(current_user):
+    # Which of the given products are in the wishlist, for product cards
+    try:
+        product_ids = parse_product_ids(request.args.get('product_ids', ''))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    found = {
+        product_id for (product_id,) in db.session.query(WishlistItem.product_id).filter(
+            WishlistItem.user_id == current_user.id, WishlistItem.product_id.in_(product_ids)
+        )
+    }
+    return jsonify({
+        'product_ids': [product_id for product_id in product_ids if product_id in found]
     }), 200
 
 @order_bp.route('/wishlist', methods=['POST'])
 @token_required
 def add_to_wishlist(current_user):
-    data = request.get_json()
+    data = request.get_json() or {}
     
-    if 'product_id' not in data:
+    # One product_id, or a batch of product_ids
+    single = 'product_ids' not in data
+    if single and 'product_id' not in data:
         return jsonify({'message': 'Missing product_id!'}), 400
+    try:
+        product_ids = parse_product_ids([data['product_id']] if single else data['product_ids'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
-    # Check if item already in wishlist
-    existing_item = WishlistItem.query.filter_by(
-        user_id=current_user.id,
-        product_id=data['product_id']
-    ).first()
+    # Existing products and existing entries, one IN query each
+    known = {
+        product_id for (product_id,) in db.session.query(Product.id).filter(Product.id.in_(product_ids))
+    }
+    existing = {
+        product_id for (product_id,) in db.session.query(WishlistItem.product_id).filter(
+            WishlistItem.user_id == current_user.id, WishlistItem.product_id.in_(product_ids)
+        )
+    }
+    if single and product_ids[0] not in known:
+        return jsonify({'message': 'Product not found!'}), 404
+    if single and existing:
+        return jsonify({'message': 'Item already in wishlist!'}), 409
     
-    if existing_item:
+    added = [
+        WishlistItem(user_id=current_user.id, product_id=product_id)
+        for product_id in product_ids if product_id in known and product_id not in existing
+    ]
+    db.session.add_all(added)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Added concurrently by another request
+        db.session.rollback()
         return jsonify({'message': 'Item already in wishlist!'}), 409
     
-    # Add to wishlist
-    wishlist_item = WishlistItem(
-        user_id=current_user.id,
-        product_id=data['product_id']
-    )
+    if single:
+        return jsonify({
+            'message': 'Item added to wishlist!',
+            'wishlist_item': added[0].to_dict()
+        }), 201
+    return jsonify({
+        'message': 'Items added to wishlist!',
+        'added': [item.product_id for item in added],
+        'already_added': [product_id for product_id in product_ids if product_id in existing],
+        'not_found': [product_id for product_id in product_ids if product_id not in known]
+    }), 200
+
+@order_bp.route('/wishlist', methods=['DELETE'])
+@token_required
+def remove_many_from_wishlist(current_user):
+    try:
+        product_ids = parse_product_ids(request.args.get('product_ids', ''))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
-    db.session.add(wishlist_item)
+    removed = WishlistItem.query.filter(
+        WishlistItem.user_id == current_user.id, WishlistItem.product_id.in_(product_ids)
+    ).delete(synchronize_session=False)
     db.session.commit()
     
     return jsonify({
-        'message': 'Item added to wishlist!',
-        'wishlist_item': wishlist_item.to_dict()
-    }), 201
+        'message': 'Items removed from wishlist!',
+        'removed': removed
+    }), 200
 
 @order_bp.route('/wishlist/<item_id>', methods=['DELETE'])
 @token_required
 def remove_from_wishlist(current_user, item_id):
-    wishlist_item = WishlistItem.query.filter_by(
-        id=item_id,
-        user_id=current_user.id
-    ).first()
-    
-    if not wishlist_item:
+    # Accepts the wishlist entry id or the product id
+    removed = WishlistItem.query.filter(
+        WishlistItem.user_id == current_user.id,
+        or_(WishlistItem.id == item_id, WishlistItem.product_id == item_id)
+    ).delete(synchronize_session=False)
+    if not removed:
         return jsonify({'message': 'Wishlist item not found!'}), 404
-    
-    db.session.delete(wishlist_item)
     db.session.commit()
     
     return jsonify({
@@ -1,43 +1,80 @@
 from flask import Blueprint, request, jsonify
 import stripe
 import os
-from src.models import Order, OrderItem, db
+from src.webhooks import store_event
+from src.payment_gateway import payment_gateway, cart_idempotency_key, GatewayError, GatewayUnavailable
 from src.routes.auth import token_required
+from src.routes.cart import price_cart
+from src.cart_store import cart_store
+from src.models import InventoryReservation
+from src.models.inventory import load_products, reserved_lines, unit_price
 import json
 
 payment_bp = Blueprint('payment', __name__)
 
-# Initialize Stripe with the API key
-stripe.api_key = os.environ.get('STRIPE_SECRET_KEY', 'sk_test_51OXaMpLkjaNGkjsNGkjsNGkjsN')
+# The API key is configured on the payment gateway (see main.py)
 endpoint_secret = os.environ.get('STRIPE_WEBHOOK_SECRET', 'whsec_12345')
 
 @payment_bp.route('/create-payment-intent', methods=['POST'])
 @token_required
 def create_payment_intent(current_user):
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
+        reservation_id = data.get('reservation_id') or None
         
-        # Validate required fields
-        if not data or 'amount' not in data:
-            return jsonify({'error': 'Missing required fields'}), 400
+        # The amount is always computed here, at catalog prices, never taken
+        # from the request. A reservation is charged for its units, and its
+        # lines travel with the payment so the order can still be placed
+        # from them if it expires before the payment succeeds. Otherwise the
+        # server-side cart is charged. Each line carries its unit price, and
+        # the order is placed at those prices.
+        if reservation_id:
+            rows = InventoryReservation.active(reservation_id, current_user.id)
+            if not rows:
+                return jsonify({'error': 'Reservation not found or expired'}), 409
+            lines = reserved_lines(rows)
+            products = load_products({product_id for product_id, _ in lines})
+            total = round(sum(
+                unit_price(products[product_id]) * quantity for (product_id, _), quantity in lines.items()
+            ), 2)
+            items = [
+                {'product_id': product_id, 'quantity': quantity, 'color': color, 'price': unit_price(products[product_id])}
+                for (product_id, color), quantity in lines.items()
+            ]
+        else:
+            cart = price_cart(cart_store.lines(current_user.id))
+            if not cart['items']:
+                return jsonify({'error': 'Cart is empty'}), 400
+            if not cart['ready']:
+                return jsonify({'error': 'Some cart items are unavailable', 'cart': cart}), 409
+            total = cart['subtotal']
+            items = [
+                {'product_id': item['product_id'], 'quantity': item['quantity'], 'color': item['color'], 'price': item['unit_price']}
+                for item in cart['items']
+            ]
         
-        # Create a PaymentIntent with the order amount and currency
-        payment_intent = stripe.PaymentIntent.create(
-            amount=int(data['amount'] * 100),  # Convert to cents
+        # Create a PaymentIntent with the order amount and currency. Resubmitting
+        # the same cart reuses the PaymentIntent instead of creating another.
+        amount = int(round(total * 100))  # Convert to cents
+        payment_intent = payment_gateway.create_payment_intent(
+            amount=amount,
             currency='usd',
-            automatic_payment_methods={
-                'enabled': True,
-            },
             metadata={
                 'user_id': current_user.id,
-                'order_items': json.dumps(data.get('items', []))
-            }
+                'order_items': json.dumps(items),
+                'reservation_id': reservation_id or ''
+            },
+            idempotency_key=cart_idempotency_key(current_user.id, items, amount, reservation_id)
         )
         
         return jsonify({
-            'clientSecret': payment_intent.client_secret
+            'clientSecret': payment_intent['client_secret']
         })
     
+    except GatewayUnavailable as e:
+        return jsonify({'error': 'Payment service is temporarily unavailable, please try again shortly'}), 503
+    except GatewayError as e:
+        return jsonify({'error': str(e)}), 502
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -47,9 +84,8 @@ def webhook():
     sig_header = request.headers.get('Stripe-Signature')
     
     try:
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, endpoint_secret
-        )
+        stripe.WebhookSignature.verify_header(payload, sig_header, endpoint_secret, tolerance=300)
+        event = json.loads(payload)
     except ValueError as e:
         # Invalid payload
         return jsonify({'error': 'Invalid payload'}), 400
@@ -57,51 +93,13 @@ def webhook():
         # Invalid signature
         return jsonify({'error': 'Invalid signature'}), 400
     
-    # Handle the event
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        
-        # Extract metadata
-        metadata = payment_intent.get('metadata', {})
-        user_id = metadata.get('user_id')
-        order_items_json = metadata.get('order_items', '[]')
-        
-        try:
-            order_items = json.loads(order_items_json)
-            
-            # Calculate total amount
-            total_amount = payment_intent['amount'] / 100  # Convert from cents
-            
-            # Create order in database
-            new_order = Order(
-                user_id=user_id,
-                total_amount=total_amount,
-                shipping_address=metadata.get('shipping_address', 'Not provided'),
-                billing_address=metadata.get('billing_address', 'Not provided'),
-                payment_method='stripe',
-                payment_status='completed',
-                status='processing'
-            )
-            
-            db.session.add(new_order)
-            db.session.commit()
-            
-            # Add order items
-            for item in order_items:
-                order_item = OrderItem(
-                    order_id=new_order.id,
-                    product_id=item['product_id'],
-                    quantity=item['quantity'],
-                    price=item['price']
-                )
-                db.session.add(order_item)
-            
-            db.session.commit()
-            
-        except Exception as e:
-            print(f"Error processing payment: {str(e)}")
+    if not isinstance(event, dict) or not event.get('id') or not event.get('type'):
+        return jsonify({'error': 'Invalid payload'}), 400
     
-    return jsonify({'status': 'success'})
+    # Store the event and acknowledge right away; `flask payments work`
+    # processes the inbox. Redeliveries of a stored event are ignored.
+    stored = store_event(event['id'], event['type'], payload)
+    return jsonify({'status': 'success' if stored else 'duplicate'})
 
 @payment_bp.route('/config', methods=['GET'])
 def get_publishable_key():
@@ -1,49 +1,289 @@
 from flask import Blueprint, request, jsonify
+from sqlalchemy import case, false, func
 from src.models.product import Product, Category
 from src.extensions import db
+from src.routes.listing import parse_fields, parse_limit, paginate, order_by_clauses
+from src.search import MAX_CANDIDATES, search_index
+from src.cache import response_cache
+from src.database import read_replica
+from src import catalog_documents
+from src.streaming import stream_json
 
 product_bp = Blueprint('product', __name__)
 
+# Sort orders for the product listing. Every order ends with the primary key
+# so keyset cursors are unambiguous.
+def product_sort_order(sort_by):
+    effective_price = func.coalesce(Product.discount_price, Product.price)
+    rating = func.coalesce(Product.rating, 0.0)
+    is_featured = func.coalesce(Product.is_featured, False)
+    orders = {
+        'newest': [(Product.created_at, True), (Product.id, True)],
+        'featured': [(is_featured, True), (Product.created_at, True), (Product.id, True)],
+        'price-low': [(effective_price, False), (Product.id, False)],
+        'price-high': [(effective_price, True), (Product.id, True)],
+        'rating': [(rating, True), (Product.id, True)]
+    }
+    return orders.get(sort_by)
+
+def product_sort_key(sort_by, product):
+    effective_price = product.discount_price if product.discount_price is not None else product.price
+    keys = {
+        'newest': [product.created_at, product.id],
+        'featured': [bool(product.is_featured), product.created_at, product.id],
+        'price-low': [effective_price, product.id],
+        'price-high': [effective_price, product.id],
+        'rating': [product.rating or 0.0, product.id]
+    }
+    return keys[sort_by]
+
 # Get all products
 @product_bp.route('/', methods=['GET'])
+@response_cache.cached
+@read_replica
 def get_products():
     # Get query parameters for filtering
     category = request.args.get('category')
     is_featured = request.args.get('featured')
     is_new = request.args.get('new')
+    min_price = request.args.get('min_price', type=float)
+    max_price = request.args.get('max_price', type=float)
+    
+    # Pagination only applies when the client asks for it; without `limit`
+    # or `cursor` the full filtered list is returned as before
+    sort_by = request.args.get('sort', 'newest')
+    cursor = request.args.get('cursor')
+    paginated = cursor is not None or 'limit' in request.args
+    
+    if product_sort_order(sort_by) is None:
+        return jsonify({'message': f'Unknown sort order: {sort_by}'}), 400
     
-    # Start with base query
-    query = Product.query
+    try:
+        fields = parse_fields(request.args.get('fields'), Product.CATALOG_FIELDS)
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    # Start with base query. Full products can be served from their stored
+    # documents, which only needs one row per product.
+    use_documents = fields is None and catalog_documents.enabled()
+    query = catalog_documents.document_query() if use_documents else Product.catalog_query(fields)
     
     # Apply filters if provided
     if category:
-        query = query.filter_by(category=category)
+        query = query.filter(Product.category == category)
     if is_featured == 'true':
-        query = query.filter_by(is_featured=True)
+        query = query.filter(Product.is_featured == True)
     if is_new == 'true':
-        query = query.filter_by(is_new=True)
+        query = query.filter(Product.is_new == True)
+    if min_price is not None:
+        query = query.filter(func.coalesce(Product.discount_price, Product.price) >= min_price)
+    if max_price is not None:
+        query = query.filter(func.coalesce(Product.discount_price, Product.price) <= max_price)
+    
+    if not paginated:
+        # The full list is streamed as rows are fetched in batches. The query
+        # is started here, while the read replica is selected.
+        products = iter(query.order_by(*order_by_clauses(product_sort_order(sort_by))).yield_per(500))
+        if use_documents:
+            return stream_json('products', catalog_documents.iter_documents_json(products)), 200
+        return stream_json('products', products, lambda product: product.to_dict(fields, stock=False)), 200
+    
+    try:
+        products, next_cursor = paginate(
+            query, product_sort_order(sort_by), cursor, limit,
+            lambda product: product_sort_key(sort_by, product)
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    response = {
+        'next_cursor': next_cursor
+    }
+    
+    # Counting is only done for the first page (or on request); later pages
+    # reuse the total the client already has
+    if not cursor or request.args.get('include_total') == 'true':
+        response['total'] = query.order_by(None).with_entities(func.count(Product.id)).scalar()
+    
+    if use_documents:
+        return catalog_documents.document_response('products', catalog_documents.documents_json(products), **response), 200
+    response['products'] = [product.to_dict(fields, stock=False) for product in products]
+    return jsonify(response), 200
+
+# Price bands used for search facets, matching the storefront price filter
+PRICE_BANDS = [('0-100', 0, 100), ('100-200', 100, 200), ('200-500', 200, 500), ('500-', 500, None)]
+RATING_BANDS = [4, 3, 2, 1]
+
+def search_facets(query):
+    effective_price = func.coalesce(Product.discount_price, Product.price)
+    
+    categories = query.with_entities(Product.category, func.count(Product.id)) \
+        .group_by(Product.category).all()
+    
+    # Price bands, stock and rating buckets are counted in one pass
+    columns = []
+    for label, low, high in PRICE_BANDS:
+        condition = effective_price >= low if high is None else (effective_price >= low) & (effective_price < high)
+        columns.append(func.sum(case((condition, 1), else_=0)))
+    columns.append(func.sum(case((Product.in_stock == True, 1), else_=0)))
+    columns.append(func.sum(case((Product.in_stock == False, 1), else_=0)))
+    for stars in RATING_BANDS:
+        columns.append(func.sum(case((Product.rating >= stars, 1), else_=0)))
+    counts = [int(value or 0) for value in query.with_entities(*columns).one()]
+    
+    price_counts = counts[:len(PRICE_BANDS)]
+    stock_counts = counts[len(PRICE_BANDS):len(PRICE_BANDS) + 2]
+    rating_counts = counts[len(PRICE_BANDS) + 2:]
+    return {
+        'category': {name: count for name, count in categories},
+        'price': {label: count for (label, _, _), count in zip(PRICE_BANDS, price_counts)},
+        'in_stock': {'true': stock_counts[0], 'false': stock_counts[1]},
+        'rating': {f'{stars}+': count for stars, count in zip(RATING_BANDS, rating_counts)}
+    }
+
+# Full-text product search
+@product_bp.route('/search', methods=['GET'])
+@response_cache.cached
+@read_replica
+def search_products():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'message': 'Missing search query!'}), 400
     
-    # Execute query and convert to dict
-    products = query.all()
+    try:
+        fields = parse_fields(request.args.get('fields'), Product.CATALOG_FIELDS)
+        limit = parse_limit(request.args.get('limit'))
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    # Structured filters, applied by the index before candidates are cut
+    conditions = []
+    category = request.args.get('category')
+    min_price = request.args.get('min_price', type=float)
+    max_price = request.args.get('max_price', type=float)
+    in_stock = request.args.get('in_stock')
+    min_rating = request.args.get('min_rating', type=float)
+    
+    if category:
+        conditions.append(Product.category == category)
+    if min_price is not None:
+        conditions.append(func.coalesce(Product.discount_price, Product.price) >= min_price)
+    if max_price is not None:
+        conditions.append(func.coalesce(Product.discount_price, Product.price) <= max_price)
+    # The stock filter and facet are as fresh as the cached response
+    # (CATALOG_CACHE_TTL); stock writes don't retire it
+    if in_stock in ('true', 'false'):
+        conditions.append(Product.in_stock == (in_stock == 'true'))
+    if min_rating is not None:
+        conditions.append(Product.rating >= min_rating)
+    
+    # Matching products, best first. At most MAX_CANDIDATES are ranked, so
+    # beyond that total is a lower bound and total_is_approximate is set.
+    scores = dict(search_index.search(q, conditions=conditions))
+    if not scores:
+        return jsonify({
+            'query': q, 'total': 0, 'total_is_approximate': False, 'products': [],
+            'facets': search_facets(Product.query.filter(false()))
+        }), 200
+    
+    ranked = sorted(scores, key=lambda product_id: (-scores[product_id], product_id))
+    page_ids = ranked[offset:offset + limit]
+    
+    products = {
+        product.id: product
+        for product in Product.catalog_query(fields).filter(Product.id.in_(page_ids))
+    }
+    results = []
+    for product_id in page_ids:
+        data = products[product_id].to_dict(fields, stock=False)
+        data['score'] = round(scores[product_id], 6)
+        results.append(data)
     
     return jsonify({
-        'products': [product.to_dict() for product in products]
+        'query': q,
+        'total': len(ranked),
+        'total_is_approximate': len(ranked) >= MAX_CANDIDATES,
+        'products': results,
+        'facets': search_facets(Product.query.filter(Product.id.in_(ranked)))
     }), 200
 
+# Batch lookup for views that already know their product ids (cart,
+# wishlist, order history): one IN query for the products and one per
+# requested child table, keyed by id, with the ids not found listed in
+# `missing`. Only the uncached POST form includes stock.
+MAX_BATCH_IDS = 250
+
+def batch_lookup(ids, fields_value, stock=False):
+    if isinstance(ids, str):
+        ids = [product_id.strip() for product_id in ids.split(',') if product_id.strip()]
+    if not isinstance(ids, list) or not ids or not all(isinstance(product_id, str) for product_id in ids):
+        raise ValueError('ids must be a non-empty list of product ids!')
+    if isinstance(fields_value, list):
+        fields_value = ','.join(str(field) for field in fields_value)
+    fields = parse_fields(fields_value, Product.FIELDS if stock else Product.CATALOG_FIELDS)
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f'At most {MAX_BATCH_IDS} ids per request!')
+    
+    products = {
+        product.id: product.to_dict(fields, stock=stock)
+        for product in Product.catalog_query(fields).filter(Product.id.in_(ids))
+    }
+    return {
+        'products': products,
+        'missing': [product_id for product_id in ids if product_id not in products]
+    }
+
+@product_bp.route('/batch', methods=['GET'])
+@response_cache.cached
+@read_replica
+def get_products_batch():
+    try:
+        result = batch_lookup(request.args.get('ids', ''), request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    return jsonify(result), 200
+
+@product_bp.route('/batch', methods=['POST'])
+@read_replica
+def post_products_batch():
+    # Same as the GET form, for id lists too long for a query string
+    data = request.get_json() or {}
+    try:
+        result = batch_lookup(data.get('ids'), data.get('fields'), stock=True)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    return jsonify(result), 200
+
 # Get a specific product by ID
 @product_bp.route('/<product_id>', methods=['GET'])
+@response_cache.cached
+@read_replica
 def get_product(product_id):
-    product = Product.query.filter_by(id=product_id).first()
+    if catalog_documents.enabled():
+        row = catalog_documents.document_query().filter(Product.id == product_id).first()
+        if not row:
+            return jsonify({'message': 'Product not found'}), 404
+        if row.document:
+            return catalog_documents.document_response('product', catalog_documents.document_json(row)), 200
+    
+    product = Product.catalog_query().filter_by(id=product_id).first()
     
     if not product:
         return jsonify({'message': 'Product not found'}), 404
     
     return jsonify({
-        'product': product.to_dict()
+        'product': product.to_dict(stock=False)
     }), 200
 
 # Get all categories
 @product_bp.route('/categories', methods=['GET'])
+@response_cache.cached
+@read_replica
 def get_categories():
     categories = Category.query.all()
     
@@ -53,6 +293,8 @@ def get_categories():
 
 # Get products by category
 @product_bp.route('/categories/<category_id>/products', methods=['GET'])
+@response_cache.cached
+@read_replica
 def get_products_by_category(category_id):
     # Find the category
     category = Category.query.filter_by(id=category_id).first()
@@ -60,10 +302,7 @@ def get_products_by_category(category_id):
     if not category:
         return jsonify({'message': 'Category not found'}), 404
     
-    # Get products in this category
-    products = Product.query.filter_by(category=category.id).all()
+    # Get products in this category, streamed as they are fetched
+    products = iter(Product.catalog_query().filter_by(category=category.id).yield_per(500))
     
-    return jsonify({
-        'category': category.to_dict(),
-        'products': [product.to_dict() for product in products]
-    }), 200
\ No newline at end of file
+    return stream_json('products', products, lambda product: product.to_dict(stock=False), category=category.to_dict()), 200
\ No newline at end of file
@@ -1,13 +1,36 @@
 from flask import Blueprint, request, jsonify
-from src.models import db, Product, Rating
+from src.models import db, Product, Rating, RatingHelpfulVote, User
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
 from src.routes.auth import token_required
+from src.cache import response_cache
+from src.database import read_replica
+from src.routes.listing import parse_limit, paginate
 import datetime
 import uuid
 
 rating_bp = Blueprint('rating', __name__)
 
-# Get all ratings for a product
+# Review sort orders; each ends with the primary key so cursors are stable
+REVIEW_SORT_ORDERS = {
+    'newest': [(Rating.created_at, True), (Rating.id, True)],
+    'highest': [(Rating.score, True), (Rating.created_at, True), (Rating.id, True)],
+    'lowest': [(Rating.score, False), (Rating.created_at, True), (Rating.id, True)],
+    'most-helpful': [(Rating.helpful_count, True), (Rating.created_at, True), (Rating.id, True)]
+}
+
+def review_sort_key(sort_by, rating):
+    keys = {
+        'newest': [rating.created_at, rating.id],
+        'highest': [rating.score, rating.created_at, rating.id],
+        'lowest': [rating.score, rating.created_at, rating.id],
+        'most-helpful': [rating.helpful_count, rating.created_at, rating.id]
+    }
+    return keys[sort_by]
+
+# Get the rating summary and a page of reviews for a product
 @rating_bp.route('/products/<product_id>/ratings', methods=['GET'])
+@read_replica
 def get_product_ratings(product_id):
     try:
         # Check if product exists
@@ -15,18 +38,36 @@ def get_product_ratings(product_id):
         if not product:
             return jsonify({'message': 'Product not found!'}), 404
         
-        # Get all ratings for the product
-        ratings = Rating.query.filter_by(product_id=product_id).all()
-        
-        # Calculate average score
-        total_score = sum(rating.score for rating in ratings)
-        average_score = total_score / len(ratings) if ratings else 0
+        sort_by = request.args.get('sort', 'newest')
+        if sort_by not in REVIEW_SORT_ORDERS:
+            return jsonify({'message': f'Unknown sort order: {sort_by}'}), 400
+        
+        try:
+            limit = parse_limit(request.args.get('limit'), default=20)
+            score = request.args.get('score', type=int)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        # Summary comes from the stored aggregates; only one page of
+        # reviews is loaded, with usernames fetched by the same query
+        query = db.session.query(Rating, User.username) \
+            .join(User, User.id == Rating.user_id) \
+            .filter(Rating.product_id == product_id)
+        if score is not None:
+            query = query.filter(Rating.score == score)
+        
+        try:
+            rows, next_cursor = paginate(
+                query, REVIEW_SORT_ORDERS[sort_by], request.args.get('cursor'), limit,
+                lambda row: review_sort_key(sort_by, row[0])
+            )
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
         
-        return jsonify({
-            'average_score': round(average_score, 1),
-            'total_ratings': len(ratings),
-            'ratings': [rating.to_dict() for rating in ratings]
-        }), 200
+        response = product.rating_summary()
+        response['ratings'] = [rating.to_dict(username) for rating, username in rows]
+        response['next_cursor'] = next_cursor
+        return jsonify(response), 200
         
     except Exception as e:
         return jsonify({'message': f'Error fetching ratings: {str(e)}'}), 500
@@ -59,19 +100,21 @@ def submit_rating(current_user, product_id):
         ).first()
         
         if existing_rating:
-            # Update existing rating
+            # Update existing rating and move its score in the aggregates
+            Product.apply_rating_change(product_id, old_score=existing_rating.score, new_score=score)
             existing_rating.score = score
             existing_rating.comment = data.get('comment', '')
             existing_rating.updated_at = datetime.datetime.utcnow()
             
             db.session.commit()
+            response_cache.bump_catalog_version()
             
             return jsonify({
                 'message': 'Rating updated successfully!',
-                'rating': existing_rating.to_dict()
+                'rating': existing_rating.to_dict(current_user.username)
             }), 200
         else:
-            # Create new rating
+            # Create new rating and count it in the same transaction
             new_rating = Rating(
                 product_id=product_id,
                 user_id=current_user.id,
@@ -80,22 +123,17 @@ def submit_rating(current_user, product_id):
             )
             
             db.session.add(new_rating)
+            Product.apply_rating_change(product_id, new_score=score)
             db.session.commit()
-            
-            # Update product rating
-            ratings = Rating.query.filter_by(product_id=product_id).all()
-            total_score = sum(rating.score for rating in ratings)
-            average_score = total_score / len(ratings) if ratings else 0
-            
-            product.rating = round(average_score, 1)
-            db.session.commit()
+            response_cache.bump_catalog_version()
             
             return jsonify({
                 'message': 'Rating submitted successfully!',
-                'rating': new_rating.to_dict()
+                'rating': new_rating.to_dict(current_user.username)
             }), 201
             
     except Exception as e:
+        db.session.rollback()
         return jsonify({'message': f'Error submitting rating: {str(e)}'}), 500
 
 # Delete a rating
@@ -113,27 +151,44 @@ def delete_rating(current_user, rating_id):
         if rating.user_id != current_user.id and current_user.role != 'admin':
             return jsonify({'message': 'Unauthorized to delete this rating!'}), 403
         
-        # Get product for updating average rating
-        product_id = rating.product_id
-        
-        # Delete the rating
+        # Delete the rating and remove it from the product aggregates
+        Product.apply_rating_change(rating.product_id, old_score=rating.score)
+        RatingHelpfulVote.query.filter_by(rating_id=rating.id).delete()
         db.session.delete(rating)
         db.session.commit()
-        
-        # Update product rating
-        ratings = Rating.query.filter_by(product_id=product_id).all()
-        if ratings:
-            total_score = sum(rating.score for rating in ratings)
-            average_score = total_score / len(ratings)
-            
-            product = Product.query.filter_by(id=product_id).first()
-            if product:
-                product.rating = round(average_score, 1)
-                db.session.commit()
+        response_cache.bump_catalog_version()
         
         return jsonify({
             'message': 'Rating deleted successfully!'
         }), 200
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'message': f'Error deleting rating: {str(e)}'}), 500
+
+# Mark a review as helpful (once per user)
+@rating_bp.route('/ratings/<rating_id>/helpful', methods=['POST'])
+@token_required
+def mark_rating_helpful(current_user, rating_id):
+    rating = Rating.query.filter_by(id=rating_id).first()
+    if not rating:
+        return jsonify({'message': 'Rating not found!'}), 404
+    
+    try:
+        db.session.add(RatingHelpfulVote(rating_id=rating_id, user_id=current_user.id))
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'Already marked as helpful!'}), 409
+    
+    db.session.execute(
+        update(Rating).where(Rating.id == rating_id)
+        .values(helpful_count=Rating.helpful_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    
+    return jsonify({
+        'message': 'Rating marked as helpful!',
+        'helpful_count': db.session.query(Rating.helpful_count).filter_by(id=rating_id).scalar()
+    }), 200
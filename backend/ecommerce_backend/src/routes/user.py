@@ -1,16 +1,60 @@
 from flask import Blueprint, request, jsonify
 from src.models import User, db
-from src.routes.decorators import token_required, admin_required
+from src.routes.decorators import token_required, admin_required, identity_cache
+from src.routes.listing import parse_datetime, parse_limit, paginate
+from src.streaming import stream_export
 
 user_bp = Blueprint('user', __name__)
 
+USER_EXPORT_COLUMNS = ('id', 'username', 'email', 'first_name', 'last_name', 'avatar', 'role', 'created_at', 'updated_at')
+
+def filtered_users(args):
+    query = User.query
+    if args.get('role'):
+        query = query.filter(User.role == args['role'])
+    if args.get('q'):
+        # Prefix match so an index on username/email can be used
+        prefix = args['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        query = query.filter(db.or_(User.username.like(prefix, escape='\\'), User.email.like(prefix, escape='\\')))
+    created_from = parse_datetime(args.get('created_from'), 'created_from')
+    created_to = parse_datetime(args.get('created_to'), 'created_to')
+    if created_from:
+        query = query.filter(User.created_at >= created_from)
+    if created_to:
+        query = query.filter(User.created_at < created_to)
+    return query
+
 # User Management (Admin only)
 @user_bp.route('/users', methods=['GET'])
 @admin_required
 def get_all_users(current_user):
-    users = User.query.all()
+    fmt = request.args.get('format')
+    if fmt is not None and fmt not in ('ndjson', 'csv'):
+        return jsonify({'message': 'format must be ndjson or csv!'}), 400
+    
+    try:
+        query = filtered_users(request.args)
+        limit = parse_limit(request.args.get('limit'), default=50, maximum=500)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    # Export mode streams every matching user from a server-side cursor
+    if fmt:
+        export = query.order_by(User.created_at.desc(), User.id.desc()).yield_per(1000)
+        return stream_export((user.to_dict() for user in export), fmt, 'users', columns=USER_EXPORT_COLUMNS)
+    
+    try:
+        users, next_cursor = paginate(
+            query, [(User.created_at, True), (User.id, True)],
+            request.args.get('cursor'), limit,
+            lambda user: [user.created_at, user.id]
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     return jsonify({
-        'users': [user.to_dict() for user in users]
+        'users': [user.to_dict() for user in users],
+        'next_cursor': next_cursor
     }), 200
 
 @user_bp.route('/users/<user_id>', methods=['GET'])
@@ -62,6 +106,7 @@ def update_user(current_user, user_id):
         user.set_password(data['password'])
     
     db.session.commit()
+    identity_cache.invalidate_user(user.id)
     
     return jsonify({
         'message': 'User updated successfully!',
@@ -81,6 +126,7 @@ def delete_user(current_user, user_id):
     
     db.session.delete(user)
     db.session.commit()
+    identity_cache.invalidate_user(user_id)
     
     return jsonify({
         'message': 'User deleted successfully!'
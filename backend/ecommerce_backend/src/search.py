@@ -0,0 +1,448 @@
+from sqlalchemy import column, delete, event, insert, literal_column, select, table, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+import bisect
+import datetime
+import math
+import re
+import threading
+import time
+from .extensions import db
+
+# Product search index. Two interchangeable backends are provided:
+#
+#   fts5    - an SQLite FTS5 virtual table living next to the catalog tables,
+#             updated in the same transaction as the product it indexes
+#   memory  - an in-process inverted index with BM25 scoring, used when the
+#             database is not SQLite (or lacks FTS5). It is built once per
+#             process and then updated incrementally.
+#
+# Every process has its own memory index, so writes also append the changed
+# product ids to the search_changes table (in the writer's transaction).
+# Before searching, each process applies the changes logged since it last
+# looked, at most every SEARCH_SYNC_INTERVAL seconds: admin writes on another
+# worker and `flask products import` reach every worker that way. Log rows
+# are kept for SEARCH_CHANGE_RETENTION seconds; a process that hasn't synced
+# for longer rebuilds its index instead.
+#
+# Log ids are assigned at insert but become visible at commit, so they don't
+# arrive in order. A sync re-reads every row logged in the last
+# SEARCH_SYNC_LAG seconds and skips the ids it already applied; a writer
+# transaction that stays open longer than that may be missed until the
+# next rebuild. The writing process updates its own memory index only once
+# the transaction commits, so a rollback leaves nothing behind.
+#
+# Both index the product name, description, feature texts and specification
+# key/values, support prefix matching on every query term and return
+# (product_id, score) pairs ordered best first. Structured filters (SQL
+# conditions on Product) are applied before the MAX_CANDIDATES cut: in the
+# MATCH query for FTS5, and to the ranked matches in id batches for the
+# memory index.
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Relative weight of each indexed field when ranking
+FIELD_WEIGHTS = {
+    'name': 10.0,
+    'description': 1.0,
+    'features': 3.0,
+    'specifications': 2.0
+}
+
+MAX_CANDIDATES = 1000
+
+INDEXED_FIELDS = ('name', 'description', 'features', 'specifications')
+
+search_changes = db.Table(
+    'search_changes',
+    db.Column('id', db.Integer, primary_key=True, autoincrement=True),
+    db.Column('product_id', db.String(36), nullable=False),
+    db.Column('changed_at', db.DateTime, nullable=False, index=True)
+)
+
+def tokenize(value):
+    return TOKEN_RE.findall((value or '').lower())
+
+PENDING_KEY = 'search_index_pending'
+
+@event.listens_for(Session, 'after_commit')
+def apply_pending(session):
+    # Memory index updates queued by the transaction that just committed
+    for index, product_id, document in session.info.pop(PENDING_KEY, []):
+        index.apply(product_id, document)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_pending(session):
+    session.info.pop(PENDING_KEY, None)
+
+def product_document(product):
+    return {
+        'name': product.name or '',
+        'description': product.description or '',
+        'features': ' '.join(feature.text for feature in product.features),
+        'specifications': ' '.join(f'{spec.key} {spec.value}' for spec in product.specifications)
+    }
+
+class FTS5Backend:
+    name = 'fts5'
+    table = 'product_search'
+
+    def create(self):
+        # Returns True when the table did not exist yet and needs a first build
+        exists = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': self.table}
+        ).first()
+        if exists:
+            return False
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE {self.table} USING fts5("
+            "product_id UNINDEXED, name, description, features, specifications, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+        return True
+
+    def rebuild(self):
+        # One INSERT ... SELECT over the catalog tables
+        db.session.execute(text(f"DELETE FROM {self.table}"))
+        db.session.execute(text(
+            f"INSERT INTO {self.table} (product_id, name, description, features, specifications) "
+            "SELECT p.id, p.name, p.description, "
+            "(SELECT group_concat(f.text, ' ') FROM product_features f WHERE f.product_id = p.id), "
+            "(SELECT group_concat(s.key || ' ' || s.value, ' ') FROM product_specifications s WHERE s.product_id = p.id) "
+            "FROM products p"
+        ))
+
+    def index(self, product_id, document):
+        self.remove(product_id)
+        db.session.execute(
+            text(f"INSERT INTO {self.table} (product_id, name, description, features, specifications) "
+                 "VALUES (:product_id, :name, :description, :features, :specifications)"),
+            dict(document, product_id=product_id)
+        )
+
+    def remove(self, product_id):
+        db.session.execute(
+            text(f"DELETE FROM {self.table} WHERE product_id = :product_id"),
+            {'product_id': product_id}
+        )
+
+    def index_many(self, documents):
+        # documents is a list of (product_id, document); one executemany each
+        if not documents:
+            return
+        db.session.execute(
+            text(f"DELETE FROM {self.table} WHERE product_id = :product_id"),
+            [{'product_id': product_id} for product_id, _ in documents]
+        )
+        db.session.execute(
+            text(f"INSERT INTO {self.table} (product_id, name, description, features, specifications) "
+                 "VALUES (:product_id, :name, :description, :features, :specifications)"),
+            [dict(document, product_id=product_id) for product_id, document in documents]
+        )
+
+    def search(self, query, limit=MAX_CANDIDATES, conditions=()):
+        from .models import Product
+
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Every term must match, each one as a prefix
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(FIELD_WEIGHTS[field]) for field in ('name', 'description', 'features', 'specifications'))
+        fts = table(self.table, column('product_id'))
+        statement = select(fts.c.product_id, literal_column(f"bm25({self.table}, 0, {weights})").label('score')).where(
+            text(f"{self.table} MATCH :match").bindparams(match=match)
+        )
+        if conditions:
+            statement = statement.join(Product, Product.id == fts.c.product_id).where(*conditions)
+        rows = db.session.execute(statement.order_by(literal_column('score')).limit(limit)).all()
+        # FTS5 bm25() is negative, lower is better
+        return [(row.product_id, -row.score) for row in rows]
+
+class InvertedIndexBackend:
+    name = 'memory'
+
+    # Standard BM25 parameters
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._postings = {}      # term -> {product_id: {field: term frequency}}
+            self._lengths = {}       # product_id -> {field: token count}
+            self._doc_terms = {}     # product_id -> terms, so removal stays local
+            self._terms = []         # sorted vocabulary for prefix lookups
+            self._field_totals = dict.fromkeys(FIELD_WEIGHTS, 0)
+
+    def create(self):
+        # The in-process index is empty in every new process
+        with self._lock:
+            if self._built:
+                return False
+            self._built = True
+            return True
+
+    def rebuild(self):
+        from .models import Product
+
+        with self._lock:
+            self.clear()
+            for product in Product.catalog_query(INDEXED_FIELDS).yield_per(500):
+                self.index(product.id, product_document(product))
+
+    def index(self, product_id, document):
+        with self._lock:
+            self.remove(product_id)
+            lengths = {}
+            for field, value in document.items():
+                tokens = tokenize(value)
+                lengths[field] = len(tokens)
+                self._field_totals[field] += len(tokens)
+                for token in tokens:
+                    postings = self._postings.get(token)
+                    if postings is None:
+                        postings = self._postings[token] = {}
+                        bisect.insort(self._terms, token)
+                    fields = postings.setdefault(product_id, {})
+                    fields[field] = fields.get(field, 0) + 1
+            self._lengths[product_id] = lengths
+            self._doc_terms[product_id] = {
+                token for value in document.values() for token in tokenize(value)
+            }
+
+    def index_many(self, documents):
+        with self._lock:
+            for product_id, document in documents:
+                self.index(product_id, document)
+
+    def remove(self, product_id):
+        with self._lock:
+            lengths = self._lengths.pop(product_id, None)
+            if lengths is None:
+                return
+            for field, length in lengths.items():
+                self._field_totals[field] -= length
+            for term in self._doc_terms.pop(product_id):
+                postings = self._postings[term]
+                del postings[product_id]
+                if not postings:
+                    del self._postings[term]
+                    self._terms.pop(bisect.bisect_left(self._terms, term))
+
+    def _expand(self, prefix):
+        start = bisect.bisect_left(self._terms, prefix)
+        terms = []
+        for term in self._terms[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, query, limit=MAX_CANDIDATES):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            total_docs = len(self._lengths)
+            if not total_docs:
+                return []
+            average = {
+                field: self._field_totals[field] / total_docs or 1.0
+                for field in FIELD_WEIGHTS
+            }
+
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for expanded in self._expand(term):
+                    postings = self._postings[expanded]
+                    idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for product_id, fields in postings.items():
+                        lengths = self._lengths[product_id]
+                        score = 0.0
+                        for field, frequency in fields.items():
+                            norm = 1 - self.b + self.b * lengths.get(field, 0) / average[field]
+                            score += FIELD_WEIGHTS[field] * idf * frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+                        term_scores[product_id] = max(term_scores.get(product_id, 0.0), score)
+
+                # Every term must match
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {
+                        product_id: scores[product_id] + score
+                        for product_id, score in term_scores.items()
+                        if product_id in scores
+                    }
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+class SearchIndex:
+    def __init__(self):
+        self.backend = None
+        self.sync_interval = 1.0
+        self.change_retention = 24 * 3600
+        self.sync_lag = 60
+        self._scan_from = None     # changed_at the next sync reads from
+        self._applied = {}         # search_changes id -> changed_at, within the lag window
+        self._synced_at = 0.0
+        self._sync_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.sync_interval = float(app.config.get('SEARCH_SYNC_INTERVAL', 1.0))
+        self.change_retention = int(app.config.get('SEARCH_CHANGE_RETENTION', 24 * 3600))
+        self.sync_lag = int(app.config.get('SEARCH_SYNC_LAG', 60))
+        backend = app.config.get('SEARCH_BACKEND')
+        if backend is None:
+            backend = 'fts5' if db.engine.dialect.name == 'sqlite' else 'memory'
+
+        if backend == 'fts5':
+            try:
+                self.backend = FTS5Backend()
+                created = self.backend.create()
+            except OperationalError:
+                # SQLite compiled without FTS5
+                db.session.rollback()
+                self.backend = InvertedIndexBackend()
+                created = self.backend.create()
+        else:
+            self.backend = InvertedIndexBackend()
+            created = self.backend.create()
+
+        if created:
+            self.rebuild()
+
+    @property
+    def shared(self):
+        # The FTS5 table is seen by every process; the memory index is not
+        return isinstance(self.backend, FTS5Backend)
+
+    def rebuild(self):
+        if not self.shared:
+            # Changes logged in the lag window are applied again on the next sync
+            self._scan_from = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.sync_lag)
+            self._applied = {}
+            self._synced_at = time.monotonic()
+        self.backend.rebuild()
+        db.session.commit()
+
+    def _log_changes(self, product_ids):
+        # In the caller's transaction, so other processes only see committed changes
+        if self.shared or not product_ids:
+            return
+        now = datetime.datetime.utcnow()
+        db.session.execute(insert(search_changes), [{'product_id': product_id, 'changed_at': now} for product_id in product_ids])
+        db.session.execute(
+            delete(search_changes).where(search_changes.c.changed_at < now - datetime.timedelta(seconds=self.change_retention))
+        )
+
+    def sync(self):
+        # Apply the changes other processes logged since the last sync
+        if self.shared or time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        with self._sync_lock:
+            now = time.monotonic()
+            if now - self._synced_at < self.sync_interval:
+                return
+            if self._scan_from is None or now - self._synced_at > self.change_retention:
+                # Older log rows may have been pruned already
+                self.rebuild()
+                return
+
+            # Own session: only committed changes, never the caller's pending writes
+            scan_from = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.sync_lag)
+            with Session(db.engine) as session:
+                rows = session.execute(
+                    select(search_changes.c.id, search_changes.c.product_id, search_changes.c.changed_at)
+                    .where(search_changes.c.changed_at >= self._scan_from)
+                ).all()
+                rows = [row for row in rows if row.id not in self._applied]
+                if rows:
+                    from .models import Product
+
+                    product_ids = {row.product_id for row in rows}
+                    found = set()
+                    products = session.query(Product).options(*Product.catalog_options(INDEXED_FIELDS)).filter(
+                        Product.id.in_(product_ids)
+                    )
+                    for product in products:
+                        self.backend.index(product.id, product_document(product))
+                        found.add(product.id)
+                    for product_id in product_ids - found:
+                        self.backend.remove(product_id)
+                    self._applied.update((row.id, row.changed_at) for row in rows)
+            self._scan_from = scan_from
+            self._applied = {row_id: changed_at for row_id, changed_at in self._applied.items() if changed_at >= scan_from}
+            self._synced_at = now
+
+    def apply(self, product_id, document):
+        # document None removes the product
+        if document is None:
+            self.backend.remove(product_id)
+        else:
+            self.backend.index(product_id, document)
+
+    def _write(self, documents):
+        # [(product_id, document or None)]: into the FTS5 table now, or into
+        # the memory index once the transaction commits
+        if self.shared:
+            self.backend.index_many([(product_id, document) for product_id, document in documents if document is not None])
+            for product_id, document in documents:
+                if document is None:
+                    self.backend.remove(product_id)
+        else:
+            db.session.info.setdefault(PENDING_KEY, []).extend(
+                (self, product_id, document) for product_id, document in documents
+            )
+        self._log_changes([product_id for product_id, _ in documents])
+
+    def index_product(self, product):
+        # Call before committing so the FTS5 row (or the change log entry) is
+        # written in the same transaction
+        self._write([(product.id, product_document(product))])
+
+    def index_products(self, products):
+        self._write([(product.id, product_document(product)) for product in products])
+
+    def remove_product(self, product_id):
+        self._write([(product_id, None)])
+
+    def search(self, query, limit=MAX_CANDIDATES, conditions=()):
+        # conditions: SQL filters on Product the results must match
+        self.sync()
+        if self.shared:
+            return self.backend.search(query, limit, conditions)
+        if not conditions:
+            return self.backend.search(query, limit)
+        return self._filter(self.backend.search(query, None), limit, conditions)
+
+    def _filter(self, ranked, limit, conditions, batch_size=500):
+        # The ranked matches that meet conditions, best first, checked one
+        # IN query per batch until limit are found
+        from .models import Product
+
+        results = []
+        for start in range(0, len(ranked), batch_size):
+            batch = ranked[start:start + batch_size]
+            allowed = {
+                product_id
+                for (product_id,) in db.session.query(Product.id).filter(
+                    Product.id.in_([product_id for product_id, _ in batch]), *conditions
+                )
+            }
+            results.extend(item for item in batch if item[0] in allowed)
+            if len(results) >= limit:
+                return results[:limit]
+        return results
+
+search_index = SearchIndex()
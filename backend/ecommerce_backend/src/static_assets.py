@@ -0,0 +1,166 @@
+from flask import request, send_file, current_app
+from .compression import COMPRESSIBLE
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Serving the built storefront (the electro-store dist directory).
+#
+# At startup the directory is scanned once into a manifest: path -> content
+# hash, type and any precompressed `.br`/`.gz` siblings. Requests are
+# answered from the manifest without touching the filesystem until the file
+# is sent:
+#   - Files under the fingerprinted assets directory (Vite names them
+#     name-<hash>.ext) are cached by browsers forever: their URL changes
+#     whenever their content does.
+#   - Other files are revalidated on every use; unchanged ones get a 304.
+#   - The precompressed variant the client accepts is sent when present
+#     (`flask static compress` writes them after a build).
+#   - Any other path is a client-side route and gets index.html, which is
+#     kept in memory (with a gzipped copy).
+#
+# The manifest reflects the directory at startup; restart after deploying a
+# new build.
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Precompressed sibling suffixes, by content encoding
+VARIANTS = {'br': '.br', 'gzip': '.gz'}
+
+class Asset:
+    def __init__(self, path, digest, mimetype, immutable):
+        self.path = path
+        self.etag = digest
+        self.mimetype = mimetype
+        self.immutable = immutable
+        self.variants = {}   # encoding -> path of the precompressed file
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()[:20]
+
+def is_compressible(mimetype):
+    return mimetype in COMPRESSIBLE
+
+class StaticAssets:
+    def __init__(self):
+        self.root = None
+        self.immutable_prefix = 'assets/'
+        self.manifest = {}
+        self.index = None          # (body, gzipped body, etag)
+
+    def init_app(self, app):
+        self.root = app.config.get('STATIC_ROOT') or app.static_folder
+        self.immutable_prefix = app.config.get('STATIC_IMMUTABLE_PREFIX', 'assets/')
+        self.load()
+
+    def load(self):
+        manifest = {}
+        if self.root and os.path.isdir(self.root):
+            for directory, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    full_path = os.path.join(directory, filename)
+                    name = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                    if any(name.endswith(suffix) for suffix in VARIANTS.values()):
+                        continue
+                    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                    asset = Asset(full_path, file_digest(full_path), mimetype, name.startswith(self.immutable_prefix))
+                    for encoding, suffix in VARIANTS.items():
+                        if os.path.isfile(full_path + suffix):
+                            asset.variants[encoding] = full_path + suffix
+                    manifest[name] = asset
+
+        index = manifest.get('index.html')
+        if index is not None:
+            with open(index.path, 'rb') as f:
+                body = f.read()
+            self.index = (body, gzip.compress(body, mtime=0), index.etag)
+        else:
+            self.index = None
+        self.manifest = manifest
+
+    def compress(self):
+        # Write .gz (and .br, when brotli is installed) next to every
+        # compressible file that doesn't have them yet. Returns the count.
+        written = 0
+        for asset in self.manifest.values():
+            if not is_compressible(asset.mimetype):
+                continue
+            with open(asset.path, 'rb') as f:
+                body = f.read()
+            encoders = {'gzip': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                encoders['br'] = lambda data: brotli.compress(data, quality=11)
+            for encoding, encode in encoders.items():
+                target = asset.path + VARIANTS[encoding]
+                if os.path.isfile(target):
+                    continue
+                compressed = encode(body)
+                if len(compressed) < len(body):
+                    with open(target, 'wb') as f:
+                        f.write(compressed)
+                    written += 1
+        self.load()
+        return written
+
+    def _not_modified(self, etag, cache_control):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def serve_index(self):
+        if self.index is None:
+            return current_app.response_class('Not Found', status=404, mimetype='text/plain')
+        body, gzipped, etag = self.index
+        encoding = request.accept_encodings.best_match(['gzip'])
+        etag = f'{etag}-{encoding}' if encoding else etag
+        if etag in request.if_none_match:
+            return self._not_modified(etag, REVALIDATE)
+
+        response = current_app.response_class(gzipped if encoding else body, mimetype='text/html')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = REVALIDATE
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def serve(self, path):
+        asset = self.manifest.get(path)
+        if asset is None or path == 'index.html':
+            if path.startswith(self.immutable_prefix):
+                # A missing bundle chunk must not be answered with HTML
+                return current_app.response_class('Not Found', status=404, mimetype='text/plain')
+            return self.serve_index()
+
+        cache_control = IMMUTABLE if asset.immutable else REVALIDATE
+        encoding = request.accept_encodings.best_match(list(asset.variants)) if asset.variants else None
+        etag = f'{asset.etag}-{encoding}' if encoding else asset.etag
+        if etag in request.if_none_match:
+            return self._not_modified(etag, cache_control)
+
+        response = send_file(
+            asset.variants[encoding] if encoding else asset.path,
+            mimetype=asset.mimetype, etag=False, conditional=False, max_age=None
+        )
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+static_assets = StaticAssets()
@@ -0,0 +1,75 @@
+from flask import Response, current_app, stream_with_context
+import csv
+import io
+import json
+
+# Helpers for streaming large exports. Rows are produced lazily (usually from
+# a yield_per() query) and written out one line at a time, so memory use does
+# not grow with the size of the table.
+#
+# stream_json() does the same for JSON list responses: the document is
+# written as it is produced, so the first bytes go out after the first batch
+# of rows rather than after the whole list has been loaded and encoded.
+
+CHUNK_SIZE = 16384
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, separators=(',', ':'), default=str) + '\n'
+
+def csv_lines(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        # Flush every few rows rather than per row to keep chunks reasonably sized
+        if buffer.tell() > CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def export_lines(rows, fmt, columns=None):
+    if fmt == 'csv':
+        return csv_lines(rows, columns)
+    return ndjson_lines(rows)
+
+def stream_export(rows, fmt, filename, columns=None):
+    response = Response(
+        stream_with_context(export_lines(rows, fmt, columns)),
+        mimetype=FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{fmt}'
+    return response
+
+def json_chunks(key, items, encode=None, **extra):
+    # {extra..., key: [items...]} in chunks of about CHUNK_SIZE. Items are
+    # encoded with encode(item), or are JSON text already when it is None.
+    dumps = current_app.json.dumps
+    head = dumps(extra)[:-1]
+    buffer = io.StringIO()
+    buffer.write(head + (',' if extra else '') + dumps(key) + ':[')
+    first = True
+    for item in items:
+        if not first:
+            buffer.write(',')
+        buffer.write(item if encode is None else dumps(encode(item)))
+        first = False
+        if buffer.tell() > CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    buffer.write(']}\n')
+    yield buffer.getvalue()
+
+def stream_json(key, items, encode=None, **extra):
+    return Response(
+        stream_with_context(json_chunks(key, items, encode, **extra)),
+        mimetype='application/json'
+    )
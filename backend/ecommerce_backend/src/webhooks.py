@@ -0,0 +1,248 @@
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from .extensions import db
+from .models import Order, OrderError, StripeEvent
+
+# Stripe webhook inbox processing.
+#
+# The webhook route only verifies the signature and stores the event
+# (store_event); it never runs business logic inside Stripe's request. Worker
+# threads started by `flask payments work` claim due events in batches, run
+# the handler registered for the event type and mark the event processed in
+# the same transaction, so a handler's writes are applied exactly once. A
+# failed event is retried with exponential backoff and moved to 'dead' after
+# MAX_ATTEMPTS; `flask payments requeue` (or the admin API) sends dead events
+# back to the queue.
+#
+# A claim is a lease: if a worker dies mid-batch its events become due again
+# once LEASE_SECONDS have passed.
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 5        # seconds before the first retry, doubled per attempt
+BACKOFF_MAX = 3600
+LEASE_SECONDS = 120
+CLAIMABLE = ('pending', 'processing')
+
+# event type -> handler(event); a handler returns the ids of the products
+# whose stock it changed, if any
+HANDLERS = {}
+
+def handles(event_type):
+    def register(f):
+        HANDLERS[event_type] = f
+        return f
+    return register
+
+@handles('payment_intent.succeeded')
+def payment_intent_succeeded(event):
+    payment_intent = event['data']['object']
+    metadata = payment_intent.get('metadata') or {}
+    order_items = json.loads(metadata.get('order_items') or '[]')
+
+    # Unit prices were frozen when the intent was created, so a catalog
+    # price change before the payment succeeds doesn't change what was sold
+    prices = {
+        (str(item.get('product_id')), item.get('color') or None): item['price']
+        for item in order_items if item.get('price') is not None
+    }
+
+    # Create the order with its items, converting the checkout reservation
+    # when there is one. Commits together with the event's status.
+    order = Order.place(
+        metadata.get('user_id'),
+        [
+            {'product_id': item.get('product_id'), 'quantity': item.get('quantity'), 'color': item.get('color')}
+            for item in order_items
+        ],
+        reservation_id=metadata.get('reservation_id') or None,
+        prices=prices,
+        shipping_address=metadata.get('shipping_address', 'Not provided'),
+        billing_address=metadata.get('billing_address', 'Not provided'),
+        payment_method='stripe',
+        payment_status='completed',
+        status='processing'
+    )
+    # A charge that doesn't match the order (lines missing from the frozen
+    # prices are priced from the catalog) needs a person to look at it
+    if payment_intent.get('amount') != int(round(order.total_amount * 100)):
+        raise OrderError(
+            f"Payment amount {payment_intent.get('amount')} does not match the order total {order.total_amount}!"
+        )
+    return {item.product_id for item in order.items}
+
+def store_event(event_id, event_type, payload):
+    # Returns False when the event was already received
+    db.session.add(StripeEvent(id=event_id, type=event_type, payload=payload, status='pending'))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+def backoff(attempts):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+def claim(batch_size, lease=LEASE_SECONDS):
+    # Lease up to batch_size due events to a fresh claim token. Returns
+    # (token, [(id, type, payload, attempts), ...]).
+    now = datetime.datetime.utcnow()
+    due = select(StripeEvent.id).where(
+        StripeEvent.status.in_(CLAIMABLE), StripeEvent.next_attempt_at <= now
+    ).order_by(StripeEvent.next_attempt_at).limit(batch_size).with_for_update(skip_locked=True)
+    ids = [event_id for (event_id,) in db.session.execute(due)]
+    if not ids:
+        db.session.commit()
+        return None, []
+
+    # The same conditions again, so an event another worker claimed in the
+    # meantime (its lease is now in the future) is skipped
+    token = str(uuid.uuid4())
+    db.session.execute(
+        update(StripeEvent)
+        .where(StripeEvent.id.in_(ids), StripeEvent.status.in_(CLAIMABLE), StripeEvent.next_attempt_at <= now)
+        .values(
+            status='processing', claimed_by=token, attempts=StripeEvent.attempts + 1,
+            next_attempt_at=now + datetime.timedelta(seconds=lease)
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    events = db.session.query(
+        StripeEvent.id, StripeEvent.type, StripeEvent.payload, StripeEvent.attempts
+    ).filter(StripeEvent.claimed_by == token, StripeEvent.status == 'processing').all()
+    db.session.commit()
+    return token, events
+
+def finish(event_id, token, **values):
+    # Update an event only while this worker still holds its lease
+    result = db.session.execute(
+        update(StripeEvent)
+        .where(StripeEvent.id == event_id, StripeEvent.claimed_by == token)
+        .values(claimed_by=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def process(token, event):
+    # Returns True when the event was processed
+    from .routes.inventory import invalidate_availability
+
+    handler = HANDLERS.get(event.type)
+    try:
+        changed = handler(json.loads(event.payload)) if handler is not None else None
+        if not finish(event.id, token, status='processed', processed_at=datetime.datetime.utcnow(), last_error=None):
+            raise RuntimeError('Lease expired before the event was processed')
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning('Stripe event %s failed (attempt %s): %s', event.id, event.attempts, e)
+        # Bad order data won't fix itself: dead-letter it right away
+        if event.attempts >= MAX_ATTEMPTS or isinstance(e, OrderError):
+            values = {'status': 'dead'}
+        else:
+            values = {
+                'status': 'pending',
+                'next_attempt_at': datetime.datetime.utcnow() + datetime.timedelta(seconds=backoff(event.attempts))
+            }
+        finish(event.id, token, last_error=str(e)[:2000], **values)
+        db.session.commit()
+        return False
+
+    invalidate_availability(changed)
+    return True
+
+def drain(batch_size=100):
+    # Process due events until none are left. Returns (processed, failed).
+    processed = failed = 0
+    while True:
+        token, events = claim(batch_size)
+        if not events:
+            return processed, failed
+        for event in events:
+            if process(token, event):
+                processed += 1
+            else:
+                failed += 1
+
+def run_workers(app, workers=4, batch_size=100, poll_interval=1.0, stop=None):
+    # Blocks until stop is set (or KeyboardInterrupt)
+    stop = stop or threading.Event()
+
+    def work():
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    processed, failed = drain(batch_size)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Stripe event worker error')
+                    processed = failed = 0
+                if not processed and not failed:
+                    stop.wait(poll_interval)
+            db.session.remove()
+
+    threads = [threading.Thread(target=work, name=f'stripe-events-{n}', daemon=True) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+def requeue(event_ids=None):
+    # Send dead events (all, or the given ids) back to the queue
+    query = update(StripeEvent).where(StripeEvent.status == 'dead')
+    if event_ids is not None:
+        query = query.where(StripeEvent.id.in_(event_ids))
+    result = db.session.execute(
+        query.values(status='pending', attempts=0, next_attempt_at=datetime.datetime.utcnow(), claimed_by=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+def stats():
+    counts = dict(db.session.query(StripeEvent.status, db.func.count()).group_by(StripeEvent.status).all())
+    return {status: counts.get(status, 0) for status in ('pending', 'processing', 'processed', 'dead')}
+
+# Local stub for load tests: builds events and signs them the way Stripe does
+# (Stripe-Signature: t=<unix time>,v1=<HMAC-SHA256 of "<t>.<body>">).
+
+def sign(payload, secret, timestamp=None):
+    timestamp = int(timestamp if timestamp is not None else time.time())
+    signature = hmac.new(secret.encode('utf-8'), f'{timestamp}.{payload}'.encode('utf-8'), hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+def stub_payment_event(user_id, items, amount=0):
+    return {
+        'id': f'evt_{uuid.uuid4().hex}',
+        'object': 'event',
+        'type': 'payment_intent.succeeded',
+        'created': int(time.time()),
+        'data': {
+            'object': {
+                'id': f'pi_{uuid.uuid4().hex}',
+                'object': 'payment_intent',
+                'amount': int(round(amount * 100)),
+                'currency': 'usd',
+                'metadata': {'user_id': user_id, 'order_items': json.dumps(items)}
+            }
+        }
+    }
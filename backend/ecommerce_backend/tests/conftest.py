@@ -0,0 +1,105 @@
+from contextlib import contextmanager
+from sqlalchemy import event, text
+import os
+import sys
+import pytest
+
+# The app is configured from the environment when src.main is imported, so
+# the test database and settings are put in place first. Every test starts
+# from empty tables.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: slow benchmark, run with -m benchmark')
+
+def pytest_collection_modifyitems(config, items):
+    # Benchmarks only run when selected with -m benchmark
+    if 'benchmark' in (config.getoption('markexpr') or ''):
+        return
+    skip = pytest.mark.skip(reason='benchmark; run with -m benchmark')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    root = tmp_path_factory.mktemp('app')
+    os.environ['DATABASE_URL'] = f"sqlite:///{root / 'test.db'}"
+    os.environ['PAYMENT_GATEWAY'] = 'fake'
+    os.environ['STATIC_ROOT'] = str(root / 'static')
+    from src.main import app
+    app.config['TESTING'] = True
+    return app
+
+@pytest.fixture
+def db(app):
+    from src.extensions import db
+    with app.app_context():
+        yield db
+        db.session.remove()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+        from src.search import search_index
+        from src.cache import response_cache
+        from src.routes.decorators import identity_cache
+        search_index.rebuild()
+        response_cache.backend.clear()
+        response_cache.versions.clear()
+        identity_cache.clear()
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
+
+@pytest.fixture
+def make_products(db):
+    from src.models import Product, ProductImage, ProductFeature, ProductSpecification, ProductColor
+
+    def make(count, **fields):
+        products = []
+        for n in range(count):
+            product = Product(
+                name=f'Phone {n}', category='phones', price=100 + n, image='phone.png',
+                description=f'Phone {n} with a long lasting battery', **fields
+            )
+            product.images = [ProductImage(url=f'phone-{n}-front.png'), ProductImage(url=f'phone-{n}-back.png')]
+            product.features = [ProductFeature(text='Waterproof')]
+            product.specifications = [ProductSpecification(key='RAM', value='8GB')]
+            product.colors = [ProductColor(name='black'), ProductColor(name='white')]
+            products.append(product)
+        db.session.add_all(products)
+        db.session.commit()
+        return products
+
+    return make
+
+@pytest.fixture
+def auth_headers(client):
+    # The first registered user is the admin
+    def login(username, password='secret'):
+        client.post('/api/auth/register', json={'username': username, 'email': f'{username}@example.com', 'password': password})
+        token = client.post('/api/auth/login', json={'username': username, 'password': password}).json['token']
+        return {'Authorization': f'Bearer {token}'}
+
+    return login
+
+@pytest.fixture
+def statements(db):
+    # with statements() as executed: ... -> the SQL statements run meanwhile
+    @contextmanager
+    def capture():
+        executed = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            executed.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield executed
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    return capture
@@ -0,0 +1,79 @@
+# The admin analytics read the order_daily_stats rollup, which orders keep
+# up to date as they are placed and change status. rebuild() recomputes it
+# from the orders table and has to agree with the incremental updates.
+
+def rollup(db):
+    from src.models import OrderDailyStat
+
+    db.session.expire_all()
+    return sorted(
+        (stat.day, stat.status, stat.order_count, round(stat.revenue, 2))
+        for stat in OrderDailyStat.query.all() if stat.order_count
+    )
+
+def place(client, headers, product_id, quantity):
+    response = client.post('/api/orders/orders', headers=headers, json={
+        'items': [{'product_id': product_id, 'quantity': quantity}],
+        'shipping_address': 'Street 1',
+        'billing_address': 'Street 1',
+        'payment_method': 'card'
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['order']['id']
+
+def set_status(client, headers, order_id, status):
+    response = client.put(f'/api/orders/admin/orders/{order_id}', headers=headers, json={'status': status})
+    assert response.status_code == 200, response.get_json()
+
+def test_incremental_rollup_matches_a_rebuild(client, db, make_products, auth_headers):
+    from src.models import OrderDailyStat
+
+    admin = auth_headers('admin')
+    shopper = auth_headers('shopper')
+    first, second = make_products(2, stock_quantity=10)
+
+    place(client, shopper, first.id, 2)
+    cancelled = place(client, shopper, second.id, 1)
+    shipped = place(client, shopper, first.id, 1)
+    set_status(client, admin, cancelled, 'cancelled')
+    set_status(client, admin, shipped, 'processing')
+    set_status(client, admin, shipped, 'shipped')
+    # Not a change
+    set_status(client, admin, shipped, 'shipped')
+
+    incremental = rollup(db)
+    assert [(status, count, revenue) for _, status, count, revenue in incremental] == [
+        ('cancelled', 1, 101), ('pending', 1, 200), ('shipped', 1, 100)
+    ]
+    assert OrderDailyStat.rebuild() == 3
+    assert rollup(db) == incremental
+
+def test_analytics_read_the_rollup(client, db, make_products, auth_headers):
+    from src.models import OrderDailyStat
+
+    admin = auth_headers('admin')
+    shopper = auth_headers('shopper')
+    first, second = make_products(2, stock_quantity=10)
+    place(client, shopper, first.id, 2)
+    set_status(client, admin, place(client, shopper, second.id, 1), 'cancelled')
+
+    analytics = client.get('/api/admin/analytics', headers=admin).get_json()
+    assert analytics['totals']['orders'] == 1
+    assert analytics['totals']['revenue'] == 200
+    assert analytics['period_totals']['orders'] == 1
+    assert analytics['orders_by_status'] == {
+        'cancelled': {'orders': 1, 'revenue': 101}, 'pending': {'orders': 1, 'revenue': 200}
+    }
+    assert [(day['orders'], day['revenue']) for day in analytics['daily']] == [(1, 200)]
+
+    # Order counts and revenue come from the rollup, not the orders table
+    OrderDailyStat.query.delete()
+    db.session.commit()
+    analytics = client.get('/api/admin/analytics', headers=admin).get_json()
+    assert analytics['totals']['orders'] == 0
+    assert analytics['daily'] == []
+    assert len(analytics['recent_orders']) == 2
+
+    OrderDailyStat.rebuild()
+    analytics = client.get('/api/admin/analytics', headers=admin).get_json()
+    assert analytics['totals'] == dict(analytics['totals'], orders=1, revenue=200)
@@ -0,0 +1,62 @@
+from src.routes.decorators import identity_cache
+
+def test_check_auth_is_served_from_the_identity_cache(client, auth_headers, statements):
+    headers = auth_headers('alice')
+    first = client.get('/api/auth/check-auth', headers=headers)
+    assert first.status_code == 200
+
+    with statements() as executed:
+        response = client.get('/api/auth/check-auth', headers=headers)
+    assert response.status_code == 200
+    assert response.json['user'] == first.json['user']
+    assert response.json['user']['username'] == 'alice'
+    assert executed == []
+
+def test_deleted_user_with_a_cached_identity_gets_401(client, db, auth_headers):
+    from src.models import User
+
+    headers = auth_headers('alice')
+    assert client.get('/api/auth/check-auth', headers=headers).status_code == 200
+
+    # Deleted by another worker: this worker's cache still has the identity
+    db.session.delete(User.query.filter_by(username='alice').one())
+    db.session.commit()
+    assert identity_cache.stats()['size'] == 1
+
+    # Updating the profile needs the row
+    response = client.put('/api/auth/profile', json={'first_name': 'Alice'}, headers=headers)
+    assert response.status_code == 401
+    assert response.json == {'message': 'User not found!'}
+    # ...and the stale identity is gone, so the token is checked again
+    assert identity_cache.stats()['size'] == 0
+    assert client.get('/api/auth/check-auth', headers=headers).status_code == 401
+
+def test_demoted_admin_is_refused_at_once(client, db, auth_headers):
+    from src.models import User
+
+    headers = auth_headers('admin')
+    assert client.get('/api/users/users', headers=headers).status_code == 200
+
+    # Demoted by another worker, without touching this worker's cache
+    User.query.filter_by(username='admin').update({'role': 'user'})
+    db.session.commit()
+    response = client.get('/api/users/users', headers=headers)
+    assert response.status_code == 403
+    assert client.get('/api/auth/check-auth', headers=headers).json['user']['role'] == 'user'
+
+def test_change_made_by_another_worker_retires_cached_identities(client, db, auth_headers):
+    from src.cache import DatabaseVersions, response_cache
+    from src.models import User
+    from src.routes.decorators import VERSION_KEY
+
+    headers = auth_headers('alice')
+    assert client.get('/api/auth/check-auth', headers=headers).json['user']['first_name'] is None
+
+    User.query.filter_by(username='alice').update({'first_name': 'Alice'})
+    db.session.commit()
+    DatabaseVersions().incr(VERSION_KEY)
+    # Still cached until this worker polls the version again
+    assert client.get('/api/auth/check-auth', headers=headers).json['user']['first_name'] is None
+
+    response_cache.versions.clear()
+    assert client.get('/api/auth/check-auth', headers=headers).json['user']['first_name'] == 'Alice'
@@ -0,0 +1,162 @@
+import threading
+import pytest
+
+# Carts live in cart_items by default, so every worker sees the same cart:
+# concurrent adds to a line add up and a checkout empties the cart for all.
+
+def cart(client, headers):
+    return {(item['product_id'], item['quantity']) for item in client.get('/api/cart/', headers=headers).get_json()['cart']['items']}
+
+def test_database_backend_is_the_default(app):
+    from src.cart_store import cart_store, DatabaseCartBackend
+
+    assert isinstance(cart_store.backend, DatabaseCartBackend)
+    assert cart_store.stats()['flush_interval'] == 0
+
+def test_concurrent_adds_add_up(app, client, make_products, auth_headers):
+    headers = auth_headers('shopper')
+    product_id = make_products(1)[0].id
+
+    def add():
+        worker = app.test_client()
+        for _ in range(5):
+            assert worker.post('/api/cart/items', headers=headers, json={'product_id': product_id, 'quantity': 1}).status_code == 200
+
+    threads = [threading.Thread(target=add) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cart(client, headers) == {(product_id, 30)}
+
+    client.post('/api/cart/items', headers=headers, json={'product_id': product_id, 'quantity': 90})
+    assert cart(client, headers) == {(product_id, 99)}
+
+def test_stores_in_other_workers_see_changes(app, client, make_products, auth_headers):
+    from src.cart_store import CartStore
+
+    headers = auth_headers('shopper')
+    user_id = client.get('/api/auth/profile', headers=headers).get_json()['user']['id']
+    product_id = make_products(1, stock_quantity=10)[0].id
+    other = CartStore()
+    other.init_app(app)
+
+    other.add(user_id, product_id, None, 2)
+    assert cart(client, headers) == {(product_id, 2)}
+
+    response = client.post('/api/cart/checkout', headers=headers, json={
+        'shipping_address': 'Street 1', 'billing_address': 'Street 1', 'payment_method': 'card'
+    })
+    assert response.status_code == 201
+    assert other.lines(user_id) == {}
+
+    other.set_quantity(user_id, product_id, None, 3)
+    other.remove(user_id, product_id, None)
+    assert cart(client, headers) == set()
+
+def test_memory_backend_refuses_several_workers(app):
+    from src.cart_store import CartStore
+
+    app.config.update(CART_BACKEND='memory', WEB_CONCURRENCY=4)
+    try:
+        with pytest.raises(RuntimeError, match='several workers'):
+            CartStore().init_app(app)
+    finally:
+        app.config.update(CART_BACKEND='database', WEB_CONCURRENCY=1)
+
+class FakeRedis:
+    # The hash and set commands RedisCartBackend uses. expire_before_write
+    # drops the next hash written to, as if it had expired just before.
+    def __init__(self):
+        self.data = {}
+        self.expire_before_write = False
+
+    def _hash(self, key):
+        if self.expire_before_write:
+            self.expire_before_write = False
+            self.data.pop(key, None)
+        return self.data.setdefault(key, {})
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hsetnx(self, key, field, value):
+        fields = self.data.setdefault(key, {})
+        if field in fields:
+            return False
+        fields[field] = value
+        return True
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        fields = self._hash(key)
+        fields.update(mapping or {field: value})
+
+    def hincrby(self, key, field, amount):
+        fields = self._hash(key)
+        fields[field] = int(fields.get(field, 0)) + amount
+        return fields[field]
+
+    def hdel(self, key, field):
+        self.data.get(key, {}).pop(field, None)
+
+    def hlen(self, key):
+        return len(self.data.get(key, {}))
+
+    def hexists(self, key, field):
+        return field in self.data.get(key, {})
+
+    def expire(self, key, ttl):
+        pass
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(members)
+
+    def srem(self, key, member):
+        members = self.data.get(key, set())
+        if member in members:
+            members.discard(member)
+            return 1
+        return 0
+
+    def spop(self, key, count):
+        members = self.data.pop(key, set())
+        return list(members)
+
+def test_redis_cart_expiring_before_a_write_is_reloaded(app, db, client, make_products, auth_headers):
+    from src.cart_store import CartStore, RedisCartBackend
+
+    headers = auth_headers('shopper')
+    user_id = client.get('/api/auth/profile', headers=headers).get_json()['user']['id']
+    first, second, third = [product.id for product in make_products(3)]
+    client.post('/api/cart/items', headers=headers, json={'product_id': first, 'quantity': 1})
+    client.post('/api/cart/items', headers=headers, json={'product_id': second, 'quantity': 2})
+
+    redis = FakeRedis()
+    store = CartStore()
+    store.init_app(app, backend=RedisCartBackend(redis))
+    store.flush_interval = 0
+    assert store.lines(user_id) == {(first, ''): 1, (second, ''): 2}
+
+    redis.expire_before_write = True
+    store.add(user_id, third, None, 3)
+    assert cart(client, headers) == {(first, 1), (second, 2), (third, 3)}
+
+def test_database_cart_retries_a_conflicting_insert_once(app, db, monkeypatch):
+    from sqlalchemy.exc import IntegrityError
+    from src.cart_store import CartError, DatabaseCartBackend
+
+    backend = DatabaseCartBackend()
+    attempts = []
+
+    def conflict(*args):
+        attempts.append(args)
+        raise IntegrityError('INSERT INTO cart_items', {}, Exception('UNIQUE constraint failed'))
+
+    monkeypatch.setattr(backend, '_update', conflict)
+    with pytest.raises(CartError, match='changed while updating'):
+        backend.update('user', ('product', ''), 1, increment=True)
+    assert len(attempts) == 2
@@ -0,0 +1,67 @@
+import pytest
+
+# Catalog reads load child collections with one IN query per table, so the
+# number of statements must not grow with the number of products listed.
+
+N = 20
+
+def listing_statements(client, statements, path):
+    from src.cache import response_cache
+
+    # A fresh catalog version, so the request isn't answered from the cache
+    response_cache.bump_catalog_version()
+    with statements() as executed:
+        response = client.get(path)
+        body = response.get_json()
+    assert response.status_code == 200
+    return len(body['products']), [statement for statement in executed if statement.lstrip().upper().startswith('SELECT')]
+
+@pytest.mark.parametrize('path', [
+    '/api/products/?limit=100',
+    '/api/products/?limit=100&fields=id,name,images,colors',
+    '/api/products/?sort=price-low&limit=100'
+])
+def test_listing_statement_count_does_not_grow_with_products(client, make_products, statements, path):
+    make_products(N)
+    listed, small = listing_statements(client, statements, path)
+    assert listed == N
+
+    make_products(9 * N)
+    listed, large = listing_statements(client, statements, path)
+    assert listed == 100
+
+    assert len(large) == len(small), large
+
+# Full listings are fetched yield_per(500) rows at a time, each chunk with one
+# IN query per child collection
+CHUNK = 500
+
+@pytest.mark.parametrize('count', [CHUNK + 100, 2 * CHUNK + 200])
+@pytest.mark.parametrize('path', ['/api/products/', '/api/products/categories/{category_id}/products'])
+def test_full_listing_statements_grow_per_chunk_only(client, db, make_products, statements, path, count):
+    from src.models import Category, Product
+
+    category = Category(name='Phones', image='phones.png', description='Phones')
+    db.session.add(category)
+    db.session.commit()
+    make_products(count)
+    Product.query.update({'category': category.id})
+    db.session.commit()
+    path = path.format(category_id=category.id)
+
+    listed, executed = listing_statements(client, statements, path)
+    assert listed == count
+
+    # The main query (plus the category lookup) and each chunk's IN queries
+    base = 2 if 'categories' in path else 1
+    chunks = -(-count // CHUNK)
+    assert len(executed) <= base + len(Product.COLLECTION_FIELDS) * chunks, executed
+
+def test_product_detail_statement_count(client, make_products, statements):
+    product_id = make_products(1)[0].id
+    with statements() as executed:
+        response = client.get(f'/api/products/{product_id}')
+    assert response.status_code == 200
+    # The product row plus one IN query per child collection
+    selects = [statement for statement in executed if statement.lstrip().upper().startswith('SELECT')]
+    assert len(selects) <= 6, selects
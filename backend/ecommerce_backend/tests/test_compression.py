@@ -0,0 +1,71 @@
+import gzip
+import json
+
+# Text responses are gzipped when the client accepts it and they are big
+# enough; streamed ones are compressed chunk by chunk and keep streaming.
+
+def compressed(app, response, accept='gzip'):
+    from src.compression import compressor
+
+    headers = {'Accept-Encoding': accept} if accept else {}
+    with app.test_request_context('/', headers=headers):
+        return compressor.after_request(response)
+
+def text_response(app, body, **kwargs):
+    return app.response_class(body, mimetype=kwargs.pop('mimetype', 'application/json'), **kwargs)
+
+def test_large_text_responses_are_gzipped(app):
+    body = json.dumps({'products': [{'name': f'Phone {n}'} for n in range(200)]})
+    response = compressed(app, text_response(app, body))
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert gzip.decompress(response.get_data()).decode() == body
+
+def test_vary_is_set_even_when_not_compressing(app):
+    body = 'x' * 4096
+    response = compressed(app, text_response(app, body), accept=None)
+
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.vary
+    assert response.get_data(as_text=True) == body
+
+def test_small_responses_are_sent_as_they_are(app):
+    from src.compression import compressor
+
+    body = 'x' * (compressor.min_size - 1)
+    response = compressed(app, text_response(app, body))
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_data(as_text=True) == body
+
+    response = compressed(app, text_response(app, body + 'x'))
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+def test_encoded_and_binary_responses_are_skipped(app):
+    body = gzip.compress(b'x' * 4096)
+    response = compressed(app, text_response(app, body, headers={'Content-Encoding': 'gzip'}))
+    assert response.get_data() == body
+
+    response = compressed(app, text_response(app, b'\0' * 4096, mimetype='image/png'))
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' not in response.vary
+
+def test_streamed_responses_stay_streamed(app):
+    chunks = [json.dumps({'n': n}) + '\n' for n in range(50)]
+    response = compressed(app, text_response(app, iter(chunks), mimetype='application/x-ndjson'))
+
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    # Every chunk is flushed as it is compressed
+    parts = list(response.response)
+    assert len(parts) > len(chunks)
+    assert gzip.decompress(b''.join(parts)).decode() == ''.join(chunks)
+
+def test_streamed_product_listing_is_gzipped(client, make_products):
+    make_products(30)
+    response = client.get('/api/products/', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(json.loads(gzip.decompress(response.get_data()))['products']) == 30
@@ -0,0 +1,39 @@
+import pytest
+from flask import g, has_app_context
+from sqlalchemy import event
+
+# Views marked @read_replica route their SELECTs to the replica, including
+# the ones a streamed response runs while it is being sent.
+
+@pytest.mark.parametrize('path', ['/api/products/', '/api/products/categories/{category_id}/products'])
+def test_streamed_listing_reads_stay_on_the_replica(app, client, db, make_products, path):
+    from src.cache import response_cache
+    from src.models import Category, Product
+
+    category = Category(name='Phones', image='phones.png', description='Phones')
+    db.session.add(category)
+    db.session.commit()
+    make_products(20)
+    Product.query.update({'category': category.id})
+    db.session.commit()
+    response_cache.bump_catalog_version()
+    url = path.format(category_id=category.id)
+
+    selects = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'cache_versions' not in statement:
+            selects.append(bool(has_app_context() and g.get('read_replica')))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+        assert response.is_streamed
+        assert len(response.get_json()['products']) == 20
+        response.close()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    # The product rows and every child collection
+    assert len(selects) > 4
+    assert all(selects), selects
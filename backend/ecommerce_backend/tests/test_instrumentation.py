@@ -0,0 +1,42 @@
+# Requests are counted per route template and exposed on /api/metrics in the
+# Prometheus text format.
+
+LABELS = 'method="GET",blueprint="product",route="/api/products/<product_id>"'
+
+def sample(text, name):
+    # The value of the sample line starting with name, or None
+    for line in text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+def test_metrics_count_requests_per_route(client, make_products):
+    product_id = make_products(1)[0].id
+    before = client.get('/api/metrics').get_data(as_text=True)
+
+    for _ in range(3):
+        assert client.get(f'/api/products/{product_id}').status_code == 200
+    assert client.get('/api/products/missing').status_code == 404
+
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in text
+
+    def added(name):
+        return sample(text, name) - (sample(before, name) or 0)
+
+    assert added(f'http_requests_total{{{LABELS},status="200"}}') == 3
+    assert added(f'http_requests_total{{{LABELS},status="404"}}') == 1
+    assert added(f'http_request_duration_seconds_count{{{LABELS}}}') == 4
+    assert added(f'http_request_duration_seconds_bucket{{{LABELS},le="+Inf"}}') == 4
+    assert added(f'http_request_sql_statements_count{{{LABELS}}}') == 4
+    assert added(f'http_response_size_bytes_sum{{{LABELS}}}') > 0
+
+def test_metrics_token_is_required_when_configured(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'scrape-me')
+
+    assert client.get('/api/metrics').status_code == 401
+    assert client.get('/api/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/api/metrics', headers={'Authorization': 'Bearer scrape-me'}).status_code == 200
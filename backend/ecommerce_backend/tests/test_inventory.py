@@ -0,0 +1,93 @@
+import threading
+import time
+import pytest
+
+# Stock writes (orders, reservations, releases) are visible at once through
+# the availability endpoint without retiring the cached catalog, which leaves
+# stock out, and concurrent orders never sell more than is in stock.
+
+def order(client, headers, product_id, quantity=1):
+    return client.post('/api/orders/orders', headers=headers, json={
+        'shipping_address': 'Street 1', 'billing_address': 'Street 1', 'payment_method': 'card',
+        'items': [{'product_id': product_id, 'quantity': quantity}]
+    })
+
+def availability(client, product_id):
+    return client.get(f'/api/inventory/availability?product_ids={product_id}').get_json()['availability'][0]
+
+def test_order_updates_availability_and_keeps_the_cached_catalog(client, make_products, auth_headers):
+    headers = auth_headers('shopper')
+    product_id = make_products(1, stock_quantity=3)[0].id
+
+    cached = client.get(f'/api/products/{product_id}')
+    assert 'stock_quantity' not in cached.get_json()['product']
+    assert 'in_stock' not in cached.get_json()['product']
+    assert availability(client, product_id)['stock_quantity'] == 3
+
+    assert order(client, headers, product_id, 3).status_code == 201
+
+    assert client.get(f'/api/products/{product_id}', headers={'If-None-Match': cached.headers['ETag']}).status_code == 304
+    assert availability(client, product_id)['stock_quantity'] == 0
+    assert availability(client, product_id)['in_stock'] is False
+    listed = client.get('/api/products/?limit=10').get_json()['products']
+    assert not {'in_stock', 'stock_quantity'} & set(listed[0])
+
+def test_reservation_updates_availability(client, make_products, auth_headers):
+    headers = auth_headers('shopper')
+    product_id = make_products(1, stock_quantity=5)[0].id
+    assert availability(client, product_id)['stock_quantity'] == 5
+
+    reservation = client.post('/api/inventory/reservations', headers=headers, json={
+        'items': [{'product_id': product_id, 'quantity': 2}]
+    }).get_json()['reservation']
+    assert availability(client, product_id)['stock_quantity'] == 3
+
+    client.delete(f"/api/inventory/reservations/{reservation['id']}", headers=headers)
+    assert availability(client, product_id)['stock_quantity'] == 5
+
+def test_stock_fields_are_only_requestable_uncached(client, make_products):
+    product_id = make_products(1, stock_quantity=5)[0].id
+
+    assert client.get('/api/products/?fields=name,stock_quantity').status_code == 400
+    response = client.post('/api/products/batch', json={'ids': [product_id], 'fields': ['stock_quantity']})
+    assert response.get_json()['products'][product_id]['stock_quantity'] == 5
+
+# 4,000 orders racing for 1,000 units of one product
+STOCK = 1000
+THREADS = 32
+ORDERS_PER_THREAD = 125
+
+@pytest.mark.benchmark
+def test_parallel_orders_never_oversell(app, client, db, make_products, auth_headers):
+    from src.models import OrderItem, Product
+
+    buyers = [auth_headers(f'buyer{n}') for n in range(THREADS)]
+    product_id = make_products(1, stock_quantity=STOCK)[0].id
+    statuses = []
+    start = threading.Barrier(THREADS + 1)
+
+    def buy(headers):
+        buyer = app.test_client()
+        start.wait()
+        for _ in range(ORDERS_PER_THREAD):
+            statuses.append(order(buyer, headers, product_id).status_code)
+
+    threads = [threading.Thread(target=buy, args=(headers,)) for headers in buyers]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    db.session.expire_all()
+    product = db.session.get(Product, product_id)
+    sold = db.session.query(db.func.sum(OrderItem.quantity)).filter(OrderItem.product_id == product_id).scalar()
+    print(f'\n{len(statuses)} orders from {THREADS} threads in {elapsed:.2f}s '
+          f'({len(statuses) / elapsed:.0f}/s): {statuses.count(201)} placed, {statuses.count(409)} out of stock')
+
+    assert len(statuses) == THREADS * ORDERS_PER_THREAD
+    assert set(statuses) <= {201, 409}
+    assert statuses.count(201) == sold == STOCK
+    assert product.stock_quantity == 0 and not product.in_stock
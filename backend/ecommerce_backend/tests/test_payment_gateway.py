@@ -0,0 +1,78 @@
+import pytest
+from src.payment_gateway import CircuitBreaker, GatewayError, GatewayUnavailable, PaymentGateway
+
+# The circuit breaker around payment gateway calls: open after repeated
+# failures, one trial call once reset_timeout has passed, closed again when
+# the trial succeeds.
+
+class FlakyBackend:
+    def __init__(self):
+        self.error = None
+        self.calls = 0
+
+    def create_payment_intent(self, amount, currency, metadata, idempotency_key):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return {'id': 'pi_1', 'client_secret': 'pi_1_secret', 'amount': amount, 'status': 'requires_payment_method'}
+
+    def is_transient(self, error):
+        return True
+
+def gateway(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('src.payment_gateway.time.monotonic', lambda: clock[0])
+    payments = PaymentGateway()
+    payments.backend = FlakyBackend()
+    payments.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    return payments, clock
+
+def pay(payments):
+    return payments.create_payment_intent(100, 'usd', {}, 'key')
+
+def test_breaker_opens_half_opens_and_closes(monkeypatch):
+    payments, clock = gateway(monkeypatch)
+    payments.backend.error = GatewayError('down')
+    for _ in range(2):
+        with pytest.raises(GatewayError):
+            pay(payments)
+    assert payments.breaker.state == 'open'
+    with pytest.raises(GatewayUnavailable):
+        pay(payments)
+    assert payments.backend.calls == 2
+
+    clock[0] += 30
+    assert payments.breaker.state == 'half-open'
+    payments.backend.error = None
+    assert pay(payments)['amount'] == 100
+    assert payments.breaker.state == 'closed'
+
+def test_failed_trial_opens_the_breaker_again(monkeypatch):
+    payments, clock = gateway(monkeypatch)
+    payments.backend.error = GatewayError('down')
+    for _ in range(2):
+        with pytest.raises(GatewayError):
+            pay(payments)
+
+    clock[0] += 30
+    with pytest.raises(GatewayError):
+        pay(payments)
+    assert payments.breaker.state == 'open'
+
+def test_unexpected_error_in_the_trial_releases_it(monkeypatch):
+    payments, clock = gateway(monkeypatch)
+    payments.backend.error = GatewayError('down')
+    for _ in range(2):
+        with pytest.raises(GatewayError):
+            pay(payments)
+
+    clock[0] += 30
+    payments.backend.error = KeyError('client_secret')
+    with pytest.raises(KeyError):
+        pay(payments)
+    assert not payments.breaker.trial_running
+
+    clock[0] += 30
+    payments.backend.error = None
+    assert pay(payments)['amount'] == 100
+    assert payments.breaker.state == 'closed'
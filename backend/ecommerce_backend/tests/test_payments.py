@@ -0,0 +1,272 @@
+import datetime
+import json
+import uuid
+
+# Orders are placed from payment_intent.succeeded webhook events. A payment
+# may succeed after its checkout reservation expired; the order is still
+# placed, and the event is dead-lettered only when the stock is gone.
+
+def reserve(client, headers, product_id, quantity):
+    response = client.post('/api/inventory/reservations', headers=headers, json={
+        'items': [{'product_id': product_id, 'quantity': quantity}]
+    })
+    assert response.status_code == 201
+    return response.get_json()['reservation']['id']
+
+def pay(client, headers, reservation_id):
+    # The PaymentIntent as Stripe would send it back once paid
+    from src.payment_gateway import payment_gateway
+
+    response = client.post('/api/payment/create-payment-intent', headers=headers, json={'reservation_id': reservation_id})
+    assert response.status_code == 200, response.get_json()
+    secret = response.get_json()['clientSecret']
+    intent = next(intent for intent in payment_gateway.backend.intents.values() if intent['client_secret'] == secret)
+    return dict(intent, status='succeeded')
+
+def succeed(db, intent):
+    # Deliver payment_intent.succeeded and run the worker; returns the event
+    from src.models import StripeEvent
+    from src.webhooks import drain, store_event
+
+    event_id = f'evt_{uuid.uuid4().hex}'
+    payload = {'id': event_id, 'type': 'payment_intent.succeeded', 'data': {'object': intent}}
+    assert store_event(event_id, 'payment_intent.succeeded', json.dumps(payload))
+    drain()
+    return db.session.get(StripeEvent, event_id)
+
+def expire(db, reservation_id, sweep=False):
+    from src.models import InventoryReservation
+
+    InventoryReservation.query.filter_by(checkout_id=reservation_id).update({
+        'expires_at': datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    })
+    db.session.commit()
+    if sweep:
+        InventoryReservation.sweep()
+
+def stock(db, product_id):
+    from src.models import Product
+
+    db.session.expire_all()
+    return db.session.get(Product, product_id).stock_quantity
+
+def orders(db):
+    from src.models import Order
+
+    return [(order.status, [(item.product_id, item.quantity) for item in order.items]) for order in Order.query.all()]
+
+def test_payment_converts_the_reservation(client, db, make_products, auth_headers):
+    headers = auth_headers('shopper')
+    product_id = make_products(1, stock_quantity=5)[0].id
+    reservation_id = reserve(client, headers, product_id, 2)
+
+    event = succeed(db, pay(client, headers, reservation_id))
+    assert event.status == 'processed'
+    assert orders(db) == [('processing', [(product_id, 2)])]
+    assert stock(db, product_id) == 3
+
+def test_payment_after_expiry_converts_held_units(client, db, make_products, auth_headers):
+    headers = auth_headers('shopper')
+    product_id = make_products(1, stock_quantity=5)[0].id
+    reservation_id = reserve(client, headers, product_id, 2)
+    intent = pay(client, headers, reservation_id)
+    expire(db, reservation_id)
+
+    assert succeed(db, intent).status == 'processed'
+    assert orders(db) == [('processing', [(product_id, 2)])]
+    assert stock(db, product_id) == 3
+
+def test_payment_after_the_sweep_takes_stock_again(client, db, make_products, auth_headers):
+    headers = auth_headers('shopper')
+    product_id = make_products(1, stock_quantity=5)[0].id
+    reservation_id = reserve(client, headers, product_id, 2)
+    intent = pay(client, headers, reservation_id)
+    expire(db, reservation_id, sweep=True)
+    assert stock(db, product_id) == 5
+
+    assert succeed(db, intent).status == 'processed'
+    assert orders(db) == [('processing', [(product_id, 2)])]
+    assert stock(db, product_id) == 3
+
+def test_payment_after_the_sweep_dead_letters_when_sold_out(client, db, make_products, auth_headers):
+    headers = auth_headers('shopper')
+    product_id = make_products(1, stock_quantity=2)[0].id
+    reservation_id = reserve(client, headers, product_id, 2)
+    intent = pay(client, headers, reservation_id)
+    expire(db, reservation_id, sweep=True)
+    # Someone else bought the released units
+    reserve(client, auth_headers('other'), product_id, 2)
+
+    event = succeed(db, intent)
+    assert event.status == 'dead'
+    assert 'Insufficient stock' in event.last_error
+    assert orders(db) == []
+
+def test_payment_for_an_unknown_reservation_uses_its_items(client, db, make_products, auth_headers):
+    headers = auth_headers('shopper')
+    product_id = make_products(1, stock_quantity=5)[0].id
+    reservation_id = reserve(client, headers, product_id, 2)
+    intent = pay(client, headers, reservation_id)
+    expire(db, reservation_id, sweep=True)
+    from src.models import InventoryReservation
+    InventoryReservation.query.delete()
+    db.session.commit()
+
+    assert succeed(db, intent).status == 'processed'
+    assert orders(db) == [('processing', [(product_id, 2)])]
+    assert stock(db, product_id) == 3
+
+def test_amount_comes_from_the_catalog(client, db, make_products, auth_headers):
+    from src.payment_gateway import payment_gateway
+
+    headers = auth_headers('shopper')
+    product = make_products(1, stock_quantity=5, discount_price=80)[0]
+    client.post('/api/cart/items', headers=headers, json={'product_id': product.id, 'quantity': 2})
+
+    response = client.post('/api/payment/create-payment-intent', headers=headers, json={'amount': 0.01})
+    secret = response.get_json()['clientSecret']
+    intent = next(intent for intent in payment_gateway.backend.intents.values() if intent['client_secret'] == secret)
+    assert intent['amount'] == 16000
+    assert json.loads(intent['metadata']['order_items']) == [{'product_id': product.id, 'quantity': 2, 'color': None, 'price': 80}]
+
+def test_payment_not_matching_the_order_total_is_dead_lettered(client, db, make_products, auth_headers):
+    headers = auth_headers('shopper')
+    product_id = make_products(1, stock_quantity=5)[0].id
+    reservation_id = reserve(client, headers, product_id, 2)
+    intent = pay(client, headers, reservation_id)
+    assert intent['amount'] == 20000
+
+    event = succeed(db, dict(intent, amount=1))
+    assert event.status == 'dead'
+    assert 'does not match the order total' in event.last_error
+    assert orders(db) == []
+    # The reservation is still held, not sold
+    assert stock(db, product_id) == 3
+
+def test_price_change_after_the_payment_keeps_the_charged_price(client, db, make_products, auth_headers):
+    from src.models import Order, Product
+
+    headers = auth_headers('shopper')
+    product_id = make_products(1, stock_quantity=5)[0].id
+    reservation_id = reserve(client, headers, product_id, 2)
+    intent = pay(client, headers, reservation_id)
+    db.session.get(Product, product_id).price = 150
+    db.session.commit()
+
+    assert succeed(db, intent).status == 'processed'
+    order = Order.query.one()
+    assert order.total_amount == 200
+    assert [item.price for item in order.items] == [100]
+
+def test_stub_events_are_charged_at_the_discount_price(app, db, make_products, auth_headers):
+    from src.models import Order, StripeEvent
+    from src.webhooks import drain
+
+    auth_headers('shopper')
+    make_products(1, discount_price=80)
+    result = app.test_cli_runner().invoke(args=['payments', 'stub', '--count', '3'])
+    assert result.exit_code == 0, result.output
+
+    drain()
+    assert [event.status for event in StripeEvent.query.all()] == ['processed'] * 3
+    assert [order.total_amount for order in Order.query.all()] == [80] * 3
+
+# The inbox itself: redeliveries are dropped, claims are leases, failures
+# back off and end up dead-lettered.
+
+def make_due(db, event_id):
+    from src.models import StripeEvent
+
+    db.session.expire_all()
+    db.session.get(StripeEvent, event_id).next_attempt_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db.session.commit()
+
+def failing_event(monkeypatch, db):
+    from src.webhooks import HANDLERS, store_event
+
+    def fail(event):
+        raise RuntimeError('Handler failed')
+
+    monkeypatch.setitem(HANDLERS, 'test.failing', fail)
+    assert store_event('evt_failing', 'test.failing', json.dumps({'id': 'evt_failing', 'type': 'test.failing'}))
+    return 'evt_failing'
+
+def test_redelivered_webhook_is_stored_once(client, db):
+    from src.models import StripeEvent
+    from src.routes.payment import endpoint_secret
+    from src.webhooks import sign
+
+    payload = json.dumps({'id': 'evt_redelivered', 'type': 'payment_intent.succeeded', 'data': {'object': {}}})
+    statuses = []
+    for _ in range(2):
+        response = client.post('/api/payment/webhook', data=payload, headers={
+            'Stripe-Signature': sign(payload, endpoint_secret), 'Content-Type': 'application/json'
+        })
+        assert response.status_code == 200
+        statuses.append(response.get_json()['status'])
+
+    assert statuses == ['success', 'duplicate']
+    assert [(event.id, event.status) for event in StripeEvent.query.all()] == [('evt_redelivered', 'pending')]
+
+def test_expired_lease_is_reclaimed_and_the_old_worker_fenced_off(db):
+    from src.webhooks import claim, finish, store_event
+
+    assert store_event('evt_leased', 'test.noop', '{}')
+    token, events = claim(10)
+    assert [(event.id, event.attempts) for event in events] == [('evt_leased', 1)]
+    # Leased: nobody else gets it
+    assert claim(10) == (None, [])
+
+    # The worker died; once the lease runs out the event is due again
+    make_due(db, 'evt_leased')
+    new_token, events = claim(10)
+    assert new_token != token
+    assert [(event.id, event.attempts) for event in events] == [('evt_leased', 2)]
+
+    assert not finish('evt_leased', token, status='processed')
+    assert finish('evt_leased', new_token, status='processed')
+    db.session.commit()
+
+def test_backoff_doubles_up_to_the_cap(monkeypatch):
+    from src import webhooks
+
+    monkeypatch.setattr(webhooks.random, 'uniform', lambda low, high: high)
+    assert [webhooks.backoff(attempts) for attempts in (1, 2, 3, 4)] == [5, 10, 20, 40]
+    assert webhooks.backoff(20) == webhooks.BACKOFF_MAX
+
+def test_failed_event_is_retried_after_the_backoff(monkeypatch, db):
+    from src.models import StripeEvent
+    from src.webhooks import BACKOFF_BASE, drain
+
+    event_id = failing_event(monkeypatch, db)
+    before = datetime.datetime.utcnow()
+    assert drain() == (0, 1)
+
+    event = db.session.get(StripeEvent, event_id)
+    assert (event.status, event.attempts, event.claimed_by) == ('pending', 1, None)
+    assert event.last_error == 'Handler failed'
+    # Jittered between half and all of the first delay
+    assert before + datetime.timedelta(seconds=BACKOFF_BASE / 2) <= event.next_attempt_at
+    assert event.next_attempt_at <= datetime.datetime.utcnow() + datetime.timedelta(seconds=BACKOFF_BASE)
+    # Not due yet
+    assert drain() == (0, 0)
+
+def test_event_is_dead_lettered_after_max_attempts(monkeypatch, db):
+    from src.models import StripeEvent
+    from src.webhooks import MAX_ATTEMPTS, drain, requeue
+
+    event_id = failing_event(monkeypatch, db)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        make_due(db, event_id)
+        assert drain() == (0, 1)
+        db.session.expire_all()
+        event = db.session.get(StripeEvent, event_id)
+        assert (event.status, event.attempts) == ('dead' if attempt == MAX_ATTEMPTS else 'pending', attempt)
+
+    # Dead events are not claimed again until requeued
+    make_due(db, event_id)
+    assert drain() == (0, 0)
+    assert requeue() == 1
+    db.session.expire_all()
+    event = db.session.get(StripeEvent, event_id)
+    assert (event.status, event.attempts) == ('pending', 0)
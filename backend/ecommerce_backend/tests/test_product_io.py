@@ -0,0 +1,56 @@
+import json
+import pytest
+
+# Bulk export and import of products round-trip, including colors with their
+# own stock, and replacing colors by name keeps that stock.
+
+def variants(db, product_id):
+    from src.models import ProductColor
+
+    db.session.expire_all()
+    return sorted(
+        (color.name, color.stock_quantity)
+        for color in ProductColor.query.filter_by(product_id=product_id)
+    )
+
+def with_variant_stock(db, make_products):
+    product = make_products(1, stock_quantity=10)[0]
+    product.colors[0].stock_quantity = 4
+    db.session.commit()
+    return product.id
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv'])
+def test_export_imports_back_unchanged(client, db, make_products, auth_headers, fmt):
+    headers = auth_headers('admin')
+    product_id = with_variant_stock(db, make_products)
+
+    exported = client.get(f'/api/admin/products/export?format={fmt}', headers=headers).get_data(as_text=True)
+    from src.models import ProductColor
+    ProductColor.query.delete()
+    db.session.commit()
+
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = client.post(f'/api/admin/products/import?format={fmt}', headers=dict(headers, **{'Content-Type': content_type}), data=exported)
+    assert response.get_json()['updated'] == 1, response.get_json()
+    assert variants(db, product_id) == [('black', 4), ('white', None)]
+
+def test_import_by_color_name_keeps_variant_stock(client, db, make_products, auth_headers):
+    headers = auth_headers('admin')
+    product_id = with_variant_stock(db, make_products)
+
+    row = {'id': product_id, 'colors': ['black', 'red', {'name': 'white', 'stock_quantity': 2}]}
+    response = client.post('/api/admin/products/import', headers=headers, data=json.dumps(row))
+    assert response.get_json()['updated'] == 1
+    assert variants(db, product_id) == [('black', 4), ('red', None), ('white', 2)]
+
+def test_admin_update_by_color_name_keeps_variant_stock(client, db, make_products, auth_headers):
+    headers = auth_headers('admin')
+    product_id = with_variant_stock(db, make_products)
+
+    response = client.put(f'/api/admin/products/{product_id}', headers=headers, json={'colors': ['black', 'blue']})
+    assert response.status_code == 200
+    assert variants(db, product_id) == [('black', 4), ('blue', None)]
+
+    response = client.put(f'/api/admin/products/{product_id}', headers=headers, json={'colors': [{'stock_quantity': 1}]})
+    assert response.status_code == 400
+    assert variants(db, product_id) == [('black', 4), ('blue', None)]
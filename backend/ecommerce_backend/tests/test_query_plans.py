@@ -0,0 +1,138 @@
+from sqlalchemy import event
+import re
+
+# Every SELECT the read endpoints run is checked with EXPLAIN QUERY PLAN:
+# a plain `SCAN <table>` means SQLite reads the whole table, which only
+# stays fast while the table is small. Deliberate full reads are listed in
+# ALLOWED_SCANS with the reason.
+
+ALLOWED_SCANS = {
+    # The daily order rollup (one row per day and status), summed for the
+    # all-time analytics totals
+    'order_daily_stats',
+}
+
+# Routes that return a whole table by design
+FULL_READ_ROUTES = {
+    '/api/products/',                   # without limit, the full catalog
+    '/api/admin/products',
+    '/api/admin/products/export',
+    '/api/products/categories',         # a handful of rows
+    '/api/admin/categories',
+}
+
+# Not database reads
+SKIPPED_ROUTES = {'/static/<path:filename>', '/', '/<path:path>', '/api/health', '/api/metrics'}
+
+# Full-text tables report their MATCH lookups as a VIRTUAL TABLE scan
+SCAN = re.compile(r'^SCAN (\w+)(?!.*(?:USING (?:COVERING )?INDEX|VIRTUAL TABLE))')
+
+def seed(client, db, auth_headers, make_products):
+    from src.search import search_index
+
+    admin = auth_headers('admin')
+    user = auth_headers('shopper')
+    category = client.post('/api/admin/categories', headers=admin, json={
+        'name': 'phones', 'image': 'phones.png', 'description': 'Phones'
+    }).get_json()['category']
+    products = make_products(30, stock_quantity=50, is_featured=True)
+    search_index.index_products(products)
+    db.session.commit()
+    product_id = products[0].id
+
+    order = client.post('/api/orders/orders', headers=user, json={
+        'shipping_address': 'Street 1', 'billing_address': 'Street 1', 'payment_method': 'card',
+        'items': [{'product_id': product_id, 'quantity': 1}]
+    }).get_json()['order']
+    client.post(f'/api/ratings/products/{product_id}/ratings', headers=user, json={'score': 5, 'review': 'Great'})
+    client.post('/api/orders/wishlist', headers=user, json={'product_id': product_id})
+    client.post('/api/cart/items', headers=user, json={'product_id': product_id, 'quantity': 1})
+    reservation = client.post('/api/inventory/reservations', headers=user, json={
+        'items': [{'product_id': products[1].id, 'quantity': 1}]
+    }).get_json()['reservation']
+    user_id = client.get('/api/auth/profile', headers=user).get_json()['user']['id']
+
+    return admin, user, [
+        ('/api/auth/profile', user, {}),
+        ('/api/auth/check-auth', user, {}),
+        ('/api/admin/products', admin, {}),
+        ('/api/admin/products/<product_id>', admin, {'product_id': product_id}),
+        ('/api/admin/products/export', admin, {}),
+        ('/api/admin/categories', admin, {}),
+        ('/api/admin/analytics', admin, {}),
+        ('/api/admin/auth-cache', admin, {}),
+        ('/api/admin/response-cache', admin, {}),
+        ('/api/admin/slow-requests', admin, {}),
+        ('/api/admin/payment-gateway', admin, {}),
+        ('/api/admin/webhook-events', admin, {}),
+        ('/api/users/users', admin, {}),
+        ('/api/users/users/<user_id>', admin, {'user_id': user_id}),
+        ('/api/orders/admin/orders', admin, {}),
+        ('/api/orders/admin/orders/<order_id>', admin, {'order_id': order['id']}),
+        ('/api/orders/orders', user, {}),
+        ('/api/orders/orders/<order_id>', user, {'order_id': order['id']}),
+        ('/api/orders/wishlist', user, {}),
+        ('/api/orders/wishlist/contains?product_ids=' + product_id, user, {}),
+        ('/api/payment/config', None, {}),
+        ('/api/ratings/products/<product_id>/ratings', None, {'product_id': product_id}),
+        ('/api/ratings/products/<product_id>/ratings?sort=highest', None, {'product_id': product_id}),
+        ('/api/products/', None, {}),
+        ('/api/products/?limit=10', None, {}),
+        ('/api/products/?limit=10&category=phones', None, {}),
+        ('/api/products/?limit=10&featured=true', None, {}),
+        ('/api/products/?limit=10&new=true', None, {}),
+        ('/api/products/search?q=battery', None, {}),
+        ('/api/products/batch?ids=' + product_id, None, {}),
+        ('/api/products/<product_id>', None, {'product_id': product_id}),
+        ('/api/products/categories', None, {}),
+        ('/api/products/categories/<category_id>/products?limit=10', None, {'category_id': category['id']}),
+        ('/api/inventory/availability?product_ids=' + product_id, None, {}),
+        ('/api/inventory/reservations/<checkout_id>', user, {'checkout_id': reservation['id']}),
+        ('/api/cart/', user, {}),
+    ]
+
+def full_scans(db, statement, parameters):
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', tuple(parameters)).all()
+    scans = set()
+    for row in rows:
+        match = SCAN.match(row[-1])
+        if match and match.group(1) not in ALLOWED_SCANS:
+            scans.add(match.group(1))
+    return scans
+
+def test_read_routes_use_indexes(app, client, db, auth_headers, make_products):
+    admin, user, routes = seed(client, db, auth_headers, make_products)
+
+    # Every GET route is exercised
+    rules = {rule.rule for rule in app.url_map.iter_rules() if 'GET' in rule.methods} - SKIPPED_ROUTES
+    assert rules <= {path.split('?')[0] for path, _, _ in routes}
+
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            executed.append((statement, parameters))
+
+    problems = []
+    for path, headers, values in routes:
+        url = path
+        for name, value in values.items():
+            url = re.sub(f'<(?:\\w+:)?{name}>', value, url)
+        executed.clear()
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = client.get(url, headers=headers or {})
+            response.get_data()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        assert response.status_code == 200, (url, response.get_json())
+
+        if path.split('?')[0] in FULL_READ_ROUTES:
+            continue
+        for statement, parameters in executed:
+            scans = full_scans(db, statement, parameters)
+            if scans:
+                problems.append(f"{url}: SCAN {', '.join(sorted(scans))}\n    {' '.join(statement.split())}")
+
+    assert not problems, '\n'.join(problems)
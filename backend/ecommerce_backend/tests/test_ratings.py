@@ -0,0 +1,93 @@
+import datetime
+import time
+import uuid
+import pytest
+
+# Review pages are fetched with keyset pagination and the usernames joined
+# in, so a page costs the same handful of statements (and roughly the same
+# time) however many reviews the product has and however deep the page is.
+
+def seed_reviews(db, product, count):
+    from src.models import Rating, User
+
+    started = datetime.datetime(2024, 1, 1)
+    users, ratings = [], []
+    for n in range(count):
+        user_id = str(uuid.uuid4())
+        users.append({
+            'id': user_id, 'username': f'reviewer{n}', 'email': f'reviewer{n}@example.com',
+            'password_hash': '-', 'role': 'user', 'created_at': started
+        })
+        ratings.append({
+            'id': str(uuid.uuid4()), 'product_id': product.id, 'user_id': user_id,
+            'score': n % 5 + 1, 'comment': f'Review {n}', 'helpful_count': n % 17,
+            'created_at': started + datetime.timedelta(seconds=n)
+        })
+    db.session.execute(User.__table__.insert(), users)
+    db.session.execute(Rating.__table__.insert(), ratings)
+    db.session.commit()
+
+def review_pages(client, product_id, query, pages):
+    # Follow next_cursor from the first page; returns the responses
+    responses = []
+    cursor = None
+    for _ in range(pages):
+        path = f'/api/ratings/products/{product_id}/ratings?{query}'
+        response = client.get(path + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200
+        responses.append(response.get_json())
+        cursor = responses[-1]['next_cursor']
+        if cursor is None:
+            break
+    return responses
+
+@pytest.mark.parametrize('query', ['sort=newest', 'sort=highest', 'sort=most-helpful', 'sort=lowest&score=2'])
+def test_review_page_statements_do_not_grow_with_reviews(client, db, make_products, statements, query):
+    product = make_products(1)[0]
+    seed_reviews(db, product, 200)
+
+    with statements() as executed:
+        pages = review_pages(client, product.id, f'{query}&limit=10', 3)
+    assert [len(page['ratings']) for page in pages] == [10, 10, 10]
+    assert all(rating['username'].startswith('reviewer') for page in pages for rating in page['ratings'])
+    # The product with its summary, and one page of reviews with usernames
+    selects = [statement for statement in executed if statement.lstrip().upper().startswith('SELECT')]
+    assert len(selects) <= 3 * 2 + 1, selects
+
+def test_review_pages_cover_every_review_once(client, db, make_products):
+    product = make_products(1)[0]
+    seed_reviews(db, product, 45)
+
+    pages = review_pages(client, product.id, 'sort=highest&limit=10', 10)
+    ids = [rating['id'] for page in pages for rating in page['ratings']]
+    assert len(pages) == 5
+    assert len(ids) == len(set(ids)) == 45
+    scores = [rating['score'] for page in pages for rating in page['ratings']]
+    assert scores == sorted(scores, reverse=True)
+
+REVIEWS = 50000
+PAGES = 25
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('query', ['sort=newest', 'sort=highest', 'sort=lowest', 'sort=most-helpful', 'sort=newest&score=5'])
+def test_review_page_latency_with_50k_reviews(client, db, make_products, query):
+    product = make_products(1)[0]
+    seed_reviews(db, product, REVIEWS)
+
+    timings = []
+    cursor = None
+    for _ in range(PAGES):
+        path = f'/api/ratings/products/{product.id}/ratings?{query}&limit=20'
+        started = time.perf_counter()
+        response = client.get(path + (f'&cursor={cursor}' if cursor else ''))
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200
+        body = response.get_json()
+        assert len(body['ratings']) == 20
+        cursor = body['next_cursor']
+
+    timings.sort()
+    median, worst = timings[len(timings) // 2], timings[-1]
+    print(f'\n{query}: {REVIEWS} reviews, {PAGES} pages, median {median * 1000:.1f}ms, worst {worst * 1000:.1f}ms')
+    # Deep pages cost about what the first one does
+    assert worst < 0.1
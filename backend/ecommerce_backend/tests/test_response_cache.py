@@ -0,0 +1,40 @@
+import pytest
+from src.cache import ResponseCache, response_cache
+
+# Each worker has its own in-memory cache; the catalog version they key
+# entries and ETags with is shared through the database.
+
+@pytest.fixture
+def no_version_poll():
+    poll = response_cache.versions.poll
+    response_cache.versions.poll = 0
+    yield
+    response_cache.versions.poll = poll
+
+def test_write_through_another_worker_retires_cached_responses(app, client, db, make_products, no_version_poll):
+    product = make_products(1)[0]
+    first = client.get(f'/api/products/{product.id}')
+    etag = first.headers['ETag']
+    assert client.get(f'/api/products/{product.id}', headers={'If-None-Match': etag}).status_code == 304
+
+    # An admin write handled by another worker
+    other_worker = ResponseCache()
+    other_worker.init_app(app)
+    product.name = 'Renamed phone'
+    db.session.commit()
+    other_worker.bump_catalog_version()
+
+    response = client.get(f'/api/products/{product.id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['product']['name'] == 'Renamed phone'
+    assert response.headers['ETag'] != etag
+
+def test_catalog_version_is_counted_in_the_database(app, db):
+    workers = [ResponseCache(), ResponseCache()]
+    for worker in workers:
+        worker.init_app(app)
+        worker.versions.poll = 0
+    start = workers[0].catalog_version()
+    workers[0].bump_catalog_version()
+    workers[1].bump_catalog_version()
+    assert [worker.catalog_version() for worker in workers] == [start + 2, start + 2]
@@ -0,0 +1,111 @@
+from src.search import SearchIndex
+
+# Processes using the in-memory index see each other's writes through the
+# search_changes log.
+
+def memory_index(app):
+    app.config['SEARCH_BACKEND'] = 'memory'
+    try:
+        index = SearchIndex()
+        index.init_app(app)
+    finally:
+        del app.config['SEARCH_BACKEND']
+    index.sync_interval = 0
+    return index
+
+def test_memory_indexes_pick_up_changes_from_other_processes(app, db, make_products):
+    from src.models import Product
+
+    writer, reader = memory_index(app), memory_index(app)
+    assert reader.search('walkietalkie') == []
+
+    product = make_products(1)[0]
+    product.name = 'Walkietalkie Pro'
+    writer.index_product(product)
+    db.session.commit()
+    assert [product_id for product_id, _ in reader.search('walkietalkie')] == [product.id]
+
+    product_id = product.id
+    writer.remove_product(product_id)
+    db.session.delete(product)
+    db.session.commit()
+    assert reader.search('walkietalkie') == []
+    assert db.session.get(Product, product_id) is None
+
+def test_memory_index_rebuilds_after_missing_the_change_log(app, db, make_products):
+    index = memory_index(app)
+    index.change_retention = 0
+    # Added without a change log entry, as if its entry had been pruned
+    product = make_products(1)[0]
+    assert [product_id for product_id, _ in index.search('battery')] == [product.id]
+
+def test_memory_index_applies_changes_committed_out_of_order(app, db, make_products):
+    import datetime
+    from sqlalchemy import insert
+    from src.search import search_changes
+
+    reader = memory_index(app)
+    first, second = make_products(2)
+    first.name, second.name = 'Walkietalkie One', 'Walkietalkie Two'
+    db.session.commit()
+    now = datetime.datetime.utcnow()
+    # The second change got the higher id but committed (and was synced) first
+    db.session.execute(insert(search_changes).values(id=2, product_id=second.id, changed_at=now))
+    db.session.commit()
+    assert [product_id for product_id, _ in reader.search('walkietalkie')] == [second.id]
+
+    db.session.execute(insert(search_changes).values(id=1, product_id=first.id, changed_at=now))
+    db.session.commit()
+    assert sorted(product_id for product_id, _ in reader.search('walkietalkie')) == sorted([first.id, second.id])
+
+def test_rolled_back_write_leaves_no_entry_in_the_memory_index(app, db, make_products):
+    index = memory_index(app)
+    product = make_products(1)[0]
+    index.search('battery')
+
+    product.name = 'Walkietalkie Pro'
+    index.index_product(product)
+    assert index.search('walkietalkie') == []
+    db.session.rollback()
+    assert index.search('walkietalkie') == []
+
+    product.name = 'Walkietalkie Pro'
+    index.index_product(product)
+    db.session.commit()
+    assert [product_id for product_id, _ in index.search('walkietalkie')] == [product.id]
+
+def make_ranked_last(db, make_products, count):
+    # count products outranked by MAX_CANDIDATES others matching 'battery'
+    from src.search import MAX_CANDIDATES
+
+    make_products(MAX_CANDIDATES + 100)
+    tablets = make_products(count)
+    for tablet in tablets:
+        tablet.category = 'tablets'
+        tablet.description = 'Tablet with a battery and a much longer description than every phone in the catalog'
+    db.session.commit()
+    return sorted(tablet.id for tablet in tablets)
+
+def test_search_filters_apply_before_the_candidate_cut(client, db, make_products):
+    from src.models import Product
+    from src.search import search_index
+
+    tablets = make_ranked_last(db, make_products, 5)
+    search_index.index_products(Product.catalog_query().all())
+    db.session.commit()
+
+    response = client.get('/api/products/search?q=battery&category=tablets&limit=10').get_json()
+    assert sorted(product['id'] for product in response['products']) == tablets
+    assert response['total'] == 5
+    assert response['total_is_approximate'] is False
+    assert client.get('/api/products/search?q=battery').get_json()['total_is_approximate'] is True
+
+def test_memory_index_filters_apply_before_the_candidate_cut(app, db, make_products):
+    from src.models import Product
+
+    index = memory_index(app)
+    tablets = make_ranked_last(db, make_products, 5)
+    index.rebuild()
+
+    results = index.search('battery', conditions=[Product.category == 'tablets'])
+    assert sorted(product_id for product_id, _ in results) == tablets
@@ -0,0 +1,82 @@
+import gzip
+import pytest
+
+# The storefront build is served from a manifest: fingerprinted assets are
+# cached forever, everything else is revalidated by ETag.
+
+@pytest.fixture
+def build(app, tmp_path):
+    from src.static_assets import static_assets
+
+    (tmp_path / 'assets').mkdir()
+    (tmp_path / 'assets' / 'index-3f2a9c.js').write_text('console.log("storefront");\n' * 100)
+    (tmp_path / 'favicon.svg').write_text('<svg xmlns="http://www.w3.org/2000/svg"></svg>')
+    (tmp_path / 'index.html').write_text('<!doctype html><div id="root"></div>')
+
+    root = static_assets.root
+    static_assets.root = tmp_path
+    static_assets.load()
+    yield tmp_path
+    static_assets.root = root
+    static_assets.load()
+
+def test_fingerprinted_assets_are_immutable(client, build):
+    from src.static_assets import IMMUTABLE
+
+    response = client.get('/assets/index-3f2a9c.js')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == IMMUTABLE
+    assert response.get_data() == (build / 'assets' / 'index-3f2a9c.js').read_bytes()
+    response.close()
+
+def test_other_files_are_revalidated(client, build):
+    from src.static_assets import REVALIDATE
+
+    response = client.get('/favicon.svg')
+    assert response.headers['Cache-Control'] == REVALIDATE
+    etag = response.headers['ETag']
+    response.close()
+
+    response = client.get('/favicon.svg', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.headers['ETag'] == etag
+    assert response.headers['Cache-Control'] == REVALIDATE
+
+    response = client.get('/favicon.svg', headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+    response.close()
+
+def test_matching_etag_of_an_immutable_asset_is_not_modified(client, build):
+    from src.static_assets import IMMUTABLE
+
+    response = client.get('/assets/index-3f2a9c.js')
+    etag = response.headers['ETag']
+    response.close()
+
+    response = client.get('/assets/index-3f2a9c.js', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['Cache-Control'] == IMMUTABLE
+
+def test_precompressed_variant_is_served_with_its_own_etag(client, build):
+    from src.static_assets import static_assets
+
+    assert static_assets.compress() >= 1
+    plain = client.get('/assets/index-3f2a9c.js')
+    response = client.get('/assets/index-3f2a9c.js', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert response.headers['ETag'] != plain.headers['ETag']
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+    plain.close()
+    response.close()
+
+def test_client_routes_get_the_index_and_missing_chunks_404(client, build):
+    response = client.get('/products/42')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == '<!doctype html><div id="root"></div>'
+
+    etag = response.headers['ETag']
+    assert client.get('/cart', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/assets/index-missing.js').status_code == 404
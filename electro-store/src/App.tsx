@@ -1,6 +1,7 @@
 import * as React from "react";
 import { BrowserRouter as Router, Routes, Route, Navigate } from "react-router-dom";
 import { AuthProvider } from "./contexts/AuthContext";
+import { CartProvider } from "./contexts/CartContext";
 import { Header } from "./components/header";
 import { Footer } from "./components/footer";
 import { HomePage } from "./components/home-page";
@@ -24,43 +25,45 @@ function App() {
   return (
     <ToastProvider>
       <AuthProvider>
-        <Router future={{ v7_startTransition: true, v7_relativeSplatPath: true }}>
-          <div className="flex flex-col min-h-screen">
-            <Header />
-            <main className="flex-1">
-              <Routes>
-                {/* Public Routes */}
-                <Route path="/" element={<HomePage />} />
-                <Route path="/products" element={<ProductListingPage />} />
-                <Route path="/product/:id" element={<ProductDetailPage />} />
-                <Route path="/login" element={<LoginPage />} />
-                <Route path="/register" element={<RegisterPage />} />
-                
-                {/* Protected User Routes */}
-                <Route element={<ProtectedRoute requireAuth={true} />}>
-                  <Route path="/account" element={<AccountPage />} />
-                  <Route path="/cart" element={<Cart />} />
-                  <Route path="/orders" element={<OrdersPage />} />
-                  <Route path="/wishlist" element={<WishlistPage />} />
-                </Route>
-                
-                {/* Admin Routes */}
-                <Route element={<ProtectedRoute requireAuth={true} requireAdmin={true} />}>
-                  <Route path="/admin" element={<Navigate to="/admin/dashboard" replace />} />
-                  <Route path="/admin/dashboard" element={<AdminDashboard />} />
-                  <Route path="/admin/products" element={<AdminProducts />} />
-                  <Route path="/admin/orders" element={<AdminOrders />} />
-                  <Route path="/admin/users" element={<AdminUsers />} />
-                </Route>
-                
-                {/* Fallback Route */}
-                <Route path="*" element={<Navigate to="/" replace />} />
-              </Routes>
-            </main>
-            <Footer />
-          </div>
-          <Toaster />
-        </Router>
+        <CartProvider>
+          <Router future={{ v7_startTransition: true, v7_relativeSplatPath: true }}>
+            <div className="flex flex-col min-h-screen">
+              <Header />
+              <main className="flex-1">
+                <Routes>
+                  {/* Public Routes */}
+                  <Route path="/" element={<HomePage />} />
+                  <Route path="/products" element={<ProductListingPage />} />
+                  <Route path="/product/:id" element={<ProductDetailPage />} />
+                  <Route path="/login" element={<LoginPage />} />
+                  <Route path="/register" element={<RegisterPage />} />
+                  
+                  {/* Protected User Routes */}
+                  <Route element={<ProtectedRoute requireAuth={true} />}>
+                    <Route path="/account" element={<AccountPage />} />
+                    <Route path="/cart" element={<Cart />} />
+                    <Route path="/orders" element={<OrdersPage />} />
+                    <Route path="/wishlist" element={<WishlistPage />} />
+                  </Route>
+                  
+                  {/* Admin Routes */}
+                  <Route element={<ProtectedRoute requireAuth={true} requireAdmin={true} />}>
+                    <Route path="/admin" element={<Navigate to="/admin/dashboard" replace />} />
+                    <Route path="/admin/dashboard" element={<AdminDashboard />} />
+                    <Route path="/admin/products" element={<AdminProducts />} />
+                    <Route path="/admin/orders" element={<AdminOrders />} />
+                    <Route path="/admin/users" element={<AdminUsers />} />
+                  </Route>
+                  
+                  {/* Fallback Route */}
+                  <Route path="*" element={<Navigate to="/" replace />} />
+                </Routes>
+              </main>
+              <Footer />
+            </div>
+            <Toaster />
+          </Router>
+        </CartProvider>
       </AuthProvider>
     </ToastProvider>
   );
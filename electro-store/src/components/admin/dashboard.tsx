@@ -1,7 +1,7 @@
 import * as React from "react";
 import { useEffect, useState } from "react";
-import axios from "axios";
 import { useAuth } from "../../contexts/AuthContext";
+import { adminApi } from "../../services/api";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "../ui/card";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "../ui/tabs";
 import { Button } from "../ui/button";
@@ -32,37 +32,28 @@ export function AdminDashboard() {
   useEffect(() => {
     const fetchDashboardData = async () => {
       try {
-        // In a real application, these would be actual API calls
-        // For now, we'll simulate the data
+        // All numbers are computed server-side from the daily order rollup
+        const analytics = await adminApi.getAnalytics(7);
         
-        // Simulate API delay
-        await new Promise(resolve => setTimeout(resolve, 500));
-        
-        // Mock data
-        const mockStats = {
-          totalUsers: 128,
-          totalProducts: 45,
-          totalOrders: 267,
-          totalRevenue: 24895.50,
-          recentOrders: [
-            { id: 'ord123', user: 'john_doe', amount: 129.99, status: 'delivered', date: '2025-05-25' },
-            { id: 'ord124', user: 'jane_smith', amount: 249.99, status: 'processing', date: '2025-05-25' },
-            { id: 'ord125', user: 'mike_jones', amount: 89.99, status: 'pending', date: '2025-05-24' },
-            { id: 'ord126', user: 'sarah_connor', amount: 199.99, status: 'shipped', date: '2025-05-24' },
-            { id: 'ord127', user: 'alex_wilson', amount: 349.99, status: 'pending', date: '2025-05-23' },
-          ],
-          salesData: [
-            { name: 'May 20', sales: 1200 },
-            { name: 'May 21', sales: 1900 },
-            { name: 'May 22', sales: 1500 },
-            { name: 'May 23', sales: 2100 },
-            { name: 'May 24', sales: 1800 },
-            { name: 'May 25', sales: 2400 },
-            { name: 'May 26', sales: 1700 },
-          ]
+        const dashboardStats = {
+          totalUsers: analytics.totals.users,
+          totalProducts: analytics.totals.products,
+          totalOrders: analytics.totals.orders,
+          totalRevenue: analytics.totals.revenue,
+          recentOrders: analytics.recent_orders.map((order: any) => ({
+            id: order.id,
+            user: order.user,
+            amount: order.amount,
+            status: order.status,
+            date: order.created_at ? order.created_at.slice(0, 10) : ''
+          })),
+          salesData: analytics.daily.map((day: any) => ({
+            name: new Date(`${day.day}T00:00:00`).toLocaleDateString('en-US', { month: 'short', day: 'numeric' }),
+            sales: day.revenue
+          }))
         };
         
-        setStats(mockStats);
+        setStats(dashboardStats);
         setLoading(false);
       } catch (error) {
         console.error("Error fetching dashboard data:", error);
@@ -33,6 +33,7 @@ export function OrdersPage() {
   const navigate = useNavigate();
   const { toast } = useToast();
   const [orders, setOrders] = useState<Order[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
   const [selectedOrder, setSelectedOrder] = useState<Order | null>(null);
   const [showOrderDetails, setShowOrderDetails] = useState(false);
@@ -48,13 +49,10 @@ export function OrdersPage() {
       try {
         setLoading(true);
         
-        // In a real application, this would be an actual API call
-        // For now, we'll simulate the data fetch with a delay
-        await new Promise(resolve => setTimeout(resolve, 500));
-        
-        // Fetch orders from API
-        const response = await axios.get("/api/orders");
+        // First page of orders; items already carry product names and images
+        const response = await axios.get("/api/orders/orders", { params: { limit: 20 } });
         setOrders(response.data.orders);
+        setNextCursor(response.data.next_cursor);
       } catch (error) {
         console.error("Error fetching orders:", error);
         toast({
@@ -70,6 +68,21 @@ export function OrdersPage() {
     fetchOrders();
   }, [isAuthenticated, navigate]);
 
+  const loadMoreOrders = async () => {
+    try {
+      const response = await axios.get("/api/orders/orders", { params: { limit: 20, cursor: nextCursor } });
+      setOrders(current => [...current, ...response.data.orders]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error("Error fetching orders:", error);
+      toast({
+        title: "Error",
+        description: "Failed to load more orders",
+        variant: "destructive"
+      });
+    }
+  };
+
   const handleViewOrderDetails = (order: Order) => {
     setSelectedOrder(order);
     setShowOrderDetails(true);
@@ -246,6 +259,11 @@ export function OrdersPage() {
               </CardContent>
             </Card>
           ))}
+          {nextCursor && (
+            <div className="flex justify-center">
+              <Button variant="outline" onClick={loadMoreOrders}>Load more</Button>
+            </div>
+          )}
         </div>
       )}
     </div>
@@ -8,9 +8,8 @@ import { Card, CardContent } from "./ui/card";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "./ui/tabs";
 import { ProductRatingComponent } from "./product-rating";
 import { useToast } from "./ui/toast-context";
-import { productApi } from "@/services/api";
+import { productApi, wishlistApi, inventoryApi, Availability } from "@/services/api";
 import { Heart, ShoppingCart, Check } from "lucide-react";
-import api from "@/services/api";
 
 interface Product {
   id: string;
@@ -25,7 +24,6 @@ interface Product {
   features: string[];
   specifications: Record<string, string>;
   colors: string[];
-  in_stock: boolean;
   is_new: boolean;
   is_featured: boolean;
 }
@@ -43,8 +41,10 @@ export function ProductDetailPage() {
   const [quantity, setQuantity] = useState(1);
   const [isAddingToCart, setIsAddingToCart] = useState(false);
   const [isAddingToWishlist, setIsAddingToWishlist] = useState(false);
+  const [inWishlist, setInWishlist] = useState(false);
   const [relatedProducts, setRelatedProducts] = useState<Product[]>([]);
   const [error, setError] = useState(false);
+  const [availability, setAvailability] = useState<Availability | null>(null);
 
   useEffect(() => {
     const fetchProduct = async () => {
@@ -85,6 +85,29 @@ export function ProductDetailPage() {
     fetchProduct();
   }, [id]);
 
+  // Stock isn't part of the (cached) product payload
+  const refreshAvailability = () => {
+    if (!id) return;
+    inventoryApi.getAvailability([id])
+      .then(result => setAvailability(result[0] || null))
+      .catch(error => console.error("Error fetching availability:", error));
+  };
+
+  useEffect(() => {
+    setAvailability(null);
+    refreshAvailability();
+  }, [id]);
+
+  useEffect(() => {
+    if (!id || !isAuthenticated) {
+      setInWishlist(false);
+      return;
+    }
+    wishlistApi.contains([id])
+      .then(productIds => setInWishlist(productIds.includes(id)))
+      .catch(error => console.error("Error checking wishlist:", error));
+  }, [id, isAuthenticated]);
+
   const handleAddToCart = () => {
     if (!product) return;
     
@@ -98,6 +121,7 @@ export function ProductDetailPage() {
       image: product.image,
       quantity: quantity
     });
+    refreshAvailability();
     
     toast({
       title: "Added to cart",
@@ -124,9 +148,8 @@ export function ProductDetailPage() {
       setIsAddingToWishlist(true);
       
       // API call to add to wishlist
-      await api.post("/orders/wishlist", {
-        product_id: product.id
-      });
+      await wishlistApi.addItems([product.id]);
+      setInWishlist(true);
       
       toast({
         title: "Added to wishlist",
@@ -184,6 +207,10 @@ export function ProductDetailPage() {
     );
   }
 
+  // The selected color's stock when it is tracked, else the product's
+  const variant = availability?.variants.find(v => v.color === selectedColor);
+  const inStock = availability ? (variant ? variant.in_stock : availability.in_stock) : false;
+
   return (
     <div className="container py-10">
       <div className="grid grid-cols-1 md:grid-cols-2 gap-8 mb-10">
@@ -305,14 +332,14 @@ export function ProductDetailPage() {
             <Button 
               className="flex-1" 
               onClick={handleAddToCart}
-              disabled={isAddingToCart || !product.in_stock}
+              disabled={isAddingToCart || !inStock}
             >
               {isAddingToCart ? (
                 <div className="flex items-center">
                   <div className="animate-spin rounded-full h-4 w-4 border-t-2 border-b-2 border-white mr-2"></div>
                   Adding...
                 </div>
-              ) : product.in_stock ? (
+              ) : inStock ? (
                 <>
                   <ShoppingCart className="mr-2 h-4 w-4" />
                   Add to Cart
@@ -325,7 +352,7 @@ export function ProductDetailPage() {
             <Button 
               variant="outline" 
               onClick={handleAddToWishlist}
-              disabled={isAddingToWishlist}
+              disabled={isAddingToWishlist || inWishlist}
             >
               {isAddingToWishlist ? (
                 <div className="flex items-center">
@@ -335,15 +362,15 @@ export function ProductDetailPage() {
               ) : (
                 <>
                   <Heart className="mr-2 h-4 w-4" />
-                  Add to Wishlist
+                  {inWishlist ? "In Wishlist" : "Add to Wishlist"}
                 </>
               )}
             </Button>
           </div>
           
           <div className="flex items-center space-x-2 text-sm">
-            <div className={`flex items-center ${product.in_stock ? 'text-green-600' : 'text-red-600'}`}>
-              {product.in_stock ? (
+            <div className={`flex items-center ${inStock ? 'text-green-600' : 'text-red-600'}`}>
+              {inStock ? (
                 <>
                   <Check className="mr-1 h-4 w-4" />
                   In Stock
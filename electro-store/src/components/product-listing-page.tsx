@@ -4,8 +4,20 @@ import { useSearchParams, Link } from "react-router-dom"
 import { Filter, SlidersHorizontal, ChevronDown, X } from "lucide-react"
 
 import { Button } from "@/components/ui/button"
+import {
+  Pagination,
+  PaginationContent,
+  PaginationItem,
+  PaginationNext,
+  PaginationPrevious,
+} from "@/components/ui/pagination"
 import { ProductCard } from "@/components/product-card"
-import { productApi } from "@/services/api"
+import { productApi, inventoryApi } from "@/services/api"
+
+const PAGE_SIZE = 24
+
+// Fields rendered by the product grid; the listing skips heavy detail fields
+const LISTING_FIELDS = 'name,category,price,discount_price,rating,image,is_new,is_featured'
 
 export function ProductListingPage() {
   const [searchParams, setSearchParams] = useSearchParams()
@@ -14,31 +26,64 @@ export function ProductListingPage() {
   const [categories, setCategories] = useState([])
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(false)
+  // Keyset pagination: cursors[i] is the cursor that loads page i
+  const [cursors, setCursors] = useState<(string | null)[]>([null])
+  const [page, setPage] = useState(0)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [total, setTotal] = useState(0)
   
   // Get filter values from URL
   const categoryFilter = searchParams.get('category') || 'all'
   const sortBy = searchParams.get('sort') || 'featured'
   const priceRange = searchParams.get('price') || 'all'
   
-  // Fetch products and categories
+  // Fetch categories
+  useEffect(() => {
+    productApi.getCategories()
+      .then(response => setCategories(response.categories))
+      .catch(err => console.error('Error fetching categories:', err))
+  }, [])
+  
+  // Fetch the current page of products; filtering and sorting happen server-side
   useEffect(() => {
     const fetchData = async () => {
       try {
         setLoading(true)
         setError(false)
         
-        // Fetch products with filters
-        const filters = {}
+        const params = {
+          limit: PAGE_SIZE,
+          sort: sortBy,
+          fields: LISTING_FIELDS,
+        }
         if (categoryFilter !== 'all') {
-          filters.category = categoryFilter
+          params.category = categoryFilter
+        }
+        if (priceRange !== 'all') {
+          const [min, max] = priceRange.split('-')
+          if (min) params.min_price = min
+          if (max) params.max_price = max
+        }
+        if (cursors[page]) {
+          params.cursor = cursors[page]
         }
         
-        const productsResponse = await productApi.getProducts(filters)
+        const productsResponse = await productApi.getProducts(params)
         setProducts(productsResponse.products)
-        
-        // Fetch categories
-        const categoriesResponse = await productApi.getCategories()
-        setCategories(categoriesResponse.categories)
+        // Stock isn't part of the cached listing; it comes from availability
+        const ids = productsResponse.products.map(p => p.id)
+        if (ids.length > 0) {
+          inventoryApi.getAvailability(ids)
+            .then(availability => {
+              const inStock = new Map(availability.map(a => [a.product_id, a.in_stock]))
+              setProducts(products => products.map(p => inStock.has(p.id) ? { ...p, in_stock: inStock.get(p.id) } : p))
+            })
+            .catch(err => console.error('Error fetching availability:', err))
+        }
+        setNextCursor(productsResponse.next_cursor)
+        if (productsResponse.total !== undefined) {
+          setTotal(productsResponse.total)
+        }
       } catch (err) {
         console.error('Error fetching data:', err)
         setError(true)
@@ -48,57 +93,38 @@ export function ProductListingPage() {
     }
     
     fetchData()
-  }, [categoryFilter])
+  }, [categoryFilter, sortBy, priceRange, page, cursors])
   
-  // Filter products based on criteria
-  const filteredProducts = React.useMemo(() => {
-    if (loading || error) return []
-    
-    let result = [...products]
-    
-    // Filter by price range
-    if (priceRange !== 'all') {
-      const [min, max] = priceRange.split('-').map(Number)
-      result = result.filter(product => {
-        const price = product.discountPrice || product.price
-        if (!max) return price >= min
-        return price >= min && price <= max
-      })
-    }
-    
-    // Sort products
-    switch (sortBy) {
-      case 'price-low':
-        result.sort((a, b) => (a.discountPrice || a.price) - (b.discountPrice || b.price))
-        break
-      case 'price-high':
-        result.sort((a, b) => (b.discountPrice || b.price) - (a.discountPrice || a.price))
-        break
-      case 'newest':
-        result.sort((a, b) => (b.isNew ? 1 : 0) - (a.isNew ? 1 : 0))
-        break
-      case 'rating':
-        result.sort((a, b) => b.rating - a.rating)
-        break
-      case 'featured':
-      default:
-        result.sort((a, b) => (b.isFeatured ? 1 : 0) - (a.isFeatured ? 1 : 0))
-        break
-    }
-    
-    return result
-  }, [products, categoryFilter, sortBy, priceRange, loading, error])
+  const filteredProducts = loading || error ? [] : products
+  const pageCount = Math.max(1, Math.ceil(total / PAGE_SIZE))
+  
+  const goToNextPage = (e: React.MouseEvent) => {
+    e.preventDefault()
+    if (!nextCursor) return
+    setCursors(prev => [...prev.slice(0, page + 1), nextCursor])
+    setPage(page + 1)
+  }
+  
+  const goToPreviousPage = (e: React.MouseEvent) => {
+    e.preventDefault()
+    if (page > 0) setPage(page - 1)
+  }
   
   // Update filters
   const updateFilter = (key: string, value: string) => {
     const params = new URLSearchParams(searchParams)
     params.set(key, value)
     setSearchParams(params)
+    // Cursors belong to a specific filter/sort combination
+    setCursors([null])
+    setPage(0)
   }
   
   // Clear all filters
   const clearFilters = () => {
     setSearchParams({})
+    setCursors([null])
+    setPage(0)
   }
   
   // Check if any filters are active
@@ -341,12 +367,38 @@ export function ProductListingPage() {
           </div>
         ) : (
           <>
-            <p className="mb-6 text-gray-600">{filteredProducts.length} products found</p>
+            <p className="mb-6 text-gray-600">{total} products found</p>
             <div className="grid grid-cols-1 sm:grid-cols-2 md:grid-cols-3 lg:grid-cols-4 gap-6">
               {filteredProducts.map(product => (
                 <ProductCard key={product.id} product={product} />
               ))}
             </div>
+            
+            {pageCount > 1 && (
+              <Pagination className="mt-8">
+                <PaginationContent>
+                  <PaginationItem>
+                    <PaginationPrevious
+                      href="#"
+                      onClick={goToPreviousPage}
+                      className={page === 0 ? "pointer-events-none opacity-50" : ""}
+                    />
+                  </PaginationItem>
+                  <PaginationItem>
+                    <span className="px-4 text-sm text-gray-600">
+                      Page {page + 1} of {pageCount}
+                    </span>
+                  </PaginationItem>
+                  <PaginationItem>
+                    <PaginationNext
+                      href="#"
+                      onClick={goToNextPage}
+                      className={!nextCursor ? "pointer-events-none opacity-50" : ""}
+                    />
+                  </PaginationItem>
+                </PaginationContent>
+              </Pagination>
+            )}
           </>
         )}
       </div>
@@ -6,7 +6,7 @@ import { Elements, PaymentElement, useStripe, useElements } from "@stripe/react-
 import { Button } from "./ui/button";
 import { Card, CardContent, CardDescription, CardFooter, CardHeader, CardTitle } from "./ui/card";
 import { useToast } from "./ui/toast-context";
-import axios from "axios";
+import { inventoryApi, paymentApi } from "@/services/api";
 
 // Initialize Stripe promise
 const stripePromise = loadStripe("pk_test_51OXaMpLkjaNGkjsNGkjsNGkjsN");
@@ -24,32 +24,58 @@ export function StripeCheckout({ amount, items, onSuccess, onCancel }: CheckoutP
   const [clientSecret, setClientSecret] = useState("");
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  const [reservationId, setReservationId] = useState<string | null>(null);
 
   useEffect(() => {
-    // Create PaymentIntent as soon as the page loads
+    // Hold the items' stock, then create a PaymentIntent for the reservation
+    // as soon as the page loads. The amount is computed by the server.
+    let cancelled = false;
     const createPaymentIntent = async () => {
       try {
         setLoading(true);
-        const response = await axios.post("/api/payment/create-payment-intent", {
-          amount,
-          items
-        });
-        
-        setClientSecret(response.data.clientSecret);
+        const reservation = await inventoryApi.reserve(
+          items.map(item => ({ product_id: item.product_id, quantity: item.quantity, color: item.color }))
+        );
+        if (cancelled) {
+          inventoryApi.release(reservation.id).catch(() => {});
+          return;
+        }
+        setReservationId(reservation.id);
+        const response = await paymentApi.createPaymentIntent(reservation.id);
+        if (!cancelled) {
+          setClientSecret(response.clientSecret);
+        }
       } catch (err: any) {
-        setError(err.response?.data?.error || "Failed to initialize payment");
+        if (cancelled) return;
+        const message = err.response?.status === 409 && err.response?.data?.product_ids
+          ? "Some items in your cart are no longer in stock"
+          : err.response?.data?.error || err.response?.data?.message || "Failed to initialize payment";
+        setError(message);
         toast({
           title: "Error",
-          description: err.response?.data?.error || "Failed to initialize payment",
+          description: message,
           variant: "destructive"
         });
       } finally {
-        setLoading(false);
+        if (!cancelled) {
+          setLoading(false);
+        }
       }
     };
 
     createPaymentIntent();
-  }, [amount, items]);
+    return () => {
+      cancelled = true;
+    };
+  }, []);
+
+  // Leaving checkout gives the held units back
+  const handleCancel = () => {
+    if (reservationId) {
+      inventoryApi.release(reservationId).catch(() => {});
+    }
+    onCancel();
+  };
 
   const appearance = {
     theme: 'stripe' as const,
@@ -75,7 +101,7 @@ export function StripeCheckout({ amount, items, onSuccess, onCancel }: CheckoutP
     return (
       <div className="p-4 text-center">
         <p className="text-red-500 mb-4">{error}</p>
-        <Button onClick={onCancel}>Go Back</Button>
+        <Button onClick={handleCancel}>Go Back</Button>
       </div>
     );
   }
@@ -84,7 +110,7 @@ export function StripeCheckout({ amount, items, onSuccess, onCancel }: CheckoutP
     <div className="w-full">
       {clientSecret && (
         <Elements options={options} stripe={stripePromise}>
-          <CheckoutForm onSuccess={onSuccess} onCancel={onCancel} />
+          <CheckoutForm onSuccess={onSuccess} onCancel={handleCancel} />
         </Elements>
       )}
     </div>
@@ -1,29 +1,44 @@
 import { useState, useEffect } from "react";
-import { useAuth } from "../contexts/AuthContext";
-import axios from "axios";
+import { useNavigate } from "react-router-dom";
+import { wishlistApi } from "@/services/api";
 import { Button } from "./ui/button";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "./ui/card";
 import { useToast } from "./ui/toast-context";
 
+interface WishlistEntry {
+  id: string;
+  product_id: string;
+  added_at: string;
+  product: {
+    id: string;
+    name: string;
+    price: number;
+    discount_price?: number | null;
+    image: string;
+    rating: number;
+    rating_count: number;
+    in_stock: boolean;
+    stock_quantity?: number | null;
+  };
+}
+
 export function WishlistPage() {
-  const { user } = useAuth();
   const { toast } = useToast();
-  const [wishlistItems, setWishlistItems] = useState([]);
+  const navigate = useNavigate();
+  const [wishlistItems, setWishlistItems] = useState<WishlistEntry[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
     fetchWishlist();
   }, []);
 
-  const fetchWishlist = async () => {
+  // Each page already carries the product summaries, so no per-product requests
+  const fetchWishlist = async (cursor?: string) => {
     try {
-      const response = await axios.get(`${import.meta.env['VITE_API_URL']}/wishlist`, {
-        headers: {
-          Authorization: `Bearer ${localStorage.getItem("token")}`,
-        },
-      });
-      setWishlistItems(response.data);
-      setLoading(false);
+      const data = await wishlistApi.getWishlist(cursor ? { cursor } : {});
+      setWishlistItems(items => (cursor ? [...items, ...data.wishlist] : data.wishlist));
+      setNextCursor(data.next_cursor);
     } catch (error) {
       console.error("Error fetching wishlist:", error);
       toast({
@@ -31,18 +46,15 @@ export function WishlistPage() {
         description: "Failed to load wishlist items",
         variant: "destructive",
       });
+    } finally {
       setLoading(false);
     }
   };
 
   const removeFromWishlist = async (productId: string) => {
     try {
-      await axios.delete(`${import.meta.env['VITE_API_URL']}/wishlist/${productId}`, {
-        headers: {
-          Authorization: `Bearer ${localStorage.getItem("token")}`,
-        },
-      });
-      setWishlistItems(wishlistItems.filter((item: any) => item.productId !== productId));
+      await wishlistApi.removeItems([productId]);
+      setWishlistItems(wishlistItems.filter(item => item.product_id !== productId));
       toast({
         title: "Success",
         description: "Item removed from wishlist",
@@ -68,16 +80,33 @@ export function WishlistPage() {
         <p>Your wishlist is empty</p>
       ) : (
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
-          {wishlistItems.map((item: any) => (
-            <Card key={item.productId}>
+          {wishlistItems.map(item => (
+            <Card key={item.product_id}>
               <CardHeader>
+                <img
+                  src={item.product.image}
+                  alt={item.product.name}
+                  className="w-full h-48 object-contain mb-2 cursor-pointer"
+                  onClick={() => navigate(`/product/${item.product_id}`)}
+                />
                 <CardTitle>{item.product.name}</CardTitle>
-                <CardDescription>${item.product.price}</CardDescription>
+                <CardDescription>
+                  {item.product.discount_price != null ? (
+                    <>
+                      ${item.product.discount_price}{" "}
+                      <span className="line-through">${item.product.price}</span>
+                    </>
+                  ) : (
+                    <>${item.product.price}</>
+                  )}
+                  {" · "}
+                  {item.product.in_stock ? "In stock" : "Out of stock"}
+                </CardDescription>
               </CardHeader>
               <CardContent>
                 <Button
                   variant="destructive"
-                  onClick={() => removeFromWishlist(item.productId)}
+                  onClick={() => removeFromWishlist(item.product_id)}
                 >
                   Remove from Wishlist
                 </Button>
@@ -86,6 +115,13 @@ export function WishlistPage() {
           ))}
         </div>
       )}
+      {nextCursor && (
+        <div className="flex justify-center mt-6">
+          <Button variant="outline" onClick={() => fetchWishlist(nextCursor)}>
+            Load more
+          </Button>
+        </div>
+      )}
     </div>
   );
-} 
\ No newline at end of file
+}
@@ -1,5 +1,7 @@
 import * as React from "react";
 import { useState, useEffect, createContext, useContext } from "react";
+import { useAuth } from "./AuthContext";
+import { cartApi } from "../services/api";
 
 // Define cart item type
 export interface CartItem {
@@ -24,39 +26,82 @@ interface CartContextType {
 // Create cart context
 const CartContext = createContext<CartContextType | undefined>(undefined);
 
-// Cart provider component
+// Map the server cart (priced lines) to cart items
+const fromServerCart = (cart: any): CartItem[] =>
+  cart.items
+    .filter((line: any) => line.name !== undefined)
+    .map((line: any) => ({
+      id: line.product_id,
+      name: line.name,
+      price: line.unit_price,
+      image: line.image,
+      quantity: line.quantity
+    }));
+
+const logSyncError = (error: any) => {
+  console.error("Failed to update server cart:", error);
+};
+
+// Cart provider component. Logged out, the cart is kept in localStorage;
+// logged in, it lives on the server and the browser copy is merged into it.
 export const CartProvider: React.FC<{ children: React.ReactNode }> = ({ children }) => {
+  const { isAuthenticated } = useAuth();
   const [items, setItems] = useState<CartItem[]>([]);
   
-  // Load cart from localStorage on mount
+  // Load the server cart on login (merging the guest cart), or the
+  // localStorage cart when logged out
   useEffect(() => {
     const savedCart = localStorage.getItem('cart');
+    let localItems: CartItem[] = [];
     if (savedCart) {
       try {
-        setItems(JSON.parse(savedCart));
+        localItems = JSON.parse(savedCart);
       } catch (error) {
         console.error("Failed to parse cart from localStorage:", error);
         localStorage.removeItem('cart');
       }
     }
-  }, []);
+    
+    if (!isAuthenticated) {
+      setItems(localItems);
+      return;
+    }
+    
+    const load = localItems.length > 0
+      ? cartApi.mergeCart(localItems.map(item => ({ product_id: item.id, quantity: item.quantity })))
+      : cartApi.getCart();
+    load
+      .then(data => {
+        localStorage.removeItem('cart');
+        setItems(fromServerCart(data.cart));
+      })
+      .catch(error => {
+        console.error("Failed to load cart:", error);
+        setItems(localItems);
+      });
+  }, [isAuthenticated]);
   
-  // Save cart to localStorage whenever it changes
+  // Save the guest cart to localStorage whenever it changes
   useEffect(() => {
-    localStorage.setItem('cart', JSON.stringify(items));
-  }, [items]);
+    if (!isAuthenticated) {
+      localStorage.setItem('cart', JSON.stringify(items));
+    }
+  }, [items, isAuthenticated]);
   
   // Add item to cart
   const addItem = (item: CartItem) => {
+    if (isAuthenticated) {
+      cartApi.addItem(item.id, item.quantity).catch(logSyncError);
+    }
     setItems(currentItems => {
       // Check if item already exists in cart
       const existingItemIndex = currentItems.findIndex(i => i.id === item.id);
       
       if (existingItemIndex > -1) {
         // Update quantity if item exists
-        const updatedItems = [...currentItems];
-        updatedItems[existingItemIndex].quantity += item.quantity;
-        return updatedItems;
+        return currentItems.map((i, index) =>
+          index === existingItemIndex ? { ...i, quantity: i.quantity + item.quantity } : i
+        );
       } else {
         // Add new item if it doesn't exist
         return [...currentItems, item];
@@ -66,6 +111,9 @@ export const CartProvider: React.FC<{ children: React.ReactNode }> = ({ children
   
   // Remove item from cart
   const removeItem = (itemId: string) => {
+    if (isAuthenticated) {
+      cartApi.removeItem(itemId).catch(logSyncError);
+    }
     setItems(currentItems => currentItems.filter(item => item.id !== itemId));
   };
   
@@ -76,6 +124,9 @@ export const CartProvider: React.FC<{ children: React.ReactNode }> = ({ children
       return;
     }
     
+    if (isAuthenticated) {
+      cartApi.updateItem(itemId, quantity).catch(logSyncError);
+    }
     setItems(currentItems => 
       currentItems.map(item => 
         item.id === itemId ? { ...item, quantity } : item
@@ -85,6 +136,9 @@ export const CartProvider: React.FC<{ children: React.ReactNode }> = ({ children
   
   // Clear cart
   const clearCart = () => {
+    if (isAuthenticated) {
+      cartApi.clearCart().catch(logSyncError);
+    }
     setItems([]);
   };
   
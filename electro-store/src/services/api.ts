@@ -29,6 +29,10 @@ export const productApi = {
     const response = await api.get('/products', { params });
     return response.data;
   },
+  searchProducts: async (q: string, params = {}) => {
+    const response = await api.get('/products/search', { params: { q, ...params } });
+    return response.data;
+  },
   getProductById: async (id) => {
     const response = await api.get(`/products/${id}`);
     return response.data;
@@ -37,6 +41,97 @@ export const productApi = {
     const response = await api.get('/categories');
     return response.data;
   },
+  // Several products in one request: { products: { [id]: product }, missing: [ids] }
+  getProductsBatch: async (ids: string[], fields?: string[]) => {
+    const response = await api.post('/products/batch', { ids, fields });
+    return response.data;
+  },
+};
+
+// Cart API (server-side cart of the logged-in user)
+export const cartApi = {
+  getCart: async () => {
+    const response = await api.get('/cart/');
+    return response.data;
+  },
+  addItem: async (productId: string, quantity: number, color?: string) => {
+    const response = await api.post('/cart/items', { product_id: productId, quantity, color });
+    return response.data;
+  },
+  updateItem: async (productId: string, quantity: number, color?: string) => {
+    const response = await api.put('/cart/items', { product_id: productId, quantity, color });
+    return response.data;
+  },
+  removeItem: async (productId: string, color?: string) => {
+    const response = await api.delete(`/cart/items/${productId}`, { params: color ? { color } : {} });
+    return response.data;
+  },
+  clearCart: async () => {
+    const response = await api.delete('/cart/');
+    return response.data;
+  },
+  // Merge the cart kept in the browser while logged out
+  mergeCart: async (items: { product_id: string; quantity: number; color?: string }[]) => {
+    const response = await api.post('/cart/merge', { items });
+    return response.data;
+  },
+};
+
+// Live stock per product and color variant
+export interface Availability {
+  product_id: string;
+  in_stock: boolean;
+  stock_quantity: number | null;
+  variants: { color: string; in_stock: boolean; stock_quantity: number | null }[];
+}
+
+// Inventory API: availability and the stock held while a checkout is paid
+export const inventoryApi = {
+  // At most 100 products per request; unknown ids are left out
+  getAvailability: async (productIds: string[]) => {
+    const response = await api.get('/inventory/availability', { params: { product_ids: productIds.join(',') } });
+    return response.data.availability as Availability[];
+  },
+  // Holds the units for a few minutes; replaces the user's previous reservation
+  reserve: async (items: { product_id: string; quantity: number; color?: string }[]) => {
+    const response = await api.post('/inventory/reservations', { items });
+    return response.data.reservation;
+  },
+  release: async (reservationId: string) => {
+    const response = await api.delete(`/inventory/reservations/${reservationId}`);
+    return response.data;
+  },
+};
+
+// Payment API
+export const paymentApi = {
+  // Charges the reservation's units, priced by the server
+  createPaymentIntent: async (reservationId: string) => {
+    const response = await api.post('/payment/create-payment-intent', { reservation_id: reservationId });
+    return response.data;
+  },
+};
+
+// Wishlist API
+export const wishlistApi = {
+  // Entries with an embedded product summary, newest first
+  getWishlist: async (params: { limit?: number; cursor?: string } = {}) => {
+    const response = await api.get('/orders/wishlist', { params });
+    return response.data;
+  },
+  addItems: async (productIds: string[]) => {
+    const response = await api.post('/orders/wishlist', { product_ids: productIds });
+    return response.data;
+  },
+  removeItems: async (productIds: string[]) => {
+    const response = await api.delete('/orders/wishlist', { params: { product_ids: productIds.join(',') } });
+    return response.data;
+  },
+  // Which of the given products are in the wishlist
+  contains: async (productIds: string[]) => {
+    const response = await api.get('/orders/wishlist/contains', { params: { product_ids: productIds.join(',') } });
+    return response.data.product_ids as string[];
+  },
 };
 
 // Admin API
@@ -88,6 +183,12 @@ export const adminApi = {
     const response = await api.delete(`/admin/categories/${categoryId}`);
     return response.data;
   },
+
+  // Get pre-aggregated dashboard analytics for the last `days` days
+  getAnalytics: async (days = 7) => {
+    const response = await api.get('/admin/analytics', { params: { days } });
+    return response.data;
+  },
 };
 
 export default api;
\ No newline at end of file